@@ -0,0 +1,261 @@
+import copy
+import math
+import pickle
+import h3
+from data_structures import *
+from attribute_structures import *
+from tqdm import tqdm
+from pp_enum import *
+
+# 合并时按位置聚合的数值型属性
+NUMERIC_ATTRIBUTES = (ElevationCoefficientOfVariation, Relief, Roughness, Curvature, Exposure)
+# 数值型属性的量化步长，落在同一区间的cell才视为均质
+NUMERIC_STEPS = {
+    ElevationCoefficientOfVariation: 0.02,
+    Relief: 1.0,            # m
+    Roughness: 0.5,         # m
+    Curvature: 0.01,
+    Exposure: 45.0,         # 度，8个方位
+}
+
+class AdaptiveMap:
+    """
+    自适应混合分辨率地图
+    障碍物、道路与高起伏地形附近保留细分辨率cell，均质区域逐级合并为粗分辨率的父cell
+    """
+
+    def get_attribute_value(cell, target_class):
+        """
+        获取cell中某类属性的值
+        :param cell: Cell对象
+        :param target_class: 属性类
+        :return: 属性值，不存在时返回None
+        """
+        for attribute in cell.attribute:
+            if isinstance(attribute, target_class):
+                return attribute.value
+        return None
+
+    def cell_signature(cell, steps=NUMERIC_STEPS):
+        """
+        cell的均质性签名，签名相同的cell才能合并
+        地表覆盖类别须完全相同，数值型属性按量化步长分区间，须落在同一区间
+        :param cell: Cell对象
+        :param steps: 数值型属性类 -> 量化步长，不在其中的数值型属性不参与比较
+        :return: tuple
+        """
+        landcover = tuple(sorted(type(attribute).__name__ for attribute in cell.attribute
+                                 if not isinstance(attribute, NUMERIC_ATTRIBUTES)))
+        numeric = tuple(None if attribute.value is None else math.floor(attribute.value / steps[type(attribute)])
+                        for attribute in cell.attribute
+                        if isinstance(attribute, NUMERIC_ATTRIBUTES) and type(attribute) in steps)
+        return (cell.show_attribute, landcover, len(cell.attribute), numeric)
+
+    def is_key_cell(cell, map, relief_threshold):
+        """
+        判断cell是否必须保留细分辨率：道路cell、高起伏地形cell
+        :param cell: Cell对象
+        :param map: 地图对象
+        :param relief_threshold: 地形起伏度阈值(m)
+        :return: bool
+        """
+        if cell.road_type != RoadType.NOWAY.value:
+            return True
+        relief = AdaptiveMap.get_attribute_value(cell, Relief)
+        if relief is None:
+            # 未量化起伏度时用邻域高程差代替
+            elevations = [cell.elevation] if cell.elevation is not None else []
+            for neighbor_index in cell.neighbors:
+                neighbor_cell = map.cells.get(neighbor_index)
+                if neighbor_cell and neighbor_cell.elevation is not None:
+                    elevations.append(neighbor_cell.elevation)
+            relief = max(elevations) - min(elevations) if len(elevations) >= 2 else 0
+        return relief > relief_threshold
+
+    def find_fixed_cells(map, relief_threshold, buffer, steps=NUMERIC_STEPS):
+        """
+        找出所有必须保留细分辨率的cell索引
+        关键cell以及位于不同签名边界(含障碍物边缘)buffer环以内的cell都不参与合并
+        :param map: 地图对象
+        :param relief_threshold: 地形起伏度阈值(m)
+        :param buffer: 缓冲环数
+        :param steps: 数值型属性的量化步长
+        :return: set 索引集合
+        """
+        seeds = set()
+        for cell in tqdm(map.cells.values(), desc="标记关键cell: "):
+            if AdaptiveMap.is_key_cell(cell, map, relief_threshold):
+                seeds.add(cell.h3_index)
+                continue
+            signature = AdaptiveMap.cell_signature(cell, steps)
+            for neighbor_index in cell.neighbors:
+                neighbor_cell = map.cells.get(neighbor_index)
+                if neighbor_cell is None or AdaptiveMap.cell_signature(neighbor_cell, steps) != signature:
+                    seeds.add(cell.h3_index)    # 地图边界或属性边界
+                    break
+        fixed = set()
+        for index in seeds:
+            fixed.update(h3.k_ring(index, buffer))
+        return fixed
+
+    def merge_cells(parent_index, children):
+        """
+        将一组同签名的子cell合并为父cell
+        :param parent_index: 父cell索引
+        :param children: 子Cell对象列表
+        :return: 父Cell对象
+        """
+        parent = Cell(parent_index)
+        elevations = [child.elevation for child in children if child.elevation is not None]
+        slopes = [child.slope for child in children if child.slope is not None]
+        parent.elevation = sum(elevations) / len(elevations) if elevations else None
+        parent.slope = max(slopes) if slopes else None
+        for child in children:
+            for terrain, count in child.terrain.items():
+                parent.terrain[terrain] = parent.terrain.get(terrain, 0) + count
+        # 属性在Cell.attribute中的位置与map.attributes记录的位置对应，按位置聚合
+        for i, attribute in enumerate(children[0].attribute):
+            if isinstance(attribute, NUMERIC_ATTRIBUTES):
+                values = [child.attribute[i].value for child in children if child.attribute[i].value is not None]
+                if not values:
+                    value = None
+                elif isinstance(attribute, Relief):
+                    value = max(values)
+                else:
+                    value = sum(values) / len(values)
+                parent.attribute.append(type(attribute)(value))
+            else:
+                parent.attribute.append(attribute)
+        parent.road_type = children[0].road_type
+        parent.show_attribute = children[0].show_attribute
+        return parent
+
+    def find_representative(h3_index, cells, min_resolution):
+        """
+        找到细分辨率索引在混合分辨率地图中所属的cell
+        :param h3_index: 细分辨率h3索引
+        :param cells: 混合分辨率地图的cell字典
+        :param min_resolution: 最粗分辨率
+        :return: 所属cell的索引，不在地图中返回None
+        """
+        resolution = h3.h3_get_resolution(h3_index)
+        for res in range(resolution, min_resolution - 1, -1):
+            index = h3_index if res == resolution else h3.h3_to_parent(h3_index, res)
+            if index in cells:
+                return index
+        return None
+
+    def init_neighbors(adaptive_map, base_resolution, min_resolution):
+        """
+        初始化跨分辨率的邻接关系
+        一个cell的邻居是与它的任一基础分辨率子cell相邻的基础分辨率cell所属的cell
+        :param adaptive_map: 混合分辨率地图对象
+        :param base_resolution: 基础(最细)分辨率
+        :param min_resolution: 最粗分辨率
+        :return: None
+        """
+        cells = adaptive_map.cells
+        for cell in tqdm(cells.values(), desc="构建跨分辨率邻接: "):
+            resolution = h3.h3_get_resolution(cell.h3_index)
+            if resolution == base_resolution:
+                children = [cell.h3_index]
+            else:
+                children = h3.h3_to_children(cell.h3_index, base_resolution)
+            neighbors = set()
+            for child in children:
+                for index in h3.k_ring(child, 1):
+                    if resolution < base_resolution and h3.h3_to_parent(index, resolution) == cell.h3_index:
+                        continue    # 同一个父cell内部
+                    representative = AdaptiveMap.find_representative(index, cells, min_resolution)
+                    if representative is not None:
+                        neighbors.add(representative)
+            neighbors.discard(cell.h3_index)
+            cell.neighbors = list(neighbors)
+
+    def build_adaptive_map(map, min_resolution=None, relief_threshold=5.0, buffer=2, steps=NUMERIC_STEPS):
+        """
+        由均匀分辨率地图构建自适应混合分辨率地图
+        :param map: 均匀分辨率地图对象
+        :param min_resolution: 最粗分辨率，默认比基础分辨率粗3级
+        :param relief_threshold: 地形起伏度阈值(m)，超过阈值的cell保留细分辨率
+        :param buffer: 障碍物、属性边界与关键cell周围保留细分辨率的环数
+        :param steps: 数值型属性的量化步长，见NUMERIC_STEPS
+        :return: 混合分辨率地图对象
+        """
+        base_resolution = h3.h3_get_resolution(next(iter(map.cells)))
+        if min_resolution is None:
+            min_resolution = max(base_resolution - 3, 0)
+        fixed = AdaptiveMap.find_fixed_cells(map, relief_threshold, buffer, steps)
+
+        # 当前层可参与合并的cell，键为索引，值为Cell对象
+        level = {index: cell for index, cell in map.cells.items() if index not in fixed}
+        result = {index: map.cells[index] for index in fixed if index in map.cells}
+        for resolution in range(base_resolution - 1, min_resolution - 1, -1):
+            groups = {}
+            for index in level:
+                groups.setdefault(h3.h3_to_parent(index, resolution), []).append(index)
+            next_level = {}
+            for parent_index, indexes in tqdm(groups.items(), desc=f"合并至分辨率{resolution}: "):
+                children = [level[index] for index in indexes]
+                signature = AdaptiveMap.cell_signature(children[0], steps)
+                if len(indexes) == 7 and all(AdaptiveMap.cell_signature(child, steps) == signature for child in children):
+                    next_level[parent_index] = AdaptiveMap.merge_cells(parent_index, children)
+                else:
+                    for child in children:
+                        result[child.h3_index] = child
+            level = next_level
+        result.update(level)
+
+        adaptive_map = Map()
+        adaptive_map.map_range = map.map_range
+        adaptive_map.attributes = dict(map.attributes)
+        for cell in result.values():
+            if h3.h3_get_resolution(cell.h3_index) == base_resolution:
+                # 保留的细cell来自原地图，复制一份避免改写原地图的邻接关系
+                cell = copy.copy(cell)
+                cell.attribute = list(cell.attribute)
+                cell.terrain = dict(cell.terrain)
+            adaptive_map.add_cell(cell)
+        AdaptiveMap.init_neighbors(adaptive_map, base_resolution, min_resolution)
+        print(f"自适应地图节点数: {len(map.cells)} -> {len(adaptive_map.cells)}")
+        return adaptive_map
+
+    def path_length(path):
+        """
+        路径长度(km)，相邻cell格心距离之和
+        :param path: pp()返回的路径对象
+        :return: float
+        """
+        cells = list(path.cells.values())
+        return sum(h3.point_dist(cells[i].center, cells[i + 1].center) for i in range(len(cells) - 1))
+
+    def compare_path_quality(map, adaptive_map, pairs):
+        """
+        比较自适应地图与原地图的路径质量
+        :param map: 均匀分辨率地图对象
+        :param adaptive_map: build_adaptive_map的结果
+        :param pairs: [(起点坐标, 终点坐标), ...]
+        :return: [(原地图路径长度, 自适应地图路径长度, 长度比), ...]，长度单位km，路径不通时长度为inf
+        """
+        from pp import pp
+        results = []
+        for start, end in pairs:
+            lengths = []
+            for m in (map, adaptive_map):
+                try:
+                    lengths.append(AdaptiveMap.path_length(pp(m, start, end)))
+                except ValueError:
+                    lengths.append(float("inf"))    # 不可达
+            results.append((lengths[0], lengths[1], lengths[1] / lengths[0] if lengths[0] > 0 else float("inf")))
+        print(f"节点数: {len(map.cells)} -> {len(adaptive_map.cells)}")
+        for fine, adaptive, ratio in results:
+            print(f"路径长度: {fine:.3f}km -> {adaptive:.3f}km, 比值 {ratio:.3f}")
+        return results
+
+if __name__ == '__main__':
+    with open('output/汤山/汤山map.bin', 'rb') as f:
+        map = pickle.load(f)
+    adaptive_map = AdaptiveMap.build_adaptive_map(map, relief_threshold=5.0, buffer=2)
+    AdaptiveMap.compare_path_quality(map, adaptive_map, [((31.989187, 118.990892), (31.996765, 118.982489))])
+    with open('output/汤山/汤山adaptive_map.bin', 'wb') as f:
+        pickle.dump(adaptive_map, f)
@@ -0,0 +1,117 @@
+import pickle
+import multiprocessing
+import numpy as np
+from compiled_map import CompiledMap
+from graph_search import GraphSearch
+
+_graph = None       # 工作进程中以内存映射方式打开的CompiledMap
+
+def _init_worker(directory):
+    global _graph
+    _graph = CompiledMap.load(directory, mmap=True)
+
+def _route_chunk(chunk):
+    """
+    工作进程：依次规划一批OD对
+    :param chunk: (起始序号, N×2 OD数组, 是否只返回代价)
+    :return: [(序号, 代价, 节点编号数组或None), ...]
+    """
+    offset, pairs, costs_only = chunk
+    results = []
+    for i, (source, target) in enumerate(pairs.tolist()):
+        cost, path = GraphSearch.astar(_graph, source, target)
+        results.append((offset + i, cost, None if costs_only else np.array(path, dtype=np.int32)))
+    return results
+
+def _matrix_rows(chunk):
+    """
+    工作进程：计算代价矩阵的若干行
+    :param chunk: (起始行号, 起点数组, 终点数组, 代价上界)
+    :return: (起始行号, float32矩阵)
+    """
+    offset, sources, targets, max_cost = chunk
+    return offset, GraphSearch.many_to_many(_graph, sources.tolist(), targets.tolist(), max_cost)
+
+class BatchRouter:
+    """
+    批量路径规划
+    CompiledMap以.npy目录形式(CompiledMap.save)共享给进程池，各工作进程以只读内存映射打开，
+    不再各自反序列化地图文件；OD对按块分发，结果按输入顺序或完成顺序流式返回
+    """
+    def __init__(self, directory, processes=None):
+        """
+        :param directory: CompiledMap.save保存的目录
+        :param processes: 进程数，None表示CPU核数
+        """
+        self.directory = directory
+        self.pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=(directory,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def route(self, od_pairs, ordered=True, costs_only=False, chunksize=64):
+        """
+        批量规划
+        :param od_pairs: N×2 节点编号数组 (起点, 终点)
+        :param ordered: True按输入顺序返回，False按完成顺序返回
+        :param costs_only: 只返回代价，不回传路径
+        :param chunksize: 每个任务包含的OD对数
+        :return: 生成器，产出 (序号, 代价, 节点编号数组)，costs_only时路径为None，不可达时代价为inf
+        """
+        od_pairs = np.asarray(od_pairs, dtype=np.int64).reshape(-1, 2)
+        chunks = [(start, od_pairs[start:start + chunksize], costs_only)
+                  for start in range(0, len(od_pairs), chunksize)]
+        imap = self.pool.imap if ordered else self.pool.imap_unordered
+        for results in imap(_route_chunk, chunks):
+            yield from results
+
+    def costs(self, od_pairs, chunksize=64):
+        """
+        批量计算代价
+        :param od_pairs: N×2 节点编号数组
+        :return: 长度为N的代价数组
+        """
+        od_pairs = np.asarray(od_pairs, dtype=np.int64).reshape(-1, 2)
+        costs = np.full(len(od_pairs), np.inf)
+        for i, cost, _ in self.route(od_pairs, ordered=False, costs_only=True, chunksize=chunksize):
+            costs[i] = cost
+        return costs
+
+    def cost_matrix(self, sources, targets, max_cost=None, chunksize=8):
+        """
+        多对多代价矩阵，按起点分块并行
+        :param sources: 起点节点编号数组，长度N
+        :param targets: 终点节点编号数组，长度M
+        :param max_cost: 代价上界，超过上界视为不可达
+        :param chunksize: 每个任务包含的起点数
+        :return: N×M 的float32矩阵，不可达为inf
+        """
+        sources = np.asarray(sources, dtype=np.int64).ravel()
+        targets = np.asarray(targets, dtype=np.int64).ravel()
+        matrix = np.full((len(sources), len(targets)), np.inf, dtype=np.float32)
+        chunks = [(start, sources[start:start + chunksize], targets, max_cost)
+                  for start in range(0, len(sources), chunksize)]
+        for offset, rows in self.pool.imap_unordered(_matrix_rows, chunks):
+            matrix[offset:offset + len(rows)] = rows
+        return matrix
+
+if __name__ == '__main__':
+    from tqdm import tqdm
+    with open('output/汤山/汤山map.bin', 'rb') as f:
+        map = pickle.load(f)
+    CompiledMap.compile(map).save('output/汤山/汤山compiled')
+    graph = CompiledMap.load('output/汤山/汤山compiled')
+    rng = np.random.default_rng(0)
+    od_pairs = rng.integers(0, len(graph), size=(100000, 2))
+    with BatchRouter('output/汤山/汤山compiled') as router:
+        costs = np.full(len(od_pairs), np.inf)
+        for i, cost, _ in tqdm(router.route(od_pairs, ordered=False, costs_only=True), total=len(od_pairs), desc="批量规划: "):
+            costs[i] = cost
+    np.save('output/汤山/批量代价.npy', costs)
@@ -0,0 +1,434 @@
+import os
+import itertools
+import pickle
+import h3
+import numpy as np
+from data_structures import *
+from attribute_structures import *
+from pp_strategy import CostStrategy
+from cost_profile import CostProfile, PROFILES
+from layer_index import LayerIndex
+from pp_enum import *
+
+# 数值型属性层：层名 -> 属性类
+NUMERIC_LAYERS = {
+    "cv": ElevationCoefficientOfVariation,
+    "relief": Relief,
+    "roughness": Roughness,
+    "curvature": Curvature,
+    "exposure": Exposure,
+}
+
+# 地表覆盖属性类 -> 属性索引，地表覆盖层按位存储
+LANDCOVER_CLASSES = {
+    Water: AttributeIndex.WATER.value,
+    Forest: AttributeIndex.FOREST.value,
+    Grass: AttributeIndex.GRASS.value,
+    Plowland: AttributeIndex.PLOWLAND.value,
+    ShrubWood: AttributeIndex.SHRUBWOOD.value,
+    Building: AttributeIndex.BUILDING.value,
+    Wasteland: AttributeIndex.WASTELAND.value,
+}
+
+class ArrayAdjacency:
+    """
+    直接读取 N×K 邻接数组的邻接表视图，某一行在访问时才转为 [(邻居节点编号, 代价), ...]
+    用于以内存映射方式打开的CompiledMap：各进程共享同一份数组，不再各自生成 O(N·K) 个Python对象
+    反向图按入边终点排序存为CSR数组，仍是numpy数组而不是Python对象
+    """
+    def __init__(self, neighbors, edge_cost, reverse=False):
+        """
+        :param neighbors: N×K 邻居节点编号，-1为空位
+        :param edge_cost: N×K 有向边代价，inf为不可通行
+        :param reverse: 是否为反向图
+        """
+        self.neighbors = neighbors
+        self.edge_cost = edge_cost
+        self.reverse = reverse
+        if reverse:
+            n = len(neighbors)
+            sources, slots = np.nonzero((np.asarray(neighbors) >= 0) & np.isfinite(edge_cost))
+            targets = np.asarray(neighbors)[sources, slots]
+            order = np.argsort(targets, kind="stable")
+            self.sources = sources[order].astype(np.int32)
+            self.costs = np.asarray(edge_cost)[sources, slots][order]
+            indptr = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(np.bincount(targets, minlength=n), out=indptr[1:])
+            self.indptr = memoryview(indptr)    # 逐元素读取memoryview比numpy标量快
+
+    def __len__(self):
+        return len(self.neighbors)
+
+    def __getitem__(self, i):
+        if self.reverse:
+            start, end = self.indptr[i], self.indptr[i + 1]
+            return list(zip(self.sources[start:end].tolist(), self.costs[start:end].tolist()))
+        return [(j, cost) for j, cost in zip(self.neighbors[i].tolist(), self.edge_cost[i].tolist())
+                if j >= 0 and cost != float("inf")]
+
+# 地图版本号，进程内全局递增，属性或边代价规则每次变化都取一个新值，与代价配置一起可直接作为缓存键
+_versions = itertools.count(1)
+
+class CompiledMap:
+    """
+    编译后的地图
+    cell按节点编号(0..N-1)存储，属性存为列式数组，邻接关系与有向边代价存为 N×K 的定长表(空位为-1)
+    """
+    def __init__(self):
+        self.h3_indexes = []        # 节点编号 -> h3索引
+        self.node_ids = {}          # h3索引 -> 节点编号
+        self.centers = None         # N×2 格心坐标 (lat, lon)
+        self.neighbors = None       # N×K 邻居节点编号，-1为空位
+        self.edge_cost = None       # N×K 有向边代价，inf为不可通行
+        self.grade = None           # N×K 有向坡度比(高差/水平距离，上坡为正)，高程未知为0
+        self.layers = {}            # 列式属性层，层名 -> 长度为N的数组
+        self.landmarks = None       # Landmarks对象，存在时A*自动使用地标启发值
+        self.index = None           # 属性索引(LayerIndex对象)，存在时随update_cells更新
+        self._adjacency = {}        # 邻接表缓存，键为是否反向
+        self.shared = False         # 数组是否为多进程共享的只读内存映射，此时邻接表直接读取数组
+        self.version = next(_versions)  # 地图版本号，属性或边代价变化后递增，切换代价配置不改变版本号
+        self.map_version = None     # 对应地图对象的版本号(Map.version)，随update_cells同步
+        self.profile = "default"    # 边代价所用的代价配置名称
+        self.cost_profile = None    # 边代价所用的CostProfile，None表示按CostStrategy逐边计算
+        self.heuristic_scale = 1.0  # 格心距离启发值的系数，代价配置中有小于1的倍率时缩小以保持可采纳
+        self._profile_cache = {}    # 代价配置编译缓存，(地图版本, 配置摘要) -> 编译结果
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_adjacency"] = {}    # 缓存不参与序列化
+        state["_profile_cache"] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.profile = state.get("profile", "default")
+        self.cost_profile = state.get("cost_profile")
+        if "_index_path" not in state:
+            self.index = state.get("index")
+        if state.get("grade") is None:
+            self.update_grade()
+        self.heuristic_scale = state.get("heuristic_scale", 1.0)
+        self.map_version = state.get("map_version")
+        self.shared = state.get("shared", False)
+        self._profile_cache = {}
+        self.version = next(_versions)  # 反序列化后的版本号在本进程内重新分配
+
+    def __getattr__(self, name):
+        # CompiledMap.load打开的地图在首次访问时才生成h3索引表、反查字典与属性索引，只做搜索的工作进程不必构建
+        if name in ("h3_indexes", "node_ids") and self.__dict__.get("_h3_ints") is not None:
+            self.h3_indexes = [h3.h3_to_string(index) for index in self._h3_ints.tolist()]
+            self.node_ids = {index: i for i, index in enumerate(self.h3_indexes)}
+            return self.__dict__[name]
+        if name == "index" and "_index_path" in self.__dict__:
+            path = self.__dict__.pop("_index_path")
+            self.index = LayerIndex.load(path) if os.path.exists(path) else None
+            return self.index
+        raise AttributeError(name)
+
+    def __len__(self):
+        return len(self.neighbors) if self.neighbors is not None else len(self.h3_indexes)
+
+    def h3_ints(self):
+        """
+        节点编号 -> h3索引(整数形式)
+        :return: uint64数组
+        """
+        if self.__dict__.get("_h3_ints") is not None:
+            return self._h3_ints
+        return np.array([h3.string_to_h3(index) for index in self.h3_indexes], dtype=np.uint64)
+
+    def compile(map):
+        """
+        编译地图对象
+        :param map: 地图对象
+        :return: CompiledMap对象
+        """
+        from tqdm import tqdm
+
+        graph = CompiledMap()
+        graph.h3_indexes = list(map.cells.keys())
+        graph.node_ids = {index: i for i, index in enumerate(graph.h3_indexes)}
+        graph.map_version = getattr(map, "version", None)
+        n = len(graph.h3_indexes)
+        max_degree = max((len(cell.neighbors) for cell in map.cells.values()), default=6)
+        max_degree = max(max_degree, 6)     # 混合分辨率地图的粗cell邻居数会超过6
+
+        graph.centers = np.empty((n, 2), dtype=np.float64)
+        graph.neighbors = np.full((n, max_degree), -1, dtype=np.int32)
+        graph.edge_cost = np.full((n, max_degree), np.inf, dtype=np.float64)
+        graph.layers = {
+            "elevation": np.full(n, np.nan, dtype=np.float64),
+            "slope": np.full(n, np.nan, dtype=np.float64),
+            "road_type": np.zeros(n, dtype=np.int8),
+            "show_attribute": np.full(n, -1, dtype=np.int16),
+            "landcover": np.zeros(n, dtype=np.int32),
+        }
+        for name in NUMERIC_LAYERS:
+            graph.layers[name] = np.full(n, np.nan, dtype=np.float64)
+
+        for i, cell in enumerate(tqdm(map.cells.values(), desc="编译地图: ")):
+            graph.centers[i] = cell.center
+            k = 0
+            for neighbor_index in cell.neighbors:
+                j = graph.node_ids.get(neighbor_index)
+                if j is None:
+                    continue
+                graph.neighbors[i, k] = j
+                k += 1
+            graph.read_cell(i, cell)
+        graph.update_grade()
+        graph.update_edge_cost(map, range(n))
+        return graph
+
+    def read_cell(self, i, cell):
+        """
+        将cell的属性写入列式属性层
+        :param i: 节点编号
+        :param cell: Cell对象
+        :return: None
+        """
+        self.layers["elevation"][i] = np.nan if cell.elevation is None else cell.elevation
+        self.layers["slope"][i] = np.nan if cell.slope is None else cell.slope
+        self.layers["road_type"][i] = cell.road_type
+        self.layers["show_attribute"][i] = -1 if cell.show_attribute is None else cell.show_attribute
+        landcover = 0
+        for attribute in cell.attribute:
+            for attribute_class, attribute_index in LANDCOVER_CLASSES.items():
+                if isinstance(attribute, attribute_class):
+                    landcover |= 1 << attribute_index
+            for name, attribute_class in NUMERIC_LAYERS.items():
+                if isinstance(attribute, attribute_class):
+                    self.layers[name][i] = np.nan if attribute.value is None else attribute.value
+        self.layers["landcover"][i] = landcover
+
+    def update_grade(self):
+        """
+        由高程层与格心距离向量化计算 N×K 有向坡度比，搜索时每条边只需读取一个值
+        :return: None
+        """
+        neighbors = np.asarray(self.neighbors)
+        valid = neighbors >= 0
+        elevation = np.asarray(self.layers["elevation"])
+        rise = elevation[np.where(valid, neighbors, 0)] - elevation[:, None]
+        with np.errstate(invalid='ignore'):
+            grade = rise / (CostProfile.edge_distance(self) * 1000.0)
+        grade[~valid | np.isnan(grade)] = 0.0
+        self.grade = grade
+
+    def update_edge_cost(self, map, nodes):
+        """
+        重新计算指定节点的出边代价，代价规则与pp()相同
+        边代价变化后地标表不再是代价下界，一并丢弃
+        :param map: 地图对象
+        :param nodes: 节点编号的可迭代对象
+        :return: None
+        """
+        self.landmarks = None
+        nodes = list(nodes)
+        if self.cost_profile is not None:
+            # 已切换为代价配置：逐节点倍率向量化重算，边代价只重算这些节点的出边
+            self.version = next(_versions)
+            _, self.edge_cost, self.heuristic_scale = self.cost_profile.recompile(self, self.edge_cost, nodes)
+            self.patch_adjacency(nodes)
+            return
+        for i in nodes:
+            current_cell = map.cells[self.h3_indexes[i]]
+            for k, j in enumerate(self.neighbors[i]):
+                if j < 0:
+                    break
+                cost = CostStrategy.edge_cost(current_cell, map.cells[self.h3_indexes[j]], map)
+                self.edge_cost[i, k] = np.inf if cost is None else cost
+        self.patch_adjacency(nodes)
+        self.version = next(_versions)
+
+    def apply_profile(self, profile):
+        """
+        切换代价配置，边代价由配置对属性层一次向量化编译得到，同一地图版本下再次切换回来直接使用缓存
+        :param profile: CostProfile对象，或cost_profile.PROFILES中的名称("default"、"wheeled"、"tracked"、"foot")
+        :return: self
+        """
+        if isinstance(profile, str):
+            profile = PROFILES[profile]
+        _, edge_cost, heuristic_scale = profile.compile(self)
+        if profile.key() != self.profile:
+            self.landmarks = None   # 地标表按原代价计算，换配置后不再是代价下界
+        self.edge_cost = edge_cost
+        self.heuristic_scale = heuristic_scale
+        self.cost_profile = profile
+        self.profile = profile.key()
+        self._adjacency = {}
+        return self
+
+    def update_cells(self, map, h3_indexes):
+        """
+        地图中部分cell的属性发生变化后，增量更新属性层与受影响的边代价
+        :param map: 地图对象
+        :param h3_indexes: 发生变化的cell索引
+        :return: 受影响的节点编号集合
+        """
+        changed = {self.node_ids[index] for index in h3_indexes if index in self.node_ids}
+        affected = set(changed)
+        for i in changed:
+            self.read_cell(i, map.cells[self.h3_indexes[i]])
+            affected.update(int(j) for j in self.neighbors[i] if j >= 0)    # 指向变化cell的入边
+        self.update_grade()
+        self.update_edge_cost(map, affected)
+        map.touch()
+        self.map_version = map.version
+        if self.index is not None:
+            self.index = LayerIndex.build(self)
+        return affected
+
+    def adjacency(self, reverse=False):
+        """
+        获取邻接表，供搜索循环使用
+        以内存映射方式打开时返回直接读取共享数组的ArrayAdjacency，不在每个进程中生成整张邻接表
+        :param reverse: 是否为反向图(边 v->u 的代价为原图 u->v 的代价)
+        :return: list或ArrayAdjacency，第i项为 [(邻居节点编号, 代价), ...]
+        """
+        if reverse not in self._adjacency and self.shared:
+            self._adjacency[reverse] = ArrayAdjacency(self.neighbors, self.edge_cost, reverse)
+        if reverse not in self._adjacency:
+            n = len(self.neighbors)
+            adjacency = [[] for _ in range(n)]
+            neighbors = self.neighbors.tolist()
+            edge_cost = self.edge_cost.tolist()
+            for i in range(n):
+                for j, cost in zip(neighbors[i], edge_cost[i]):
+                    if j < 0:
+                        break
+                    if cost == float("inf"):
+                        continue
+                    if reverse:
+                        adjacency[j].append((i, cost))
+                    else:
+                        adjacency[i].append((j, cost))
+            self._adjacency[reverse] = adjacency
+        return self._adjacency[reverse]
+
+    def patch_adjacency(self, nodes):
+        """
+        出边代价变化后只修补已缓存邻接表中受影响的行：正向表重建这些节点的行，
+        反向表中这些节点作为入边起点的项先删除再按新代价加入
+        :param nodes: 出边代价发生变化的节点编号列表
+        :return: None
+        """
+        for reverse, adjacency in list(self._adjacency.items()):
+            if isinstance(adjacency, ArrayAdjacency):
+                del self._adjacency[reverse]    # 直接读取数组，下次访问时重新生成视图即可
+        if not self._adjacency:
+            return
+        nodes = set(int(i) for i in nodes)
+        rows = {}
+        for i in nodes:
+            rows[i] = [(int(j), float(cost)) for j, cost in zip(self.neighbors[i], self.edge_cost[i])
+                       if j >= 0 and cost != np.inf]
+        forward = self._adjacency.get(False)
+        if forward is not None:
+            for i, row in rows.items():
+                forward[i] = row
+        backward = self._adjacency.get(True)
+        if backward is not None:
+            targets = {int(j) for i in nodes for j in self.neighbors[i] if j >= 0}
+            for j in targets:
+                backward[j] = [(i, cost) for i, cost in backward[j] if i not in nodes]
+            for i, row in rows.items():
+                for j, cost in row:
+                    backward[j].append((i, cost))
+
+    def heuristic_dist(self, i, j):
+        """
+        两节点格心之间的球面距离，作为A*的启发值
+        """
+        return h3.point_dist(tuple(self.centers[i]), tuple(self.centers[j])) * self.heuristic_scale
+
+    def path_points(self, nodes):
+        """
+        将节点编号序列转为路径点列表，可直接传给write_path_shp
+        :param nodes: 节点编号列表
+        :return: [(lat1, lon1), (lat2, lon2), ...]
+        """
+        return [tuple(self.centers[i]) for i in nodes]
+
+    def save(self, directory):
+        """
+        以.npy数组保存到目录，供多进程以内存映射方式共享
+        每个文件先写临时文件再替换，正在映射旧文件的进程不受影响
+        :param directory: 输出目录
+        :return: None
+        """
+        os.makedirs(directory, exist_ok=True)
+
+        def save_array(name, array):
+            path = os.path.join(directory, name)
+            with open(path + ".tmp", 'wb') as f:
+                np.save(f, array)
+            os.replace(path + ".tmp", path)
+
+        save_array("h3_indexes.npy", self.h3_ints())
+        save_array("centers.npy", self.centers)
+        save_array("neighbors.npy", self.neighbors)
+        save_array("edge_cost.npy", self.edge_cost)
+        save_array("grade.npy", self.grade)
+        for name, layer in self.layers.items():
+            save_array(f"layer_{name}.npy", layer)
+        meta_path = os.path.join(directory, "meta.bin")
+        with open(meta_path + ".tmp", 'wb') as f:
+            pickle.dump({"profile": self.profile, "layers": list(self.layers), "heuristic_scale": self.heuristic_scale,
+                         "map_version": self.map_version,
+                         "cost_profile": None if self.cost_profile is None else self.cost_profile.to_dict()}, f)
+        os.replace(meta_path + ".tmp", meta_path)
+        if self.landmarks is not None:
+            self.landmarks.save(os.path.join(directory, "landmarks.npz"))
+        if self.index is not None:
+            self.index.save(os.path.join(directory, "index.npz"))
+
+    def load(directory, mmap=True):
+        """
+        读取CompiledMap.save保存的目录
+        h3索引表、反查字典与属性索引在首次访问时才生成，只按节点编号搜索的进程不必构建
+        :param directory: 目录
+        :param mmap: 是否以只读内存映射方式打开数组，多个进程共享同一份物理内存，搜索直接读取共享数组；
+                     此时不能更新边代价
+        :return: CompiledMap对象
+        """
+        from landmarks import Landmarks
+
+        def load_array(name):
+            # np.memmap的逐元素索引很慢，转为共享同一块映射内存的普通ndarray视图
+            return np.asarray(np.load(os.path.join(directory, name), mmap_mode='r' if mmap else None))
+
+        with open(os.path.join(directory, "meta.bin"), 'rb') as f:
+            meta = pickle.load(f)
+        graph = CompiledMap()
+        del graph.h3_indexes, graph.node_ids, graph.index
+        graph._h3_ints = load_array("h3_indexes.npy")
+        graph._index_path = os.path.join(directory, "index.npz")
+        graph.shared = mmap
+        graph.centers = load_array("centers.npy")
+        graph.neighbors = load_array("neighbors.npy")
+        graph.edge_cost = load_array("edge_cost.npy")
+        graph.layers = {name: load_array(f"layer_{name}.npy") for name in meta["layers"]}
+        if os.path.exists(os.path.join(directory, "grade.npy")):
+            graph.grade = load_array("grade.npy")
+        else:
+            graph.update_grade()    # 旧版本保存的目录没有坡度比
+        graph.profile = meta["profile"]
+        graph.heuristic_scale = meta.get("heuristic_scale", 1.0)
+        graph.map_version = meta.get("map_version")
+        if meta.get("cost_profile") is not None:
+            graph.cost_profile = CostProfile.from_dict(meta["cost_profile"])
+        landmarks_path = os.path.join(directory, "landmarks.npz")
+        if os.path.exists(landmarks_path):
+            landmarks = Landmarks.load(landmarks_path)
+            if landmarks.matches_graph(graph):
+                graph.landmarks = landmarks
+            else:
+                print(f"地标表与地图边代价不一致，已忽略: {landmarks_path}")
+        return graph
+
+if __name__ == '__main__':
+    with open('output/汤山/汤山map.bin', 'rb') as f:
+        map = pickle.load(f)
+    graph = CompiledMap.compile(map)
+    print(f"节点数: {len(graph)}, 最大邻居数: {graph.neighbors.shape[1]}")
@@ -0,0 +1,236 @@
+import heapq
+import pickle
+import h3
+from compiled_map import CompiledMap
+
+class ContractionHierarchy:
+    """
+    收缩层次(Contraction Hierarchies)
+    对代价固定的CompiledMap按重要度逐个收缩节点并添加捷径边，
+    查询时只需在"向上"的边上做双向Dijkstra，适合地图不变、查询次数很多的场景
+    """
+    def __init__(self, graph):
+        """
+        :param graph: CompiledMap对象，边代价即为固定的代价配置
+        """
+        self.graph = graph
+        self.rank = []          # 节点编号 -> 收缩顺序，越大越重要
+        self.up = []            # 正向搜索图：节点 -> [(更高层节点, 代价), ...]
+        self.down = []          # 反向搜索图：节点 -> [(指向它的更高层节点, 代价), ...]
+        self.middle = {}        # 捷径边 (u, w) -> 被收缩的中间节点
+
+    def witness_search(out_edges, source, target_costs, excluded, max_cost, max_settled):
+        """
+        见证路径搜索：不经过excluded节点时source到各目标的代价是否不超过经由excluded的代价
+        :param out_edges: 当前剩余图的出边
+        :param source: 起点
+        :param target_costs: 目标节点 -> 经由excluded的代价
+        :param excluded: 正在收缩的节点
+        :param max_cost: 搜索代价上界
+        :param max_settled: 最多确定的节点数
+        :return: 存在见证路径的目标节点集合
+        """
+        dist = {source: 0.0}
+        heap = [(0.0, source)]
+        settled = 0
+        remaining = set(target_costs)
+        while heap and settled < max_settled and remaining:
+            d, u = heapq.heappop(heap)
+            if d > dist.get(u, float("inf")):
+                continue
+            if d > max_cost:
+                break
+            settled += 1
+            remaining.discard(u)
+            for v, (cost, _) in out_edges[u].items():
+                if v == excluded:
+                    continue
+                nd = d + cost
+                if nd < dist.get(v, float("inf")):
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        return {w for w, via in target_costs.items() if dist.get(w, float("inf")) <= via}
+
+    def contract(out_edges, in_edges, v, max_settled):
+        """
+        计算收缩节点v需要添加的捷径边(不修改图)
+        :return: [(u, w, 代价), ...]
+        """
+        shortcuts = []
+        for u, (cost_uv, _) in in_edges[v].items():
+            targets = {w: cost_uv + cost_vw for w, (cost_vw, _) in out_edges[v].items() if w != u}
+            if not targets:
+                continue
+            witnessed = ContractionHierarchy.witness_search(
+                out_edges, u, targets, v, max(targets.values()), max_settled)
+            for w, cost in targets.items():
+                if w not in witnessed:
+                    shortcuts.append((u, w, cost))
+        return shortcuts
+
+    def build(self, max_settled=64):
+        """
+        收缩所有节点
+        节点重要度 = 边差(添加捷径数 - 删除边数) + 已收缩邻居数，采用惰性更新
+        :param max_settled: 见证搜索最多确定的节点数，越大捷径越少但预处理越慢
+        :return: self
+        """
+        from tqdm import tqdm
+
+        graph = self.graph
+        n = len(graph)
+        out_edges = [dict() for _ in range(n)]      # u -> {w: (代价, 中间节点)}
+        in_edges = [dict() for _ in range(n)]
+        for u, edges in enumerate(graph.adjacency()):
+            for w, cost in edges:
+                out_edges[u][w] = (cost, None)
+                in_edges[w][u] = (cost, None)
+
+        deleted_neighbors = [0] * n
+
+        def priority(v, shortcuts):
+            return len(shortcuts) - len(in_edges[v]) - len(out_edges[v]) + deleted_neighbors[v]
+
+        heap = []
+        for v in tqdm(range(n), desc="初始化收缩顺序: "):
+            heap.append((priority(v, ContractionHierarchy.contract(out_edges, in_edges, v, max_settled)), v))
+        heapq.heapify(heap)
+        self.rank = [0] * n
+        self.middle = {}
+        contracted = [False] * n
+        up = [[] for _ in range(n)]
+        down = [[] for _ in range(n)]
+        order = 0
+        progress = tqdm(total=n, desc="收缩节点: ")
+        while heap:
+            _, v = heapq.heappop(heap)
+            if contracted[v]:
+                continue
+            # 惰性更新：重新计算后仍是最小才收缩
+            shortcuts = ContractionHierarchy.contract(out_edges, in_edges, v, max_settled)
+            current = priority(v, shortcuts)
+            if heap and current > heap[0][0]:
+                heapq.heappush(heap, (current, v))
+                continue
+            for u, w, cost in shortcuts:
+                if cost < out_edges[u].get(w, (float("inf"), None))[0]:
+                    out_edges[u][w] = (cost, v)
+                    in_edges[w][u] = (cost, v)
+            # v的剩余边都指向更高层节点
+            for w, (cost, mid) in out_edges[v].items():
+                up[v].append((w, cost))
+                if mid is not None:
+                    self.middle[(v, w)] = mid
+                del in_edges[w][v]
+                deleted_neighbors[w] += 1
+            for u, (cost, mid) in in_edges[v].items():
+                down[v].append((u, cost))
+                if mid is not None:
+                    self.middle[(u, v)] = mid
+                del out_edges[u][v]
+                deleted_neighbors[u] += 1
+            out_edges[v] = {}
+            in_edges[v] = {}
+            contracted[v] = True
+            self.rank[v] = order
+            order += 1
+            progress.update(1)
+        progress.close()
+        self.up = up
+        self.down = down
+        return self
+
+    def query(self, source, target):
+        """
+        双向CH查询
+        :param source: 起点节点编号
+        :param target: 终点节点编号
+        :return: (代价, 节点编号列表)，不可达时返回 (inf, [])
+        """
+        dist = ({source: 0.0}, {target: 0.0})
+        father = ({source: None}, {target: None})
+        heaps = ([(0.0, source)], [(0.0, target)])
+        graphs = (self.up, self.down)
+        best, meet = float("inf"), None
+        if source == target:
+            best, meet = 0.0, source
+        while heaps[0] or heaps[1]:
+            for side in (0, 1):
+                heap = heaps[side]
+                if not heap:
+                    continue
+                d, u = heapq.heappop(heap)
+                if d > dist[side][u]:
+                    continue
+                if d >= best:
+                    heap.clear()    # 该方向已无法改进
+                    continue
+                other = dist[1 - side].get(u)
+                if other is not None and d + other < best:
+                    best, meet = d + other, u
+                # stall-on-demand：能经由更高层节点以更小代价到达u时，u不再向外扩展
+                if any(dist[side].get(w, float("inf")) + cost < d for w, cost in graphs[1 - side][u]):
+                    continue
+                for v, cost in graphs[side][u]:
+                    nd = d + cost
+                    if nd < dist[side].get(v, float("inf")):
+                        dist[side][v] = nd
+                        father[side][v] = u
+                        heapq.heappush(heap, (nd, v))
+        if meet is None:
+            return float("inf"), []
+
+        # 拼接两段CH路径，再展开捷径边
+        forward = []
+        node = meet
+        while node is not None:
+            forward.append(node)
+            node = father[0][node]
+        forward.reverse()
+        node = father[1][meet]
+        while node is not None:
+            forward.append(node)
+            node = father[1][node]
+        path = [forward[0]]
+        for u, w in zip(forward, forward[1:]):
+            path.extend(self.unpack(u, w)[1:])
+        return best, path
+
+    def unpack(self, u, w):
+        """
+        将捷径边(u, w)展开为原图上的节点序列
+        :return: 节点编号列表，含两端
+        """
+        path = [u]
+        stack = [(u, w)]
+        while stack:
+            a, b = stack.pop()
+            mid = self.middle.get((a, b))
+            if mid is None:
+                path.append(b)
+            else:
+                stack.append((mid, b))
+                stack.append((a, mid))
+        return path
+
+    def query_by_index(self, start_index, end_index):
+        """
+        以h3索引为起终点的CH查询
+        :return: (代价, h3索引列表)
+        """
+        graph = self.graph
+        cost, path = self.query(graph.node_ids[start_index], graph.node_ids[end_index])
+        return cost, [graph.h3_indexes[i] for i in path]
+
+if __name__ == '__main__':
+    from pp import write_path_shp
+    with open('output/汤山/汤山map.bin', 'rb') as f:
+        map = pickle.load(f)
+    graph = CompiledMap.compile(map)
+    ch = ContractionHierarchy(graph).build()
+    with open('output/汤山/汤山ch.bin', 'wb') as f:
+        pickle.dump(ch, f)
+    start = h3.geo_to_h3(31.989187, 118.990892, 13)
+    end = h3.geo_to_h3(31.996765, 118.982489, 13)
+    cost, path = ch.query(graph.node_ids[start], graph.node_ids[end])
+    write_path_shp(graph.path_points(path), 'output/汤山/规划路径_ch.shp')
@@ -0,0 +1,94 @@
+import math
+import h3
+
+class Corridor:
+    """
+    搜索走廊
+    以若干分辨率下的h3 cell集合表示允许搜索的区域，pp()扩展节点时以O(1)的父/子索引换算判断是否在走廊内，
+    搜索的时间与内存只与走廊大小有关，与地图大小无关
+    """
+    def __init__(self, cells):
+        """
+        :param cells: 走廊覆盖的h3索引集合，可混合不同分辨率
+        """
+        self.cells = {}         # 分辨率 -> h3索引集合
+        for h3_index in cells:
+            self.cells.setdefault(h3.h3_get_resolution(h3_index), set()).add(h3_index)
+
+    def __len__(self):
+        return sum(len(cells) for cells in self.cells.values())
+
+    def contains(self, h3_index):
+        """
+        判断地图cell是否在走廊内
+        比走廊细的cell看其父cell，比走廊粗的cell看其中心子cell
+        :param h3_index: 地图cell的h3索引
+        :return: bool
+        """
+        resolution = h3.h3_get_resolution(h3_index)
+        for corridor_resolution, cells in self.cells.items():
+            if resolution > corridor_resolution:
+                index = h3.h3_to_parent(h3_index, corridor_resolution)
+            elif resolution < corridor_resolution:
+                index = h3.h3_to_center_child(h3_index, corridor_resolution)
+            else:
+                index = h3_index
+            if index in cells:
+                return True
+        return False
+
+    def from_parents(h3_indexes):
+        """
+        由一组父cell构造走廊
+        :param h3_indexes: h3索引列表
+        :return: Corridor对象
+        """
+        return Corridor(h3_indexes)
+
+    def from_polygon(geojson, resolution):
+        """
+        由多边形构造走廊
+        :param geojson: GeoJSON Polygon/MultiPolygon，坐标为 [lon, lat]，可含洞，与Map.cells_in_polygon相同
+        :param resolution: 填充多边形所用的分辨率
+        :return: Corridor对象
+        """
+        from region import polygon_parts, polygon_rings
+
+        cells = set()
+        for polygon in polygon_parts(geojson):
+            # h3.polyfill_geojson只接受Polygon，多部件逐个填充
+            cells.update(h3.polyfill_geojson({"type": "Polygon", "coordinates": polygon}, resolution))
+        # 补上格心落在多边形外的顶点cell，保证走廊覆盖多边形的角点
+        boundary = set()
+        for ring in polygon_rings(geojson):
+            for lon, lat in ring.tolist():
+                boundary.add(h3.geo_to_h3(lat, lon, resolution))
+        return Corridor(cells | boundary)
+
+    def from_polyline(points, buffer, resolution=None):
+        """
+        由参考折线及缓冲距离构造走廊
+        :param points: 折线点列表 [(lat1, lon1), (lat2, lon2), ...]
+        :param buffer: 缓冲距离(km)
+        :param resolution: 走廊的分辨率，None表示取格心间距不小于缓冲距离1/4的最细分辨率
+        :return: Corridor对象
+        """
+        if resolution is None:
+            resolution = 0
+            while resolution < 15 and math.sqrt(3) * h3.edge_length(resolution + 1, unit='km') >= buffer / 4:
+                resolution += 1
+        spacing = math.sqrt(3) * h3.edge_length(resolution, unit='km')     # 相邻格心间距
+        k = math.ceil(buffer / spacing)
+        centers = set()
+        for (lat1, lon1), (lat2, lon2) in zip(points, points[1:]):
+            # 按格心间距加密折线
+            steps = max(1, math.ceil(h3.point_dist((lat1, lon1), (lat2, lon2)) / spacing))
+            for step in range(steps + 1):
+                t = step / steps
+                centers.add(h3.geo_to_h3(lat1 + (lat2 - lat1) * t, lon1 + (lon2 - lon1) * t, resolution))
+        if len(points) == 1:
+            centers.add(h3.geo_to_h3(points[0][0], points[0][1], resolution))
+        cells = set()
+        for center in centers:
+            cells.update(h3.k_ring(center, k))
+        return Corridor(cells)
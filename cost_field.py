@@ -0,0 +1,145 @@
+import pickle
+import h3
+import numpy as np
+from compiled_map import CompiledMap
+from graph_search import GraphSearch
+
+class CostField:
+    """
+    一对多代价场
+    从一个(或多个)起点做一次Dijkstra，得到与CompiledMap节点编号对齐的到达代价数组，
+    可回答"代价X以内能到哪些cell"、"这些目标中哪个最近"等问题，代替多次点对点的pp()
+    """
+    def __init__(self, graph, cost, father, reverse=False):
+        """
+        :param graph: CompiledMap对象
+        :param cost: 长度为N的代价数组，未到达为inf
+        :param father: 长度为N的父节点数组，起点与未到达为-1
+        :param reverse: 是否为到达代价场，此时父节点是通往终点的下一跳
+        """
+        self.graph = graph
+        self.cost = cost
+        self.father = father
+        self.reverse = reverse
+
+    def nbytes(self):
+        """
+        代价场占用的内存(字节)
+        """
+        return self.cost.nbytes + self.father.nbytes
+
+    def compute(graph, sources, max_cost=None, targets=None, reverse=False, overlay=None):
+        """
+        计算代价场
+        :param graph: CompiledMap对象
+        :param sources: 起点节点编号列表
+        :param max_cost: 代价上界，超过上界的cell视为不可达
+        :param targets: 目标节点编号集合，全部确定后提前结束
+        :param reverse: True时计算各节点到sources的代价(到达代价场)
+        :param overlay: 地图覆盖层(MapOverlay对象)
+        :return: CostField对象
+        """
+        dist, father = GraphSearch.dijkstra(graph, sources, targets=targets, reverse=reverse,
+                                            overlay=overlay, max_cost=max_cost)
+        n = len(graph)
+        cost = np.full(n, np.inf)
+        parent = np.full(n, -1, dtype=np.int32)
+        if dist:
+            nodes = np.fromiter(dist.keys(), dtype=np.int64, count=len(dist))
+            cost[nodes] = np.fromiter(dist.values(), dtype=np.float64, count=len(dist))
+            parent[nodes] = np.fromiter((-1 if u is None else u for u in father.values()), dtype=np.int32, count=len(father))
+        # 提前结束时，代价大于最后确定节点的cell只是暂定值，一律视为未到达
+        bound = max_cost
+        if targets is not None:
+            reached = [dist[t] for t in targets if t in dist]
+            if len(reached) == len(targets):
+                bound = max(reached) if bound is None else min(bound, max(reached))
+        if bound is not None:
+            unsettled = cost > bound
+            cost[unsettled] = np.inf
+            parent[unsettled] = -1
+        return CostField(graph, cost, parent, reverse)
+
+    def reachable(self, max_cost):
+        """
+        代价不超过max_cost的节点编号数组
+        """
+        return np.flatnonzero(self.cost <= max_cost)
+
+    def nearest(self, targets):
+        """
+        目标中代价最小的一个
+        :param targets: 节点编号列表
+        :return: (节点编号, 代价)，均不可达时返回 (None, inf)
+        """
+        targets = np.asarray(targets, dtype=np.int64)
+        if len(targets) == 0:
+            return None, float("inf")
+        best = int(np.argmin(self.cost[targets]))
+        if np.isinf(self.cost[targets[best]]):
+            return None, float("inf")
+        return int(targets[best]), float(self.cost[targets[best]])
+
+    def path_to(self, node):
+        """
+        沿父节点回溯路径，耗时与路径长度成正比
+        :return: 按行进方向排列的节点编号列表(正向为起点到node，reverse为node到终点)，不可达时为空
+        """
+        if np.isinf(self.cost[node]):
+            return []
+        path = []
+        while node >= 0:
+            path.append(int(node))
+            node = self.father[node]
+        if not self.reverse:
+            path.reverse()
+        return path
+
+    def isochrones(self, thresholds):
+        """
+        等时线(等代价线)多边形
+        :param thresholds: 代价阈值列表
+        :return: {阈值: 多边形列表}，多边形为GeoJSON坐标 [[[lon, lat], ...], 洞...]
+        """
+        polygons = {}
+        for threshold in thresholds:
+            h3_indexes = {self.graph.h3_indexes[i] for i in self.reachable(threshold)}
+            if not h3_indexes:
+                polygons[threshold] = []
+                continue
+            # h3_set_to_multi_polygon要求同一分辨率，自适应地图先展开到最细分辨率
+            resolutions = {h3.h3_get_resolution(index) for index in h3_indexes}
+            if len(resolutions) > 1:
+                h3_indexes = h3.uncompact(h3_indexes, max(resolutions))
+            polygons[threshold] = h3.h3_set_to_multi_polygon(h3_indexes, geo_json=True)
+        return polygons
+
+    def write_isochrone_shp(self, thresholds, shp_path):
+        """
+        将等时线写入SHP文件，每个阈值一条记录
+        :param thresholds: 代价阈值列表
+        :param shp_path: 输出的SHP文件路径
+        :return: None
+        """
+        import shapefile as shp
+        from map2shp import write_prj_file
+
+        with shp.Writer(shp_path, shapeType=shp.POLYGON) as writer:
+            writer.field('cost', 'F', decimal=4)
+            for threshold, polygons in self.isochrones(thresholds).items():
+                # GeoJSON外环逆时针，SHP外环顺时针，逐环反转
+                parts = [list(reversed(loop)) for polygon in polygons for loop in polygon]
+                if not parts:
+                    continue
+                writer.poly(parts)
+                writer.record(threshold)
+        write_prj_file(shp_path)
+
+if __name__ == '__main__':
+    with open('output/汤山/汤山map.bin', 'rb') as f:
+        map = pickle.load(f)
+    graph = CompiledMap.compile(map)
+    base = graph.node_ids[h3.geo_to_h3(31.989187, 118.990892, 13)]
+    field = CostField.compute(graph, [base], max_cost=1.0)
+    print(f"1km代价以内可达cell数: {len(field.reachable(1.0))}")
+    field.write_isochrone_shp([0.25, 0.5, 1.0], 'output/汤山/等时线.shp')
@@ -0,0 +1,319 @@
+import json
+import hashlib
+import numpy as np
+from pp_enum import *
+
+# 地球半径(km)，与h3.point_dist一致
+EARTH_RADIUS_KM = 6371.007180918475
+
+class CostProfile:
+    """
+    声明式代价配置
+    地表覆盖倍率、不可通行类别、道路倍率、坡度与高程变异系数阈值写成一份配置，
+    对CompiledMap的列式属性层做一次向量化计算得到逐节点代价倍率与 N×K 边代价；
+    边代价 = 格心球面距离 × 进入节点的代价倍率 × 有向坡度倍率，不可通行为inf
+    编译结果按 (地图版本, 配置摘要) 缓存在CompiledMap上，切换配置只需一次编译
+    """
+    def __init__(self, name, landcover=None, impassable=(), road=None, impassable_roads=("highway",),
+                 road_overrides_landcover=False, max_slope=None, slope_factor=0.0, max_cv=None,
+                 uphill_factor=0.0, downhill_factor=0.0, max_uphill_grade=None, max_downhill_grade=None):
+        """
+        :param name: 配置名称
+        :param landcover: 地表覆盖类别 -> 代价倍率，类别名为AttributeIndex成员名的小写(如"forest")，一个cell有多个类别时倍率相乘
+        :param impassable: 不可通行的地表覆盖类别
+        :param road: 道路类型 -> 代价倍率，类型名为RoadType成员名的小写(如"normalway")
+        :param impassable_roads: 不可通行的道路类型
+        :param road_overrides_landcover: 道路cell是否忽略地表覆盖的倍率与不可通行类别
+        :param max_slope: 最大坡度(度)，超过不可通行，None表示不限制
+        :param slope_factor: 坡度代价系数，倍率乘以 1 + slope_factor * 坡度
+        :param max_cv: 最大高程变异系数，超过不可通行，None表示不限制；未量化cv的cell不受限制
+        :param uphill_factor: 上坡代价系数，边代价乘以 1 + uphill_factor * 坡度比(高差/水平距离)
+        :param downhill_factor: 下坡代价系数，边代价乘以 1 + downhill_factor * |坡度比|
+        :param max_uphill_grade: 最大上坡坡度比，超过该边不可通行，None表示不限制
+        :param max_downhill_grade: 最大下坡坡度比(取正值)，超过该边不可通行，None表示不限制
+        """
+        self.name = name
+        self.landcover = dict(landcover or {})
+        self.impassable = sorted(impassable)
+        self.road = dict(road or {})
+        self.impassable_roads = sorted(impassable_roads)
+        self.road_overrides_landcover = road_overrides_landcover
+        self.max_slope = max_slope
+        self.slope_factor = slope_factor
+        self.max_cv = max_cv
+        self.uphill_factor = uphill_factor
+        self.downhill_factor = downhill_factor
+        self.max_uphill_grade = max_uphill_grade
+        self.max_downhill_grade = max_downhill_grade
+        if uphill_factor < 0 or downhill_factor < 0:
+            raise ValueError("坡度代价系数不能为负")
+        for landcover_name in list(self.landcover) + self.impassable:
+            CostProfile.landcover_bit(landcover_name)
+        for road_name in list(self.road) + self.impassable_roads:
+            CostProfile.road_type(road_name)
+        self._digest = None
+
+    def __repr__(self):
+        return f"CostProfile({self.key()})"
+
+    def landcover_bit(landcover_name):
+        """
+        地表覆盖类别名 -> CompiledMap地表覆盖层中的位
+        """
+        name = landcover_name.upper()
+        if name not in AttributeIndex.__members__ or AttributeIndex[name].value < AttributeIndex.WATER.value:
+            raise ValueError(f"未知的地表覆盖类别: {landcover_name}")
+        if AttributeIndex[name] is AttributeIndex.ROAD:
+            # 道路不写入地表覆盖层，按道路类型配置(road、impassable_roads)
+            raise ValueError(f"道路不是地表覆盖类别，请按道路类型配置: {landcover_name}")
+        return 1 << AttributeIndex[name].value
+
+    def road_type(road_name):
+        """
+        道路类型名 -> road_type层中的取值
+        """
+        name = road_name.upper()
+        if name not in RoadType.__members__:
+            raise ValueError(f"未知的道路类型: {road_name}")
+        return RoadType[name].value
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "landcover": self.landcover,
+            "impassable": self.impassable,
+            "road": self.road,
+            "impassable_roads": self.impassable_roads,
+            "road_overrides_landcover": self.road_overrides_landcover,
+            "max_slope": self.max_slope,
+            "slope_factor": self.slope_factor,
+            "max_cv": self.max_cv,
+            "uphill_factor": self.uphill_factor,
+            "downhill_factor": self.downhill_factor,
+            "max_uphill_grade": self.max_uphill_grade,
+            "max_downhill_grade": self.max_downhill_grade,
+        }
+
+    def from_dict(config):
+        """
+        由配置字典(如读取自JSON文件)创建
+        :param config: 配置字典，键与构造参数相同
+        :return: CostProfile对象
+        """
+        return CostProfile(**config)
+
+    def load(path):
+        """
+        读取JSON配置文件
+        :param path: 文件路径
+        :return: CostProfile对象
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            return CostProfile.from_dict(json.load(f))
+
+    def digest(self):
+        """
+        配置内容的摘要，内容相同的配置摘要相同，跨进程稳定
+        :return: 十六进制字符串
+        """
+        if self._digest is None:
+            content = json.dumps(self.to_dict(), sort_keys=True)
+            self._digest = hashlib.sha1(content.encode()).hexdigest()
+        return self._digest
+
+    def key(self):
+        """
+        写入CompiledMap.profile的配置标识，名称相同而内容不同的配置标识不同
+        """
+        return f"{self.name}:{self.digest()[:12]}"
+
+    def node_cost(self, graph):
+        """
+        逐节点的进入代价倍率
+        :param graph: CompiledMap对象
+        :return: 长度为N的float64数组，不可通行为inf
+        """
+        landcover = np.asarray(graph.layers["landcover"])
+        road_type = np.asarray(graph.layers["road_type"])
+        cost = np.ones(len(landcover), dtype=np.float64)
+        for landcover_name, factor in self.landcover.items():
+            cost[(landcover & CostProfile.landcover_bit(landcover_name)) != 0] *= factor
+        impassable_mask = sum(CostProfile.landcover_bit(name) for name in self.impassable)
+        blocked = (landcover & impassable_mask) != 0
+        if self.road_overrides_landcover:
+            on_road = road_type != RoadType.NOWAY.value
+            cost[on_road] = 1.0
+            blocked &= ~on_road
+        for road_name, factor in self.road.items():
+            cost[road_type == CostProfile.road_type(road_name)] *= factor
+        for road_name in self.impassable_roads:
+            blocked |= road_type == CostProfile.road_type(road_name)
+        if self.max_slope is not None or self.slope_factor:
+            slope = np.nan_to_num(np.asarray(graph.layers["slope"]), nan=0.0)
+            cost *= 1.0 + self.slope_factor * slope
+            if self.max_slope is not None:
+                blocked |= slope > self.max_slope
+        if self.max_cv is not None and "cv" in graph.layers:
+            with np.errstate(invalid='ignore'):
+                blocked |= np.asarray(graph.layers["cv"]) > self.max_cv
+        cost[blocked] = np.inf
+        return cost
+
+    def edge_distance(graph, rows=None):
+        """
+        N×K 边两端格心之间的球面距离(km)，计算方式与h3.point_dist相同
+        :param graph: CompiledMap对象
+        :param rows: 只计算这些节点的出边，None表示全部节点
+        :return: N×K(或 len(rows)×K) float64数组，空位为inf
+        """
+        rows = slice(None) if rows is None else rows
+        neighbors = np.asarray(graph.neighbors)[rows]
+        valid = neighbors >= 0
+        j = np.where(valid, neighbors, 0)
+        lat = np.radians(graph.centers[:, 0])
+        lon = np.radians(graph.centers[:, 1])
+        lat_i, lon_i = lat[rows][:, None], lon[rows][:, None]
+        sin_lat = np.sin((lat[j] - lat_i) / 2.0)
+        sin_lon = np.sin((lon[j] - lon_i) / 2.0)
+        a = sin_lat * sin_lat + np.cos(lat_i) * np.cos(lat[j]) * sin_lon * sin_lon
+        distance = 2.0 * np.arctan2(np.sqrt(a), np.sqrt(1.0 - a)) * EARTH_RADIUS_KM
+        distance[~valid] = np.inf
+        return distance
+
+    def edge_grade_cost(self, graph, rows=None):
+        """
+        由CompiledMap.grade得到逐边的有向坡度倍率
+        :param graph: CompiledMap对象
+        :param rows: 只计算这些节点的出边，None表示全部节点
+        :return: N×K(或 len(rows)×K) float64数组，超过坡度上限为inf；配置不含坡度项时返回None
+        """
+        if (not self.uphill_factor and not self.downhill_factor
+                and self.max_uphill_grade is None and self.max_downhill_grade is None):
+            return None
+        grade = np.asarray(graph.grade)[slice(None) if rows is None else rows]
+        uphill = np.maximum(grade, 0.0)
+        downhill = np.maximum(-grade, 0.0)
+        factor = 1.0 + self.uphill_factor * uphill + self.downhill_factor * downhill
+        if self.max_uphill_grade is not None:
+            factor[uphill > self.max_uphill_grade] = np.inf
+        if self.max_downhill_grade is not None:
+            factor[downhill > self.max_downhill_grade] = np.inf
+        return factor
+
+    def compile(self, graph):
+        """
+        编译为CompiledMap上的代价数组，结果按 (地图版本, 配置摘要) 缓存
+        :param graph: CompiledMap对象
+        :return: (逐节点代价倍率, N×K 边代价, 启发值系数)
+                 启发值系数为min(1, 最小有限倍率)，坡度倍率不小于1，格心距离乘以该系数后仍是代价下界
+        """
+        key = (graph.version, self.digest())
+        compiled = graph._profile_cache.get(key)
+        if compiled is not None:
+            return compiled
+        node_cost = self.node_cost(graph)
+        return self._store(graph, node_cost, self.edge_cost(graph, node_cost))
+
+    def recompile(self, graph, edge_cost, nodes):
+        """
+        地图部分节点变化后增量编译：逐节点倍率整体向量化重算，边代价只重算指定节点的出边，其余行沿用原结果
+        :param graph: CompiledMap对象，版本号已递增
+        :param edge_cost: 变化前的 N×K 边代价，不会被修改
+        :param nodes: 出边代价需要重算的节点编号
+        :return: 同compile
+        """
+        node_cost = self.node_cost(graph)
+        rows = np.fromiter(sorted(set(int(i) for i in nodes)), dtype=np.int64)
+        edge_cost = np.array(edge_cost, dtype=np.float64)
+        edge_cost[rows] = self.edge_cost(graph, node_cost, rows)
+        return self._store(graph, node_cost, edge_cost)
+
+    def edge_cost(self, graph, node_cost, rows=None):
+        """
+        由逐节点倍率计算边代价
+        :param graph: CompiledMap对象
+        :param node_cost: node_cost的结果
+        :param rows: 只计算这些节点的出边，None表示全部节点
+        :return: N×K(或 len(rows)×K) float64数组，空位与不可通行为inf
+        """
+        neighbors = np.asarray(graph.neighbors)[slice(None) if rows is None else rows]
+        edge_cost = CostProfile.edge_distance(graph, rows) * node_cost[np.where(neighbors >= 0, neighbors, 0)]
+        grade_cost = self.edge_grade_cost(graph, rows)
+        if grade_cost is not None:
+            edge_cost *= grade_cost
+        edge_cost[neighbors < 0] = np.inf
+        return edge_cost
+
+    def _store(self, graph, node_cost, edge_cost):
+        """
+        编译结果设为只读并按 (地图版本, 配置摘要) 写入缓存
+        :return: (逐节点代价倍率, N×K 边代价, 启发值系数)
+        """
+        finite = node_cost[np.isfinite(node_cost)]
+        heuristic_scale = float(min(1.0, finite.min())) if len(finite) else 1.0
+        node_cost.flags.writeable = False
+        edge_cost.flags.writeable = False
+        # 地图版本变化后旧版本的编译结果不会再命中
+        for stale in [k for k in graph._profile_cache if k[0] != graph.version]:
+            del graph._profile_cache[stale]
+        compiled = graph._profile_cache[(graph.version, self.digest())] = (node_cost, edge_cost, heuristic_scale)
+        return compiled
+
+# 与RejectStrategy/CostStrategy规则相同：水体、建筑、林地、耕地、灌木与高速路不可通行，代价为格心距离
+DEFAULT = CostProfile("default", impassable=("water", "building", "forest", "plowland", "shrubwood"))
+
+# 轮式车辆：依赖道路，坡度敏感；坡度比0.3约为17度
+WHEELED = CostProfile(
+    "wheeled",
+    landcover={"grass": 1.5, "plowland": 2.5, "wasteland": 1.8},
+    impassable=("water", "building", "forest", "shrubwood"),
+    road={"normalway": 0.5, "entryway": 0.7},
+    road_overrides_landcover=True,
+    max_slope=25.0,
+    uphill_factor=4.0,
+    downhill_factor=1.0,
+    max_uphill_grade=0.3,
+    max_downhill_grade=0.35,
+)
+
+# 履带车辆：越野能力强，可穿越林地、灌木
+TRACKED = CostProfile(
+    "tracked",
+    landcover={"forest": 2.5, "shrubwood": 1.8, "grass": 1.1, "plowland": 1.5, "wasteland": 1.2},
+    impassable=("water", "building"),
+    road={"normalway": 0.7, "entryway": 0.8},
+    road_overrides_landcover=True,
+    max_slope=35.0,
+    uphill_factor=2.5,
+    downhill_factor=0.5,
+    max_uphill_grade=0.6,
+    max_downhill_grade=0.6,
+)
+
+# 步行：几乎处处可达，上坡明显变慢
+FOOT = CostProfile(
+    "foot",
+    landcover={"forest": 1.5, "shrubwood": 1.8, "plowland": 1.3, "wasteland": 1.1},
+    impassable=("water", "building"),
+    road={"normalway": 0.8, "entryway": 0.8},
+    road_overrides_landcover=True,
+    max_slope=45.0,
+    uphill_factor=6.0,
+    downhill_factor=1.5,
+    max_uphill_grade=1.0,
+)
+
+PROFILES = {profile.name: profile for profile in (DEFAULT, WHEELED, TRACKED, FOOT)}
+
+if __name__ == '__main__':
+    import time
+    from compiled_map import CompiledMap
+    from graph_search import GraphSearch
+    graph = CompiledMap.load('output/汤山/汤山compiled', mmap=False)
+    source, target = 0, len(graph) - 1
+    for profile in PROFILES.values():
+        start = time.perf_counter()
+        graph.apply_profile(profile)
+        elapsed = time.perf_counter() - start
+        cost, path = GraphSearch.astar(graph, source, target)
+        print(f"{profile.key()}: 编译 {elapsed * 1000:.1f}ms, 代价 {cost:.3f}, 路径节点数 {len(path)}")
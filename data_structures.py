@@ -1,4 +1,5 @@
 import h3
+import time
 from abc import ABC, abstractmethod
 from pp_enum import *
 
@@ -8,13 +9,64 @@ class GlobalConfig:
         self.h3_resolution = 13         # 地图对象
 
 class Map:
+    version = 0                     # 地图版本号，旧版本序列化的地图没有该字段时取0
+    index = None
+
     def __init__(self):
         self.map_range = []         # 地图范围，多边形坐标数组 [(x1, y1), (x2, y2), ...]
         self.cells = {}             # 存储Cell对象的哈希表，键为h3_index，值为Cell对象
         self.attributes = {}        # 已经量化的属性，存储字符串
+        self.landmarks = None       # 地标表(Landmarks对象)，存在时pp()自动使用地标启发值
+        self.index = None           # 属性索引(LayerIndex对象)，由load_map从同目录的索引文件加载
+        self.version = time.time_ns() // 1000   # 以创建时间为起点，重新生成的地图不会与旧地图版本号相同
 
     def add_cell(self, cell):
         self.cells[cell.h3_index] = cell
+        self.version += 1
+
+    def touch(self):
+        """
+        标记地图已修改，版本号加一，依赖版本号的缓存随之失效
+        直接修改cell属性后需手动调用，量化函数与CompiledMap.update_cells会自动调用
+        """
+        self.version += 1
+
+    def cells_in_polygon(self, geojson):
+        """
+        格心在多边形内的cell
+        :param geojson: GeoJSON Polygon/MultiPolygon，坐标为 (lon, lat)
+        :return: 升序的节点编号数组，节点编号为cell在self.cells中的序号，与CompiledMap一致
+        """
+        from region import RegionIndex
+        return RegionIndex.for_map(self).polygon(geojson)
+
+    def cells_within(self, lat, lon, radius_km):
+        """
+        格心在圆内的cell
+        :param lat: 圆心纬度
+        :param lon: 圆心经度
+        :param radius_km: 半径(km)
+        :return: 升序的节点编号数组
+        """
+        from region import RegionIndex
+        return RegionIndex.for_map(self).radius(lat, lon, radius_km)
+
+    def cells_in_bbox(self, south, west, north, east):
+        """
+        格心在矩形范围内的cell
+        :return: 升序的节点编号数组
+        """
+        from region import RegionIndex
+        return RegionIndex.for_map(self).bbox(south, west, north, east)
+
+    def h3_indexes(self, ids):
+        """
+        节点编号转为h3索引，可传给MapOverlay、Corridor等
+        :param ids: 节点编号数组
+        :return: h3索引列表
+        """
+        from region import RegionIndex
+        return RegionIndex.for_map(self).cells(ids)
 
 class Cell:
     def __init__(self, h3_index):
@@ -0,0 +1,192 @@
+import heapq
+import pickle
+import h3
+from compiled_map import CompiledMap
+
+class DStarLite:
+    """
+    D* Lite 增量路径规划
+    从终点向起点反向搜索并在两次调用之间保留 g/rhs 状态；cell代价或通行性变化后，
+    只需更新受影响节点并修复原有路径，无需在整张地图上重新搜索
+    """
+    def __init__(self, graph, start, goal):
+        """
+        :param graph: CompiledMap对象
+        :param start: 起点节点编号
+        :param goal: 终点节点编号
+        """
+        self.graph = graph
+        self.start = start
+        self.goal = goal
+        self.last = start           # 上次计算键值时的起点，用于km修正
+        self.km = 0.0
+        self.g = {}
+        self.rhs = {goal: 0.0}
+        self.open = {}              # 节点 -> 当前有效键值
+        self.heap = []
+        self.cell_scale = {}        # 节点 -> 进入该cell的代价倍率，inf为不可通行
+        self.expanded = 0           # 最近一次compute_path扩展的节点数
+        self.push(goal)
+
+    def cost(self, u, v, base):
+        """
+        边u->v的当前代价
+        :param base: CompiledMap中的原始代价
+        """
+        return base * self.cell_scale.get(v, 1.0)
+
+    def heuristic(self, u, v):
+        """
+        格心距离启发值
+        沿直线的路径上启发值与真实代价相等，浮点误差会使键值的比较失效而提前结束，故略微缩小
+        """
+        return self.graph.heuristic_dist(u, v) * (1 - 1e-9)
+
+    def calculate_key(self, u):
+        value = min(self.g.get(u, float("inf")), self.rhs.get(u, float("inf")))
+        return (value + self.heuristic(self.start, u) + self.km, value)
+
+    def push(self, u):
+        key = self.calculate_key(u)
+        self.open[u] = key
+        heapq.heappush(self.heap, (key, u))
+
+    def top_key(self):
+        """
+        弹出失效的堆顶，返回有效的最小键值
+        """
+        while self.heap:
+            key, u = self.heap[0]
+            if self.open.get(u) == key:
+                return key
+            heapq.heappop(self.heap)
+        return (float("inf"), float("inf"))
+
+    def update_vertex(self, u):
+        """
+        重新计算u的rhs并维护开放表
+        """
+        if u != self.goal:
+            best = float("inf")
+            for v, base in self.graph.adjacency()[u]:
+                value = self.cost(u, v, base) + self.g.get(v, float("inf"))
+                if value < best:
+                    best = value
+            self.rhs[u] = best
+        self.open.pop(u, None)
+        if self.g.get(u, float("inf")) != self.rhs.get(u, float("inf")):
+            self.push(u)
+
+    def compute_path(self):
+        """
+        计算(或修复)从当前起点到终点的最短路
+        :return: (代价, 节点编号列表)，不可达时返回 (inf, [])
+        """
+        predecessors = self.graph.adjacency(reverse=True)
+        self.expanded = 0
+        while True:
+            top = self.top_key()
+            start_rhs = self.rhs.get(self.start, float("inf"))
+            start_g = self.g.get(self.start, float("inf"))
+            if not (top < self.calculate_key(self.start) or start_rhs != start_g):
+                break
+            if top == (float("inf"), float("inf")):
+                break
+            _, u = heapq.heappop(self.heap)
+            del self.open[u]
+            self.expanded += 1
+            new_key = self.calculate_key(u)
+            g_u, rhs_u = self.g.get(u, float("inf")), self.rhs.get(u, float("inf"))
+            if top < new_key:
+                self.push(u)
+            elif g_u > rhs_u:
+                self.g[u] = rhs_u
+                for v, _ in predecessors[u]:
+                    self.update_vertex(v)
+            else:
+                self.g[u] = float("inf")
+                self.update_vertex(u)
+                for v, _ in predecessors[u]:
+                    self.update_vertex(v)
+        return self.extract_path()
+
+    def extract_path(self):
+        """
+        从起点沿 代价+g 最小的后继走到终点
+        """
+        cost = self.g.get(self.start, float("inf"))
+        if cost == float("inf"):
+            return float("inf"), []
+        adjacency = self.graph.adjacency()
+        path = [self.start]
+        visited = {self.start}
+        u = self.start
+        while u != self.goal:
+            best, step = float("inf"), None
+            for v, base in adjacency[u]:
+                value = self.cost(u, v, base) + self.g.get(v, float("inf"))
+                if value < best:
+                    best, step = value, v
+            if step is None or step in visited:
+                return float("inf"), []
+            path.append(step)
+            visited.add(step)
+            u = step
+        return cost, path
+
+    def move_start(self, start):
+        """
+        车辆沿路径前进后更新起点
+        :param start: 新起点节点编号
+        :return: None
+        """
+        self.km += self.heuristic(self.last, start)
+        self.last = start
+        self.start = start
+
+    def apply_changes(self, changes):
+        """
+        批量修改cell的代价倍率或通行性
+        :param changes: {h3索引: 代价倍率}，倍率为inf表示不可通行，为1表示恢复正常
+        :return: None
+        """
+        predecessors = self.graph.adjacency(reverse=True)
+        affected = set()
+        for h3_index, scale in changes.items():
+            v = self.graph.node_ids.get(h3_index)
+            if v is None:
+                continue
+            if scale == 1.0:
+                self.cell_scale.pop(v, None)
+            else:
+                self.cell_scale[v] = scale
+            # 只有进入该cell的边代价发生变化
+            affected.update(u for u, _ in predecessors[v])
+        for u in affected:
+            self.update_vertex(u)
+
+    def graph_changed(self, nodes):
+        """
+        CompiledMap的边代价已被更新(如CompiledMap.update_cells)后调用
+        :param nodes: 出边代价发生变化的节点编号
+        :return: None
+        """
+        for u in nodes:
+            self.update_vertex(u)
+
+if __name__ == '__main__':
+    from pp import write_path_shp
+    with open('output/汤山/汤山map.bin', 'rb') as f:
+        map = pickle.load(f)
+    graph = CompiledMap.compile(map)
+    start = graph.node_ids[h3.geo_to_h3(31.989187, 118.990892, 13)]
+    end = graph.node_ids[h3.geo_to_h3(31.996765, 118.982489, 13)]
+    planner = DStarLite(graph, start, end)
+    cost, path = planner.compute_path()
+    print(f"首次规划: 代价 {cost:.6f}, 扩展节点数 {planner.expanded}")
+    # 路径中段出现积水，封闭后增量修复
+    blocked = {graph.h3_indexes[i]: float("inf") for i in path[len(path) // 2 - 2:len(path) // 2 + 2]}
+    planner.apply_changes(blocked)
+    cost, path = planner.compute_path()
+    print(f"增量重规划: 代价 {cost:.6f}, 扩展节点数 {planner.expanded}")
+    write_path_shp(graph.path_points(path), 'output/汤山/规划路径_dstar.shp')
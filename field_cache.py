@@ -0,0 +1,106 @@
+import pickle
+import h3
+from collections import OrderedDict
+from compiled_map import CompiledMap
+from cost_field import CostField
+
+class FieldCache:
+    """
+    热门终点的到达代价场缓存
+    以终点为根做反向Dijkstra，得到全图到该终点的最短路树；之后到该终点的查询只需沿父节点走到终点，
+    耗时与路径长度成正比。缓存键为 (地图版本, 代价配置, 终点)，按LRU在内存预算内淘汰
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        """
+        :param max_bytes: 内存预算(字节)
+        """
+        self.max_bytes = max_bytes
+        self.fields = OrderedDict()     # 键 -> CostField，末尾为最近使用
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.fields)
+
+    def key(graph, destination):
+        return (graph.version, graph.profile, destination)
+
+    def get(self, graph, destination):
+        """
+        获取到终点的代价场，未命中时计算并放入缓存
+        :param graph: CompiledMap对象
+        :param destination: 终点节点编号
+        :return: CostField对象(reverse)
+        """
+        key = FieldCache.key(graph, destination)
+        field = self.fields.get(key)
+        if field is not None:
+            self.hits += 1
+            self.fields.move_to_end(key)
+            return field
+        self.misses += 1
+        field = CostField.compute(graph, [destination], reverse=True)
+        self.put(key, field)
+        return field
+
+    def put(self, key, field):
+        """
+        放入缓存，超出内存预算时淘汰最久未使用的代价场
+        """
+        if key in self.fields:
+            self.nbytes -= self.fields.pop(key).nbytes()
+        self.fields[key] = field
+        self.nbytes += field.nbytes()
+        while self.nbytes > self.max_bytes and len(self.fields) > 1:
+            _, evicted = self.fields.popitem(last=False)
+            self.nbytes -= evicted.nbytes()
+            self.evictions += 1
+
+    def query(self, graph, source, destination):
+        """
+        点对点查询
+        :param graph: CompiledMap对象
+        :param source: 起点节点编号
+        :param destination: 终点节点编号
+        :return: (代价, 节点编号列表)，不可达时返回 (inf, [])
+        """
+        field = self.get(graph, destination)
+        return float(field.cost[source]), field.path_to(source)
+
+    def invalidate(self, graph=None):
+        """
+        清除缓存，地图版本变化后旧键不会再命中，调用此函数可提前释放内存
+        :param graph: 只保留该地图当前版本的代价场，None表示全部清除
+        :return: None
+        """
+        for key in list(self.fields):
+            if graph is None or key[0] != graph.version:
+                self.nbytes -= self.fields.pop(key).nbytes()
+
+    def stats(self):
+        """
+        命中统计
+        :return: dict
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self.fields),
+            "bytes": self.nbytes,
+        }
+
+if __name__ == '__main__':
+    with open('output/汤山/汤山map.bin', 'rb') as f:
+        map = pickle.load(f)
+    graph = CompiledMap.compile(map)
+    cache = FieldCache()
+    depot = graph.node_ids[h3.geo_to_h3(31.996765, 118.982489, 13)]
+    for lat, lon in [(31.989187, 118.990892), (31.990512, 118.987731), (31.993480, 118.985120)]:
+        cost, path = cache.query(graph, graph.node_ids[h3.geo_to_h3(lat, lon, 13)], depot)
+        print(f"代价 {cost:.6f}, 节点数 {len(path)}")
+    print(cache.stats())
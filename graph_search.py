@@ -0,0 +1,281 @@
+import heapq
+import time
+import numpy as np
+from compiled_map import CompiledMap
+
+class GraphSearch:
+    """
+    基于CompiledMap节点编号的最短路搜索
+    """
+
+    def dijkstra(graph, sources, allowed=None, targets=None, reverse=False, overlay=None, max_cost=None):
+        """
+        Dijkstra搜索
+        :param graph: CompiledMap对象
+        :param sources: 起点节点编号列表
+        :param allowed: 允许扩展的节点集合，None表示整张图
+        :param targets: 目标节点集合，全部确定后提前结束，None表示搜完
+        :param reverse: 是否在反向图上搜索(得到各节点到sources的代价)
+        :param overlay: 地图覆盖层(MapOverlay对象)
+        :param max_cost: 代价上界，超过上界的节点不再扩展，None表示不限
+        :return: (dist, father) 两个字典，键为节点编号
+        """
+        adjacency = graph.adjacency(reverse)
+        scale = overlay.node_scale(graph) if overlay is not None else {}
+        dist = {}
+        father = {}
+        heap = []
+        for source in sources:
+            dist[source] = 0.0
+            father[source] = None
+            heap.append((0.0, source))
+        heapq.heapify(heap)
+        settled = set()
+        remaining = set(targets) if targets is not None else None
+        while heap:
+            d, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            if max_cost is not None and d > max_cost:
+                break
+            settled.add(u)
+            if remaining is not None:
+                remaining.discard(u)
+                if not remaining:
+                    break
+            for v, cost in adjacency[u]:
+                if allowed is not None and v not in allowed:
+                    continue
+                if scale:
+                    # 倍率作用于进入的cell，反向图中边 u->v 对应原图 v->u
+                    cost *= scale.get(u if reverse else v, 1.0)
+                nd = d + cost
+                if nd < dist.get(v, float("inf")):
+                    dist[v] = nd
+                    father[v] = u
+                    heapq.heappush(heap, (nd, v))
+        return dist, father
+
+    def many_to_many(graph, sources, targets, max_cost=None):
+        """
+        多对多代价矩阵：每个起点做一次多目标Dijkstra，全部目标确定(或超过代价上界)后提前结束
+        各起点复用同一块距离数组，只重置上一次搜索触及的节点
+        :param graph: CompiledMap对象
+        :param sources: 起点节点编号列表
+        :param targets: 终点节点编号列表
+        :param max_cost: 代价上界，超过上界视为不可达
+        :return: len(sources)×len(targets) 的float32矩阵，不可达为inf
+        """
+        adjacency = graph.adjacency()
+        # 共享内存映射的地图直接按行读取数组，不经过邻接表视图生成 (邻居, 代价) 元组
+        neighbors, edge_cost = (graph.neighbors, graph.edge_cost) if graph.shared else (None, None)
+        inf = float("inf")
+        dist = [inf] * len(graph)
+        settled = [False] * len(graph)
+        columns = {}                    # 终点节点编号 -> 矩阵列号列表(终点可重复)
+        for column, target in enumerate(targets):
+            columns.setdefault(target, []).append(column)
+        matrix = np.full((len(sources), len(targets)), np.inf, dtype=np.float32)
+        for row, source in enumerate(sources):
+            touched = [source]
+            dist[source] = 0.0
+            heap = [(0.0, source)]
+            remaining = len(columns)
+            while heap and remaining:
+                d, u = heapq.heappop(heap)
+                if settled[u]:
+                    continue
+                if max_cost is not None and d > max_cost:
+                    break
+                settled[u] = True
+                if u in columns:
+                    matrix[row, columns[u]] = d
+                    remaining -= 1
+                # 空位-1在行末，不可通行边代价为inf，不会更新距离
+                for v, cost in zip(neighbors[u].tolist(), edge_cost[u].tolist()) if neighbors is not None else adjacency[u]:
+                    if v < 0:
+                        break
+                    nd = d + cost
+                    if nd < dist[v]:
+                        if dist[v] == inf:
+                            touched.append(v)
+                        dist[v] = nd
+                        heapq.heappush(heap, (nd, v))
+            for u in touched:
+                dist[u] = inf
+                settled[u] = False
+        return matrix
+
+    def heuristic(graph, target, landmarks=None, overlay=None):
+        """
+        生成到终点的启发函数：格心球面距离，存在地标表时取其与地标下界的较大值
+        :param graph: CompiledMap对象
+        :param target: 终点节点编号
+        :param landmarks: Landmarks对象，None表示使用graph.landmarks(若有)
+        :param overlay: 地图覆盖层(MapOverlay对象)，含降低代价的覆盖项时不使用地标表
+        :return: 函数 h(节点编号) -> 启发值
+        """
+        if landmarks is None:
+            landmarks = getattr(graph, "landmarks", None)
+        if overlay is not None and not overlay.is_monotone():
+            landmarks = None
+        if landmarks is None:
+            return lambda i: graph.heuristic_dist(i, target)
+        bound = landmarks.target_bound(target)
+        return lambda i: max(graph.heuristic_dist(i, target), bound(i))
+
+    def astar(graph, source, target, allowed=None, landmarks=None, stats=None, overlay=None, epsilon=1.0):
+        """
+        A*搜索，启发值见GraphSearch.heuristic
+        :param graph: CompiledMap对象
+        :param source: 起点节点编号
+        :param target: 终点节点编号
+        :param allowed: 允许扩展的节点集合，None表示整张图
+        :param landmarks: Landmarks对象，None表示使用graph.landmarks(若有)
+        :param stats: 可选字典，写入扩展节点数 stats["expanded"] 与次优界 stats["bound"]
+        :param overlay: 地图覆盖层(MapOverlay对象)
+        :param epsilon: 启发值权重 f = g + epsilon * h，返回代价不超过最优代价的epsilon倍
+        :return: (代价, 节点编号列表)，不可达时返回 (inf, [])
+        """
+        adjacency = graph.adjacency()
+        scale = overlay.node_scale(graph) if overlay is not None else {}
+        h = GraphSearch.heuristic(graph, target, landmarks, overlay)
+        g = {source: 0.0}
+        father = {source: None}
+        heap = [(epsilon * h(source), source)]
+        closed = set()
+        improved = {}       # 加权搜索中找到更短路径的已关闭节点 -> 更小的g值，只用于计算次优界
+        while heap:
+            _, u = heapq.heappop(heap)
+            if u == target:
+                break
+            if u in closed:
+                continue
+            closed.add(u)
+            for v, cost in adjacency[u]:
+                if allowed is not None and v not in allowed:
+                    continue
+                if scale:
+                    cost *= scale.get(v, 1.0)
+                ng = g[u] + cost
+                if ng < g.get(v, float("inf")):
+                    if epsilon != 1.0 and v in closed:
+                        # 加权搜索不重新打开，也不改写g值与父节点，返回的代价与路径保持一致
+                        improved[v] = min(ng, improved.get(v, float("inf")))
+                        continue
+                    g[v] = ng
+                    father[v] = u
+                    closed.discard(v)   # 地标下界存在舍入扣除，允许极少量的重新打开
+                    heapq.heappush(heap, (ng + epsilon * h(v), v))
+        if stats is not None:
+            stats["expanded"] = len(closed)
+            if epsilon != 1.0:
+                # 与ARA*相同，改进过的已关闭节点作为不一致节点参与下界计算
+                stats["bound"] = min(epsilon, GraphSearch.suboptimality({**g, **improved}, heap, improved, target, h))
+            else:
+                stats["bound"] = 1.0
+        if target not in g:
+            return float("inf"), []
+        return g[target], GraphSearch.trace_path(father, target)
+
+    def suboptimality(g, heap, incons, target, h):
+        """
+        由开放表计算当前解的次优界：代价 / min(g + h)，后者是最优代价的下界
+        :param g: g值字典
+        :param heap: 开放表，元素为 (键值, 节点编号)，可含失效项
+        :param incons: 不一致节点集合
+        :param target: 终点节点编号
+        :param h: 启发函数
+        :return: 次优界，>= 1
+        """
+        cost = g.get(target, float("inf"))
+        if cost == float("inf"):
+            return float("inf")
+        lower = cost
+        for u in set(u for _, u in heap) | set(incons):
+            lower = min(lower, g[u] + h(u))
+        if lower <= 0:
+            return 1.0 if cost == 0 else float("inf")
+        return max(cost / lower, 1.0)
+
+    def ara(graph, source, target, epsilon=3.0, step=0.5, time_budget=None, landmarks=None, overlay=None):
+        """
+        ARA*(Anytime Repairing A*)：先以较大的启发值权重快速给出一条路径，
+        然后逐步减小权重并复用已有搜索结果改进路径，直到证明最优或超出时间预算
+        :param graph: CompiledMap对象
+        :param source: 起点节点编号
+        :param target: 终点节点编号
+        :param epsilon: 初始启发值权重
+        :param step: 每轮权重的减小量
+        :param time_budget: 时间预算(秒)，None表示不限时
+        :param landmarks: Landmarks对象，None表示使用graph.landmarks(若有)
+        :param overlay: 地图覆盖层(MapOverlay对象)
+        :return: 生成器，代价或次优界改进时产出 (代价, 节点编号列表, 次优界)，次优界为1时已是最优
+        """
+        deadline = time.monotonic() + time_budget if time_budget is not None else None
+        adjacency = graph.adjacency()
+        scale = overlay.node_scale(graph) if overlay is not None else {}
+        h = GraphSearch.heuristic(graph, target, landmarks, overlay)
+        g = {source: 0.0}
+        father = {source: None}
+        keys = {source: epsilon * h(source)}      # 开放表中节点的有效键值
+        heap = [(keys[source], source)]
+        closed = set()
+        incons = set()
+        last = None
+        while True:
+            # 改进路径
+            while heap:
+                if deadline is not None and time.monotonic() > deadline:
+                    return
+                key, u = heap[0]
+                if keys.get(u) != key:
+                    heapq.heappop(heap)
+                    continue
+                if g.get(target, float("inf")) <= key:
+                    break
+                heapq.heappop(heap)
+                del keys[u]
+                closed.add(u)
+                for v, cost in adjacency[u]:
+                    if scale:
+                        cost *= scale.get(v, 1.0)
+                    ng = g[u] + cost
+                    if ng < g.get(v, float("inf")):
+                        g[v] = ng
+                        father[v] = u
+                        if v in closed:
+                            incons.add(v)
+                        else:
+                            keys[v] = ng + epsilon * h(v)
+                            heapq.heappush(heap, (keys[v], v))
+            if target not in g:
+                return
+            open_nodes = [(key, u) for u, key in keys.items()]
+            bound = min(epsilon, GraphSearch.suboptimality(g, open_nodes, incons, target, h))
+            if (g[target], bound) != last:
+                last = (g[target], bound)
+                yield g[target], GraphSearch.trace_path(father, target), bound
+            if bound <= 1.0:
+                return
+            # 减小权重，不一致节点并入开放表后重新计算键值
+            epsilon = max(1.0, epsilon - step)
+            keys = {u: g[u] + epsilon * h(u) for u in set(keys) | incons}
+            incons = set()
+            heap = [(key, u) for u, key in keys.items()]
+            heapq.heapify(heap)
+            closed = set()
+
+    def trace_path(father, node):
+        """
+        沿父节点回溯路径
+        :param father: 父节点字典
+        :param node: 路径末端节点编号
+        :return: 从起点到node的节点编号列表
+        """
+        path = []
+        while node is not None:
+            path.append(node)
+            node = father[node]
+        path.reverse()
+        return path
@@ -0,0 +1,295 @@
+import heapq
+import pickle
+import h3
+from compiled_map import CompiledMap
+from graph_search import GraphSearch
+
+class HierarchicalPlanner:
+    """
+    分层路径规划(HPA*)
+    以cluster_resolution分辨率的h3父cell为簇，预计算簇边界上的出入口(portal)以及簇内portal之间的代价；
+    查询时先在portal组成的抽象图上规划，再只在途经的簇内细化路径
+    """
+    def __init__(self, graph, cluster_resolution=9, max_entrance_width=6):
+        """
+        :param graph: CompiledMap对象
+        :param cluster_resolution: 簇的h3分辨率
+        :param max_entrance_width: 出入口宽度超过该cell数时，在两端额外设置portal
+        """
+        self.graph = graph
+        self.cluster_resolution = cluster_resolution
+        self.max_entrance_width = max_entrance_width
+        self.node_cluster = []          # 节点编号 -> 簇索引
+        self.node_component = []        # 节点编号 -> 簇内连通分量编号(分量中最小的节点编号)
+        self.clusters = {}              # 簇索引 -> 簇内节点编号集合
+        self.cluster_neighbors = {}     # 簇索引 -> 相邻簇索引集合
+        self.entrances = {}             # (簇a, 簇b) -> [(a侧portal, b侧portal), ...]，a < b
+        self.portals = {}               # 簇索引 -> portal节点编号集合
+        self.intra_edges = {}           # 簇索引 -> {portal: [(portal, 簇内代价), ...]}
+        self.inter_edges = {}           # portal -> {相邻簇的portal: 边代价}
+
+    def get_cluster(self, h3_index):
+        """
+        获取cell所属的簇，比簇分辨率更粗的cell自成一簇
+        """
+        if h3.h3_get_resolution(h3_index) <= self.cluster_resolution:
+            return h3_index
+        return h3.h3_to_parent(h3_index, self.cluster_resolution)
+
+    def build(self):
+        """
+        全量预处理
+        :return: self
+        """
+        from tqdm import tqdm
+
+        graph = self.graph
+        self.node_cluster = [self.get_cluster(index) for index in graph.h3_indexes]
+        self.clusters = {}
+        self.cluster_neighbors = {}
+        for i, cluster in enumerate(self.node_cluster):
+            self.clusters.setdefault(cluster, set()).add(i)
+            self.cluster_neighbors.setdefault(cluster, set())
+        for i, j in zip(*(graph.neighbors >= 0).nonzero()):
+            a, b = self.node_cluster[i], self.node_cluster[graph.neighbors[i, j]]
+            if a != b:
+                self.cluster_neighbors[a].add(b)
+        self.node_component = list(range(len(graph.h3_indexes)))
+        for cluster in self.clusters:
+            self.build_components(cluster)
+        self.entrances = {}
+        self.inter_edges = {}
+        for a in tqdm(self.clusters, desc="计算簇出入口: "):
+            for b in self.cluster_neighbors[a]:
+                if a < b:
+                    self.build_entrances(a, b)
+        for cluster in tqdm(self.clusters, desc="计算簇内代价: "):
+            self.build_intra(cluster)
+        return self
+
+    def update(self, nodes):
+        """
+        部分节点的边代价变化后增量更新，只重算涉及的簇及其相邻簇
+        :param nodes: 边代价发生变化的节点编号，一般为CompiledMap.update_cells的返回值
+        :return: 重算的簇集合
+        """
+        changed = {self.node_cluster[i] for i in nodes}
+        for a in changed:
+            self.build_components(a)
+        for a in changed:
+            for b in self.cluster_neighbors[a]:
+                self.build_entrances(min(a, b), max(a, b))
+        # 相邻簇的portal可能随出入口变化，一并重算簇内代价
+        rebuilt = set(changed)
+        for a in changed:
+            rebuilt.update(self.cluster_neighbors[a])
+        for cluster in rebuilt:
+            self.build_intra(cluster)
+        return rebuilt
+
+    def edge_cost(self, i, j):
+        """
+        相邻节点i->j的边代价
+        """
+        graph = self.graph
+        for k, neighbor in enumerate(graph.neighbors[i]):
+            if neighbor == j:
+                return float(graph.edge_cost[i, k])
+        return float("inf")
+
+    def build_components(self, cluster):
+        """
+        计算簇内的连通分量：簇内双向都可通行的边相连的节点属于同一分量，水体等只能驶出的cell自成一个分量
+        :param cluster: 簇索引
+        :return: None
+        """
+        graph = self.graph
+        members = self.clusters[cluster]
+        visited = set()
+        for origin in sorted(members):
+            if origin in visited:
+                continue
+            visited.add(origin)
+            self.node_component[origin] = origin
+            stack = [origin]
+            while stack:
+                u = stack.pop()
+                for k, v in enumerate(graph.neighbors[u]):
+                    if v < 0:
+                        break
+                    v = int(v)
+                    if v in visited or v not in members or graph.edge_cost[u, k] == float("inf") or \
+                            self.edge_cost(v, u) == float("inf"):
+                        continue
+                    visited.add(v)
+                    self.node_component[v] = origin
+                    stack.append(v)
+
+    def build_entrances(self, a, b):
+        """
+        计算簇a与簇b之间的出入口
+        边界上连续、且两侧分别属于同一对簇内连通分量的可通行cell构成一个出入口，
+        每个出入口取中点(过宽时再加两端)作为portal；被水体等分隔开的簇的每一部分都有各自的portal
+        :param a: 簇索引
+        :param b: 簇索引，a < b
+        :return: None
+        """
+        graph = self.graph
+        for u, v in self.entrances.pop((a, b), []):
+            self.inter_edges.get(u, {}).pop(v, None)
+            self.inter_edges.get(v, {}).pop(u, None)
+
+        # (a侧分量, b侧分量) -> {a侧边界节点: b侧可通行的对应节点}
+        partners = {}
+        for u in self.clusters[a]:
+            for k, v in enumerate(graph.neighbors[u]):
+                if v < 0:
+                    break
+                v = int(v)
+                if self.node_cluster[v] != b:
+                    continue
+                if graph.edge_cost[u, k] < float("inf") or self.edge_cost(v, u) < float("inf"):
+                    partners.setdefault((self.node_component[u], self.node_component[v]), {}).setdefault(u, v)
+
+        pairs = []
+        for partner in partners.values():
+            unvisited = set(partner)
+            while unvisited:
+                # 沿边界找出一个连续的出入口
+                segment = self.entrance_segment(unvisited.pop(), partner)
+                unvisited.difference_update(segment)
+                chosen = {segment[len(segment) // 2]}
+                if len(segment) > self.max_entrance_width:
+                    chosen.update((segment[0], segment[-1]))
+                pairs.extend((u, partner[u]) for u in chosen)
+
+        self.entrances[(a, b)] = pairs
+        for u, v in pairs:
+            for x, y in ((u, v), (v, u)):
+                cost = self.edge_cost(x, y)
+                if cost < float("inf"):
+                    self.inter_edges.setdefault(x, {})[y] = cost
+
+    def entrance_segment(self, start, partner):
+        """
+        从边界节点start出发找出其所在的连续出入口，并按沿边界的顺序排列
+        :param start: 边界节点编号
+        :param partner: 边界节点集合(字典的键)
+        :return: 节点编号列表
+        """
+        neighbors = self.graph.neighbors
+
+        def bfs(origin):
+            order = [origin]
+            visited = {origin}
+            for u in order:
+                for v in neighbors[u]:
+                    v = int(v)
+                    if v >= 0 and v in partner and v not in visited:
+                        visited.add(v)
+                        order.append(v)
+            return order
+
+        # 两次广度优先搜索：第一次找到一端，第二次从该端点出发得到沿边界的顺序
+        return bfs(bfs(start)[-1])
+
+    def build_intra(self, cluster):
+        """
+        计算簇内portal两两之间的代价
+        :param cluster: 簇索引
+        :return: None
+        """
+        portals = set()
+        for neighbor in self.cluster_neighbors[cluster]:
+            key = (min(cluster, neighbor), max(cluster, neighbor))
+            for u, v in self.entrances.get(key, []):
+                portals.add(u if self.node_cluster[u] == cluster else v)
+        self.portals[cluster] = portals
+        edges = {}
+        for portal in portals:
+            dist, _ = GraphSearch.dijkstra(self.graph, [portal], allowed=self.clusters[cluster], targets=portals)
+            edges[portal] = [(q, dist[q]) for q in portals if q != portal and q in dist]
+        self.intra_edges[cluster] = edges
+
+    def find_path(self, source, target):
+        """
+        分层路径规划，抽象图上不可达时退回整张图上的A*
+        :param source: 起点节点编号
+        :param target: 终点节点编号
+        :return: (代价, 节点编号列表)，不可达时返回 (inf, [])
+        """
+        graph = self.graph
+        if source == target:
+            return 0.0, [source]
+        cs, ct = self.node_cluster[source], self.node_cluster[target]
+
+        # 将起终点临时接入抽象图
+        goals = self.portals[cs] | {target} if cs == ct else self.portals[cs]
+        dist, _ = GraphSearch.dijkstra(graph, [source], allowed=self.clusters[cs], targets=goals)
+        start_edges = [(p, dist[p]) for p in goals if p in dist and p != source]
+        dist, _ = GraphSearch.dijkstra(graph, [target], allowed=self.clusters[ct], targets=self.portals[ct], reverse=True)
+        end_edges = {p: d for p, d in dist.items() if p in self.portals[ct]}
+
+        # 抽象图上的A*
+        g = {source: 0.0}
+        father = {source: None}
+        heap = [(graph.heuristic_dist(source, target), source)]
+        closed = set()
+        while heap:
+            _, u = heapq.heappop(heap)
+            if u == target:
+                break
+            if u in closed:
+                continue
+            closed.add(u)
+            if u == source:
+                edges = list(start_edges)
+                edges.extend(self.inter_edges.get(u, {}).items())
+            else:
+                edges = list(self.intra_edges[self.node_cluster[u]].get(u, []))
+                edges.extend(self.inter_edges.get(u, {}).items())
+            if u in end_edges:
+                edges.append((target, end_edges[u]))
+            for v, cost in edges:
+                ng = g[u] + cost
+                if ng < g.get(v, float("inf")):
+                    g[v] = ng
+                    father[v] = u
+                    heapq.heappush(heap, (ng + graph.heuristic_dist(v, target), v))
+        if target not in g:
+            # 只能单向通行的边等情况下portal未必覆盖全部连通关系，退回整张图上的搜索
+            return GraphSearch.astar(graph, source, target)
+
+        # 只在途经的簇内细化路径
+        abstract_path = GraphSearch.trace_path(father, target)
+        path = [source]
+        for a, b in zip(abstract_path, abstract_path[1:]):
+            cluster = self.node_cluster[a]
+            if cluster == self.node_cluster[b]:
+                _, segment = GraphSearch.astar(graph, a, b, allowed=self.clusters[cluster])
+                path.extend(segment[1:])
+            else:
+                path.append(b)
+        return g[target], path
+
+    def find_path_by_index(self, start_index, end_index):
+        """
+        以h3索引为起终点的分层路径规划
+        :return: (代价, h3索引列表)
+        """
+        graph = self.graph
+        cost, path = self.find_path(graph.node_ids[start_index], graph.node_ids[end_index])
+        return cost, [graph.h3_indexes[i] for i in path]
+
+if __name__ == '__main__':
+    from pp import write_path_shp
+    with open('output/汤山/汤山map.bin', 'rb') as f:
+        map = pickle.load(f)
+    graph = CompiledMap.compile(map)
+    planner = HierarchicalPlanner(graph, cluster_resolution=9).build()
+    with open('output/汤山/汤山hpa.bin', 'wb') as f:
+        pickle.dump(planner, f)
+    start = graph.node_ids[h3.geo_to_h3(31.989187, 118.990892, 13)]
+    end = graph.node_ids[h3.geo_to_h3(31.996765, 118.982489, 13)]
+    cost, path = planner.find_path(start, end)
+    write_path_shp(graph.path_points(path), 'output/汤山/规划路径_hpa.shp')
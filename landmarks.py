@@ -0,0 +1,213 @@
+import os
+import pickle
+import hashlib
+import h3
+import numpy as np
+from compiled_map import CompiledMap
+from graph_search import GraphSearch
+
+class Landmarks:
+    """
+    ALT(A*, Landmarks, Triangle inequality)启发值
+    预先选取K个地标并保存每个节点到地标、地标到每个节点的精确代价，
+    由三角不等式得到比格心球面距离更紧的代价下界
+    """
+    def __init__(self, h3_indexes, landmarks, from_landmark, to_landmark, map_version=None, digest=None):
+        """
+        :param h3_indexes: 节点编号 -> h3索引，与CompiledMap一致，也可以是整数形式的uint64数组
+        :param landmarks: 地标节点编号列表
+        :param from_landmark: N×K 地标到节点的代价，不可达为inf
+        :param to_landmark: N×K 节点到地标的代价，不可达为inf
+        :param map_version: 计算地标时地图对象的版本号(Map.version)，None表示未知
+        :param digest: 计算地标时边代价的摘要，见Landmarks.digest，None表示未知
+        """
+        if isinstance(h3_indexes, np.ndarray):
+            self._h3_ints = h3_indexes     # 整数形式，h3索引表与反查字典在首次访问时生成
+        else:
+            self.h3_indexes = h3_indexes
+            self.node_ids = {index: i for i, index in enumerate(h3_indexes)}
+        self.landmarks = landmarks
+        self.from_landmark = from_landmark
+        self.to_landmark = to_landmark
+        self.map_version = map_version
+        self.digest = digest
+
+    def __getattr__(self, name):
+        # 按节点编号搜索的进程用不到h3索引，读取时不生成
+        if name in ("h3_indexes", "node_ids") and self.__dict__.get("_h3_ints") is not None:
+            self.h3_indexes = [h3.h3_to_string(index) for index in self._h3_ints.tolist()]
+            self.node_ids = {index: i for i, index in enumerate(self.h3_indexes)}
+            return self.__dict__[name]
+        raise AttributeError(name)
+
+    def digest(graph):
+        """
+        编译地图的节点与边代价摘要，地标表只对摘要相同的地图是可采纳的下界
+        :param graph: CompiledMap对象
+        :return: 十六进制字符串
+        """
+        sha1 = hashlib.sha1()
+        sha1.update(np.ascontiguousarray(graph.h3_ints(), dtype=np.uint64).tobytes())
+        sha1.update(np.ascontiguousarray(graph.neighbors, dtype=np.int32).tobytes())
+        sha1.update(np.ascontiguousarray(graph.edge_cost, dtype=np.float64).tobytes())
+        return sha1.hexdigest()
+
+    def matches_map(self, map):
+        """
+        地标表是否按该地图对象的当前版本计算
+        :param map: 地图对象
+        :return: bool
+        """
+        return self.map_version is not None and self.map_version == getattr(map, "version", None)
+
+    def matches_graph(self, graph):
+        """
+        地标表是否按该编译地图的当前边代价计算
+        :param graph: CompiledMap对象
+        :return: bool
+        """
+        return self.digest is not None and self.digest == Landmarks.digest(graph)
+
+    def build(graph, k=16):
+        """
+        最远点法选取地标，并对每个地标做一次正向、一次反向Dijkstra
+        :param graph: CompiledMap对象
+        :param k: 地标个数
+        :return: Landmarks对象
+        """
+        from tqdm import tqdm
+
+        n = len(graph)
+        k = min(k, n)
+        from_landmark = np.full((n, k), np.inf, dtype=np.float32)
+        to_landmark = np.full((n, k), np.inf, dtype=np.float32)
+        nearest = np.full(n, np.inf)        # 每个节点到已选地标的最小代价
+        landmarks = []
+        # 第一个地标取离任意节点最远的节点
+        dist, _ = GraphSearch.dijkstra(graph, [0])
+        landmark = max(dist, key=dist.get)
+        for column in tqdm(range(k), desc="计算地标: "):
+            landmarks.append(landmark)
+            for reverse, table in ((False, from_landmark), (True, to_landmark)):
+                dist, _ = GraphSearch.dijkstra(graph, [landmark], reverse=reverse)
+                nodes = np.fromiter(dist.keys(), dtype=np.int64, count=len(dist))
+                table[nodes, column] = np.fromiter(dist.values(), dtype=np.float64, count=len(dist))
+            # 下一个地标取离已选地标最远的可达节点
+            nearest = np.minimum(nearest, from_landmark[:, column])
+            candidates = np.where(np.isfinite(nearest), nearest, -1.0)
+            candidates[landmarks] = -1.0
+            landmark = int(np.argmax(candidates))
+            if candidates[landmark] <= 0:
+                # 剩余节点均不可达，从另一个连通区域里选
+                unreached = np.flatnonzero(np.isinf(nearest))
+                if len(unreached) == 0:
+                    break
+                landmark = int(unreached[0])
+        return Landmarks(list(graph.h3_indexes), landmarks, from_landmark[:, :len(landmarks)], to_landmark[:, :len(landmarks)],
+                         map_version=graph.map_version, digest=Landmarks.digest(graph))
+
+    def target_bound(self, target):
+        """
+        生成到固定终点的下界函数
+        d(v,t) >= d(v,L) - d(t,L) 且 d(v,t) >= d(L,t) - d(L,v)
+        :param target: 终点节点编号
+        :return: 函数 h(节点编号) -> 下界
+        """
+        to_target = self.to_landmark[target].astype(np.float64)
+        from_target = self.from_landmark[target].astype(np.float64)
+
+        def bound(i):
+            to_node = self.to_landmark[i].astype(np.float64)
+            from_node = self.from_landmark[i].astype(np.float64)
+            with np.errstate(invalid="ignore"):
+                diff = np.concatenate((to_node - to_target, from_target - from_node))
+                # float32存储带来的舍入误差按两项之和的相对量扣除，保证下界可采纳
+                scale = np.concatenate((to_node + to_target, from_target + from_node))
+            diff -= 1e-6 * np.where(np.isfinite(scale), scale, 0.0)
+            diff = diff[~np.isnan(diff)]    # inf-inf 没有约束
+            if len(diff) == 0:
+                return 0.0
+            return max(float(diff.max()), 0.0)
+        return bound
+
+    def source_bound(self, source):
+        """
+        生成从固定起点出发的下界函数，供反向搜索使用
+        d(s,v) >= d(L,v) - d(L,s) 且 d(s,v) >= d(s,L) - d(v,L)
+        :param source: 起点节点编号
+        :return: 函数 h(节点编号) -> 下界
+        """
+        from_source = self.from_landmark[source].astype(np.float64)
+        to_source = self.to_landmark[source].astype(np.float64)
+
+        def bound(i):
+            from_node = self.from_landmark[i].astype(np.float64)
+            to_node = self.to_landmark[i].astype(np.float64)
+            with np.errstate(invalid="ignore"):
+                diff = np.concatenate((from_node - from_source, to_source - to_node))
+                scale = np.concatenate((from_node + from_source, to_source + to_node))
+            diff -= 1e-6 * np.where(np.isfinite(scale), scale, 0.0)
+            diff = diff[~np.isnan(diff)]
+            if len(diff) == 0:
+                return 0.0
+            return max(float(diff.max()), 0.0)
+        return bound
+
+    def save(self, path):
+        """
+        保存地标表
+        :param path: .npz文件路径
+        :return: None
+        """
+        arrays = {}
+        if self.map_version is not None:
+            arrays["map_version"] = np.array(self.map_version, dtype=np.int64)
+        if self.digest is not None:
+            arrays["digest"] = np.array(self.digest)
+        if self.__dict__.get("_h3_ints") is not None:
+            h3_ints = self._h3_ints
+        else:
+            h3_ints = np.array([h3.string_to_h3(index) for index in self.h3_indexes], dtype=np.uint64)
+        np.savez(path,
+                 h3_indexes=h3_ints,
+                 landmarks=np.array(self.landmarks, dtype=np.int64),
+                 from_landmark=self.from_landmark,
+                 to_landmark=self.to_landmark,
+                 **arrays)
+
+    def load(path):
+        """
+        读取地标表，旧版本保存的文件没有地图版本号与边代价摘要，读取后不会被自动使用
+        :param path: .npz文件路径
+        :return: Landmarks对象
+        """
+        with np.load(path) as data:
+            h3_indexes = data["h3_indexes"]
+            map_version = int(data["map_version"]) if "map_version" in data.files else None
+            digest = str(data["digest"]) if "digest" in data.files else None
+            return Landmarks(h3_indexes, data["landmarks"].tolist(), data["from_landmark"], data["to_landmark"],
+                             map_version=map_version, digest=digest)
+
+    def sidecar_path(map_path):
+        """
+        地图文件对应的地标表路径，如 汤山map.bin -> 汤山map.landmarks.npz
+        """
+        return os.path.splitext(map_path)[0] + ".landmarks.npz"
+
+if __name__ == '__main__':
+    map_path = 'output/汤山/汤山map.bin'
+    with open(map_path, 'rb') as f:
+        map = pickle.load(f)
+    graph = CompiledMap.compile(map)
+    landmarks = Landmarks.build(graph, k=16)
+    landmarks.save(Landmarks.sidecar_path(map_path))
+
+    # 对比地标启发值与格心距离启发值的扩展节点数
+    start = graph.node_ids[h3.geo_to_h3(31.989187, 118.990892, 13)]
+    end = graph.node_ids[h3.geo_to_h3(31.996765, 118.982489, 13)]
+    plain, alt = {}, {}
+    GraphSearch.astar(graph, start, end, stats=plain)
+    graph.landmarks = landmarks
+    GraphSearch.astar(graph, start, end, stats=alt)
+    print(f"扩展节点数: 格心距离 {plain['expanded']} -> 地标 {alt['expanded']}"
+          f" (减少 {1 - alt['expanded'] / max(plain['expanded'], 1):.1%})")
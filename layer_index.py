@@ -0,0 +1,195 @@
+import os
+import h3
+import numpy as np
+from pp_enum import *
+from cost_profile import CostProfile
+
+# 建立排序索引的数值层
+VALUE_LAYERS = ["elevation", "slope", "cv", "relief", "roughness", "curvature", "exposure"]
+
+class LayerIndex:
+    """
+    属性倒排索引
+    地表覆盖类别与道路类型存为位图(长度为N的布尔数组)，数值层存为按值排序的 (值, 节点编号) 数组，
+    范围查询为两次二分查找；查询结果都是布尔数组，可直接用 & | ~ 组合，再由select()转为节点编号
+    例：index.select(index.range("relief", low=20) & ~index.landcover("water"))
+    """
+    def __init__(self, h3_indexes, bitmaps, sorted_values, sorted_ids, map_version=None):
+        """
+        :param h3_indexes: 节点编号 -> h3索引，与CompiledMap一致
+        :param bitmaps: 类别名 -> 长度为N的布尔数组，类别名为"landcover:water"、"road:normalway"的形式
+        :param sorted_values: 层名 -> 升序的值数组(不含NaN)
+        :param sorted_ids: 层名 -> 与sorted_values对应的节点编号数组
+        :param map_version: 建立索引时地图对象的版本号(Map.version)，None表示未知
+        """
+        self.h3_indexes = h3_indexes
+        self.bitmaps = bitmaps
+        self.sorted_values = sorted_values
+        self.sorted_ids = sorted_ids
+        self.map_version = map_version
+
+    def __len__(self):
+        return len(self.h3_indexes)
+
+    def build(graph):
+        """
+        由CompiledMap的列式属性层建立索引，地图对象可先用CompiledMap.compile编译
+        :param graph: CompiledMap对象
+        :return: LayerIndex对象
+        """
+        landcover = np.asarray(graph.layers["landcover"])
+        road_type = np.asarray(graph.layers["road_type"])
+        bitmaps = {}
+        for member in AttributeIndex:
+            if member.value >= AttributeIndex.WATER.value and member is not AttributeIndex.ROAD:
+                name = member.name.lower()
+                bitmaps[f"landcover:{name}"] = (landcover & CostProfile.landcover_bit(name)) != 0
+        for member in RoadType:
+            bitmaps[f"road:{member.name.lower()}"] = road_type == member.value
+        sorted_values = {}
+        sorted_ids = {}
+        for name in VALUE_LAYERS:
+            if name not in graph.layers:
+                continue
+            values = np.asarray(graph.layers[name], dtype=np.float64)
+            ids = np.flatnonzero(~np.isnan(values))
+            order = np.argsort(values[ids], kind="stable")
+            sorted_ids[name] = ids[order].astype(np.int32)
+            sorted_values[name] = values[sorted_ids[name]]
+        return LayerIndex(list(graph.h3_indexes), bitmaps, sorted_values, sorted_ids, map_version=graph.map_version)
+
+    def matches_map(self, map):
+        """
+        索引是否按该地图对象的当前版本建立
+        :param map: 地图对象
+        :return: bool
+        """
+        return self.map_version is not None and self.map_version == getattr(map, "version", None)
+
+    def landcover(self, name):
+        """
+        含有某种地表覆盖的cell
+        :param name: 地表覆盖类别名，AttributeIndex成员名的小写，如"water"、"forest"
+        :return: 布尔数组
+        """
+        key = f"landcover:{name.lower()}"
+        if key not in self.bitmaps:
+            raise ValueError(f"未知的地表覆盖类别: {name}")
+        return self.bitmaps[key]
+
+    def road(self, name):
+        """
+        某种道路类型的cell
+        :param name: 道路类型名，RoadType成员名的小写，如"normalway"
+        :return: 布尔数组
+        """
+        key = f"road:{name.lower()}"
+        if key not in self.bitmaps:
+            raise ValueError(f"未知的道路类型: {name}")
+        return self.bitmaps[key]
+
+    def range_ids(self, name, low=None, high=None, inclusive=(True, True)):
+        """
+        数值层在 [low, high] 范围内的cell，按值升序，值未知(NaN)的cell不在结果中
+        :param name: 层名，见VALUE_LAYERS
+        :param low: 下界，None表示不限
+        :param high: 上界，None表示不限
+        :param inclusive: (是否包含下界, 是否包含上界)
+        :return: 节点编号数组
+        """
+        if name not in self.sorted_values:
+            raise ValueError(f"未建立索引的数值层: {name}")
+        values = self.sorted_values[name]
+        start = 0 if low is None else np.searchsorted(values, low, side="left" if inclusive[0] else "right")
+        end = len(values) if high is None else np.searchsorted(values, high, side="right" if inclusive[1] else "left")
+        return self.sorted_ids[name][start:max(start, end)]
+
+    def range(self, name, low=None, high=None, inclusive=(True, True)):
+        """
+        同range_ids，返回布尔数组以便与其他条件组合
+        """
+        mask = np.zeros(len(self.h3_indexes), dtype=bool)
+        mask[self.range_ids(name, low, high, inclusive)] = True
+        return mask
+
+    def known(self, name):
+        """
+        数值层已量化(值不是NaN)的cell，用于排查量化遗漏
+        :return: 布尔数组
+        """
+        return self.range(name)
+
+    def select(self, mask):
+        """
+        :param mask: 布尔数组(查询条件的组合)
+        :return: 升序的节点编号数组
+        """
+        return np.flatnonzero(mask).astype(np.int32)
+
+    def cells(self, ids):
+        """
+        节点编号转为h3索引
+        :param ids: 节点编号数组或布尔数组
+        :return: h3索引列表
+        """
+        ids = np.asarray(ids)
+        if ids.dtype == bool:
+            ids = np.flatnonzero(ids)
+        return [self.h3_indexes[i] for i in ids.tolist()]
+
+    def save(self, path):
+        """
+        保存到.npz文件，位图按位压缩
+        :param path: .npz文件路径
+        :return: None
+        """
+        arrays = {"h3_indexes": np.array([h3.string_to_h3(index) for index in self.h3_indexes], dtype=np.uint64)}
+        if self.map_version is not None:
+            arrays["map_version"] = np.array(self.map_version, dtype=np.int64)
+        for name, bitmap in self.bitmaps.items():
+            arrays[f"bitmap|{name}"] = np.packbits(bitmap)
+        for name in self.sorted_values:
+            arrays[f"values|{name}"] = self.sorted_values[name]
+            arrays[f"ids|{name}"] = self.sorted_ids[name]
+        np.savez(path, **arrays)
+
+    def load(path):
+        """
+        读取save保存的.npz文件，旧版本保存的文件没有地图版本号，读取后不会被load_map自动使用
+        :param path: .npz文件路径
+        :return: LayerIndex对象
+        """
+        with np.load(path) as data:
+            h3_indexes = [h3.h3_to_string(int(index)) for index in data["h3_indexes"]]
+            map_version = int(data["map_version"]) if "map_version" in data.files else None
+            n = len(h3_indexes)
+            bitmaps = {}
+            sorted_values = {}
+            sorted_ids = {}
+            for key in data.files:
+                kind, _, name = key.partition("|")
+                if kind == "bitmap":
+                    bitmaps[name] = np.unpackbits(data[key], count=n).astype(bool)
+                elif kind == "values":
+                    sorted_values[name] = data[key]
+                elif kind == "ids":
+                    sorted_ids[name] = data[key]
+        return LayerIndex(h3_indexes, bitmaps, sorted_values, sorted_ids, map_version=map_version)
+
+    def sidecar_path(map_path):
+        """
+        地图文件对应的索引路径，如 汤山map.bin -> 汤山map.index.npz
+        """
+        return os.path.splitext(map_path)[0] + ".index.npz"
+
+if __name__ == '__main__':
+    import time
+    from pp import load_map
+    from compiled_map import CompiledMap
+    map = load_map('output/汤山/汤山map.bin')
+    index = LayerIndex.build(CompiledMap.compile(map))
+    index.save(LayerIndex.sidecar_path('output/汤山/汤山map.bin'))
+    start = time.perf_counter()
+    ids = index.select(index.range("relief", low=20) & ~index.landcover("water"))
+    print(f"地形起伏度>=20且非水体: {len(ids)}个cell, 用时 {(time.perf_counter() - start) * 1000:.2f}ms")
+    print(f"未量化坡度: {len(index.select(~index.known('slope')))}个cell")
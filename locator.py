@@ -0,0 +1,122 @@
+import weakref
+import h3
+from pp_strategy import RejectStrategy
+
+class CellLocator:
+    """
+    坐标吸附定位器
+    每张地图只需构建一次，记录地图中出现的分辨率；定位时按分辨率直接换算h3索引，
+    落在缺失或不可通行的cell上时，按k环向外搜索半径内最近的可通行cell
+    """
+    _cache = weakref.WeakKeyDictionary()   # 地图对象 -> (cell数, CellLocator)
+
+    def __init__(self, map):
+        """
+        :param map: 地图对象
+        """
+        self.map = map
+        # 从细到粗，自适应地图中同一位置只会命中其中一个分辨率
+        self.resolutions = sorted({h3.h3_get_resolution(index) for index in map.cells}, reverse=True)
+
+    def for_map(map):
+        """
+        获取地图对应的定位器，cell数不变时复用已构建的定位器
+        :param map: 地图对象
+        :return: CellLocator对象
+        """
+        cached = CellLocator._cache.get(map)
+        if cached is None or cached[0] != len(map.cells):
+            cached = (len(map.cells), CellLocator(map))
+            CellLocator._cache[map] = cached
+        return cached[1]
+
+    def containing(self, h3_index):
+        """
+        查找包含某个最细分辨率索引的地图cell
+        :param h3_index: h3索引
+        :return: 地图中的h3索引，不在地图范围内时返回None
+        """
+        finest = h3.h3_get_resolution(h3_index)
+        for resolution in self.resolutions:
+            index = h3_index if resolution >= finest else h3.h3_to_parent(h3_index, resolution)
+            if index in self.map.cells:
+                return index
+        return None
+
+    def is_passable(self, h3_index, overlay=None):
+        """
+        判断cell是否可以作为起终点
+        :param overlay: 地图覆盖层(MapOverlay对象)，其中的通行性覆盖优先于拒绝策略
+        """
+        if overlay is not None:
+            passable = overlay.passable.get(h3_index)
+            if passable is not None:
+                return passable
+        cell = self.map.cells[h3_index]
+        return not RejectStrategy.reject_cell(cell, cell, self.map)
+
+    def locate(self, lat, lon):
+        """
+        坐标所在的地图cell，不检查通行性
+        :return: h3索引，不在地图范围内时返回None
+        """
+        for resolution in self.resolutions:
+            index = h3.geo_to_h3(lat, lon, resolution)
+            if index in self.map.cells:
+                return index
+        return None
+
+    def snap(self, lat, lon, max_k=10, overlay=None):
+        """
+        将坐标吸附到最近的可通行cell
+        :param lat: 纬度
+        :param lon: 经度
+        :param max_k: 最大搜索环数(以地图最细分辨率计)
+        :param overlay: 地图覆盖层(MapOverlay对象)
+        :return: h3索引，半径内没有可通行cell时返回None
+        """
+        index = self.locate(lat, lon)
+        if index is not None and self.is_passable(index, overlay):
+            return index
+        if not self.resolutions:
+            return None
+        origin = h3.geo_to_h3(lat, lon, self.resolutions[0])
+        best, best_dist = None, float("inf")
+        last_k = max_k
+        for k in range(1, max_k + 1):
+            if k > last_k:
+                break
+            for ring_index in h3.hex_ring(origin, k):
+                index = self.containing(ring_index)
+                if index is None or not self.is_passable(index, overlay):
+                    continue
+                dist = h3.point_dist((lat, lon), self.map.cells[index].center)
+                if dist < best_dist:
+                    best, best_dist = index, dist
+            # 环序号与实际距离并不严格一致，找到候选后再多看一环
+            if best is not None and last_k == max_k:
+                last_k = min(k + 1, max_k)
+        return best
+
+    def snap_many(self, points, max_k=10, overlay=None):
+        """
+        批量吸附，落在同一个最细分辨率cell内的点只计算一次
+        :param points: N×2 数组 (lat, lon)
+        :param max_k: 最大搜索环数
+        :param overlay: 地图覆盖层(MapOverlay对象)
+        :return: 长度为N的h3索引列表，吸附失败的位置为None
+        """
+        import numpy as np
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if not self.resolutions:
+            return [None] * len(points)
+        finest = self.resolutions[0]
+        snapped = {}
+        result = []
+        for lat, lon in points.tolist():
+            key = h3.geo_to_h3(lat, lon, finest)
+            if key not in snapped:
+                snapped[key] = self.snap(lat, lon, max_k, overlay)
+            result.append(snapped[key])
+        return result
@@ -0,0 +1,441 @@
+import json
+import struct
+import multiprocessing
+from collections import deque
+import h3
+import numpy as np
+from compiled_map import CompiledMap
+
+# numpy类型 -> FlatGeobuf列类型
+FGB_COLUMN_TYPES = {
+    np.dtype(np.int8): 0,       # Byte
+    np.dtype(np.uint8): 1,      # UByte
+    np.dtype(np.int16): 3,      # Short
+    np.dtype(np.int32): 5,      # Int
+    np.dtype(np.int64): 7,      # Long
+    np.dtype(np.float32): 9,    # Float
+    np.dtype(np.float64): 10,   # Double
+}
+FGB_STRING = 11
+FGB_INT = 5
+FGB_DOUBLE = 10
+FGB_POLYGON = 3
+FGB_MULTIPOLYGON = 6
+FGB_MAGIC = b"fgb\x03fgb\x00"
+H3_STRING_LENGTH = 15           # h3索引字符串定长15个字符
+
+def cell_boundaries(h3_indexes):
+    """
+    cell边界，各环首尾闭合
+    :param h3_indexes: h3索引列表
+    :return: (M×2 (lon, lat)坐标数组, 长度为N+1的环起点偏移数组)
+    """
+    rings = [h3.h3_to_geo_boundary(index, geo_json=True) for index in h3_indexes]
+    counts = np.fromiter((len(ring) for ring in rings), dtype=np.int64, count=len(rings))
+    offsets = np.zeros(len(rings) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    coords = np.array([point for ring in rings for point in ring], dtype=np.float64).reshape(-1, 2)
+    return coords, offsets
+
+def _scatter(records, starts, lengths):
+    """
+    按分组把定长记录写入连续缓冲区：同一点数的记录长度相同，一次花式索引写入
+    :param records: 点数 -> (记录在结果中的序号数组, m×L uint8矩阵)
+    :param starts: 每条记录在缓冲区中的起点
+    :param lengths: 每条记录的字节数
+    :return: uint8缓冲区
+    """
+    buffer = np.empty(int(lengths.sum()), dtype=np.uint8)
+    for positions, rows in records.values():
+        buffer[starts[positions][:, None] + np.arange(rows.shape[1])] = rows
+    return buffer
+
+def polygons_wkb(coords, offsets):
+    """
+    向量化生成单环Polygon的WKB
+    :return: (uint8缓冲区, 长度为N+1的字节偏移数组)，可直接作为Arrow Binary列的缓冲区
+    """
+    counts = np.diff(offsets)
+    lengths = 13 + 16 * counts
+    starts = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=starts[1:])
+    records = {}
+    for n in np.unique(counts).tolist():
+        positions = np.flatnonzero(counts == n)
+        rows = np.zeros(len(positions), dtype=[("order", "u1"), ("type", "<u4"), ("rings", "<u4"), ("points", "<u4"),
+                                               ("xy", "<f8", (n, 2))])
+        rows["order"] = 1
+        rows["type"] = 3
+        rows["rings"] = 1
+        rows["points"] = n
+        rows["xy"] = coords[offsets[positions][:, None] + np.arange(n)]
+        records[n] = (positions, rows.view(np.uint8).reshape(len(positions), -1))
+    return _scatter(records, starts[:-1], lengths), starts
+
+def _layer_columns(graph, layers):
+    if layers is None:
+        layers = list(graph.layers)
+    unknown = [name for name in layers if name not in graph.layers]
+    if unknown:
+        raise ValueError(f"未知的属性层: {', '.join(unknown)}")
+    return layers
+
+class _FlatBuffer:
+    """
+    按前向布局写FlatBuffers表：vtable紧接在表之前，子对象依次写在表之后，偏移均为正向
+    字段为 (槽位, 类型, 值)，类型为 u8/u16/i32/u64 标量，或 str/vec_u8/vec_u32/vec_f64/table/vec_table
+    """
+    SCALARS = {"u8": "<B", "u16": "<H", "i32": "<i", "u64": "<Q"}
+
+    def __init__(self):
+        self.buf = bytearray(4)     # 根偏移
+
+    def pad(self, align, extra=0):
+        while (len(self.buf) + extra) % align:
+            self.buf.append(0)
+
+    def table(self, fields):
+        slots = max(slot for slot, _, _ in fields) + 1
+        inline, size = {}, 4
+        for slot, kind, _ in sorted(fields, key=lambda field: -struct.calcsize(self.SCALARS.get(field[1], "<I"))):
+            width = struct.calcsize(self.SCALARS.get(kind, "<I"))
+            size += -size % width
+            inline[slot] = size
+            size += width
+        size += -size % 4
+        vtable = struct.pack(f"<{slots + 2}H", 4 + 2 * slots, size, *[inline.get(slot, 0) for slot in range(slots)])
+        self.pad(8, len(vtable))
+        vtable_pos = len(self.buf)
+        self.buf += vtable
+        table_pos = len(self.buf)
+        self.buf += bytes(size)
+        struct.pack_into("<i", self.buf, table_pos, table_pos - vtable_pos)
+        for slot, kind, value in fields:
+            field_pos = table_pos + inline[slot]
+            if kind in self.SCALARS:
+                struct.pack_into(self.SCALARS[kind], self.buf, field_pos, value)
+                continue
+            child_pos = self.child(kind, value)
+            struct.pack_into("<I", self.buf, field_pos, child_pos - field_pos)
+        return table_pos
+
+    def child(self, kind, value):
+        if kind == "str":
+            self.pad(4)
+            pos = len(self.buf)
+            data = value.encode("utf-8")
+            self.buf += struct.pack("<I", len(data)) + data + b"\x00"
+            return pos
+        if kind in ("vec_u8", "vec_u32", "vec_f64"):
+            data = np.ascontiguousarray(value, dtype={"vec_u8": "<u1", "vec_u32": "<u4", "vec_f64": "<f8"}[kind])
+            self.pad(max(data.itemsize, 4), 4)
+            pos = len(self.buf)
+            self.buf += struct.pack("<I", len(data)) + data.tobytes()
+            return pos
+        if kind == "table":
+            return self.table(value)
+        if kind == "vec_table":
+            self.pad(4)
+            pos = len(self.buf)
+            self.buf += struct.pack("<I", len(value)) + bytes(4 * len(value))
+            for i, fields in enumerate(value):
+                child_pos = self.table(fields)
+                slot_pos = pos + 4 + 4 * i
+                struct.pack_into("<I", self.buf, slot_pos, child_pos - slot_pos)
+            return pos
+        raise ValueError(kind)
+
+    def finish(self, fields):
+        struct.pack_into("<I", self.buf, 0, self.table(fields))
+        return bytes(self.buf)
+
+def _fgb_header(name, geometry_type, columns, count):
+    """
+    :param columns: [(列名, FlatGeobuf列类型), ...]
+    :param count: 要素数，0表示未知
+    """
+    header = _FlatBuffer().finish([
+        (0, "str", name),
+        (2, "u8", geometry_type),
+        (7, "vec_table", [[(0, "str", column), (1, "u8", column_type)] for column, column_type in columns]),
+        (8, "u64", count),
+        (9, "u16", 0),          # 不写空间索引
+        (10, "table", [(0, "str", "EPSG"), (1, "i32", 4326)]),
+    ])
+    header += bytes(-len(header) % 8)   # 头部长度取8的倍数，使其后各要素的FlatBuffer8字节对齐
+    return FGB_MAGIC + struct.pack("<I", len(header)) + header
+
+def _fgb_features(h3_indexes, values):
+    """
+    向量化编码一块要素
+    同一点数的要素FlatBuffer布局完全相同，按固定模板整块填入坐标与属性：
+      0 根偏移 | 4 Feature vtable | 12 Feature表(geometry, properties) | 24 Geometry vtable | 32 Geometry表(xy)
+      | 40 填充 | 44 xy长度 | 48 xy坐标 | 属性长度 | 属性(列序号u16 + 值)...
+    :param h3_indexes: h3索引列表
+    :param values: [(列序号, 数组), ...]
+    :return: bytes，每个要素前有uint32长度前缀
+    """
+    coords, offsets = cell_boundaries(h3_indexes)
+    counts = np.diff(offsets)
+    n_cells = len(h3_indexes)
+    strings = np.array(h3_indexes, dtype=f"S{H3_STRING_LENGTH}")
+    property_dtype = [("h3_column", "<u2"), ("h3_length", "<u4"), ("h3_index", f"S{H3_STRING_LENGTH}")]
+    for column, array in values:
+        property_dtype += [(f"c{column}", "<u2"), (f"v{column}", array.dtype.newbyteorder("<"))]
+    properties = np.zeros(n_cells, dtype=property_dtype)
+    properties["h3_column"] = 0
+    properties["h3_length"] = H3_STRING_LENGTH
+    properties["h3_index"] = strings
+    for column, array in values:
+        properties[f"c{column}"] = column
+        properties[f"v{column}"] = array
+    property_bytes = properties.view(np.uint8).reshape(n_cells, -1) if n_cells else np.zeros((0, properties.itemsize), np.uint8)
+
+    lengths = np.zeros(n_cells, dtype=np.int64)
+    records = {}
+    for n in np.unique(counts).tolist():
+        positions = np.flatnonzero(counts == n)
+        properties_pos = 48 + 16 * n
+        size = properties_pos + 4 + properties.itemsize
+        size += (4 - size) % 8          # 长度前缀4字节 + 要素，保持下一个要素8字节对齐
+        template = bytearray(4 + size)
+        struct.pack_into("<I", template, 0, size)
+        struct.pack_into("<IHHHHiII", template, 4, 12, 8, 12, 4, 8, 8, 32 - 16, properties_pos - 20)
+        struct.pack_into("<HHHHiI", template, 4 + 24, 8, 8, 0, 4, 8, 44 - 36)
+        struct.pack_into("<II", template, 4 + 44, 2 * n, 0)
+        struct.pack_into("<I", template, 4 + properties_pos, properties.itemsize)
+        rows = np.tile(np.frombuffer(bytes(template), dtype=np.uint8), (len(positions), 1))
+        xy = coords[offsets[positions][:, None] + np.arange(n)]
+        rows[:, 4 + 48:4 + 48 + 16 * n] = xy.reshape(len(positions), -1).view(np.uint8)
+        rows[:, 4 + properties_pos + 4:4 + properties_pos + 4 + properties.itemsize] = property_bytes[positions]
+        records[n] = (positions, rows)
+        lengths[positions] = len(template)
+    starts = np.zeros(n_cells, dtype=np.int64)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    return _scatter(records, starts, lengths).tobytes()
+
+def _fgb_chunk(chunk):
+    return _fgb_features(*chunk)
+
+def _wkb_chunk(h3_indexes):
+    return polygons_wkb(*cell_boundaries(h3_indexes))
+
+def _chunks(graph, layers, chunk_size, with_values):
+    for start in range(0, len(graph), chunk_size):
+        end = min(start + chunk_size, len(graph))
+        h3_indexes = graph.h3_indexes[start:end]
+        if with_values:
+            yield h3_indexes, [(column, np.asarray(graph.layers[name][start:end]))
+                               for column, name in enumerate(layers, start=1)]
+        else:
+            yield h3_indexes
+
+def _encode(function, chunks, processes):
+    """
+    逐块编码，processes大于1时多进程并行编码，结果仍按块顺序返回，同时在途的块数有上限
+    """
+    if not processes or processes <= 1:
+        yield from map(function, chunks)
+        return
+    with multiprocessing.Pool(processes) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(function, (chunk,)))
+            if len(pending) >= 2 * processes:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+def write_cells_to_flatgeobuf(graph, fgb_path, layers=None, chunk_size=65536, processes=None):
+    """
+    将cell写入FlatGeobuf文件，直接读取列式属性层，按块生成多边形并流式写出，内存占用与块大小成正比
+    字段名不受Shapefile的10字符限制，不生成空间索引
+    :param graph: CompiledMap对象，传入地图对象时先编译
+    :param fgb_path: 输出的.fgb文件路径
+    :param layers: 要写出的属性层名列表，None表示全部
+    :param chunk_size: 每块的cell数
+    :param processes: 并行编码的进程数，None表示单进程
+    :return: None
+    """
+    if not isinstance(graph, CompiledMap):
+        graph = CompiledMap.compile(graph)
+    layers = _layer_columns(graph, layers)
+    with open(fgb_path, 'wb') as f:
+        columns = [("h3_index", FGB_STRING)]
+        columns += [(name, FGB_COLUMN_TYPES[np.asarray(graph.layers[name]).dtype]) for name in layers]
+        f.write(_fgb_header("cells", FGB_POLYGON, columns, len(graph)))
+        for encoded in _encode(_fgb_chunk, _chunks(graph, layers, chunk_size, True), processes):
+            f.write(encoded)
+
+def write_cells_to_geoparquet(graph, parquet_path, layers=None, chunk_size=65536, processes=None):
+    """
+    将cell写入GeoParquet文件，每块为一个行组，几何列为WKB
+    需要安装pyarrow(不在本项目依赖中，调用时才导入)
+    :param graph: CompiledMap对象，传入地图对象时先编译
+    :param parquet_path: 输出的.parquet文件路径
+    :param layers: 要写出的属性层名列表，None表示全部
+    :param chunk_size: 每块(行组)的cell数
+    :param processes: 并行编码的进程数，None表示单进程
+    :return: None
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if not isinstance(graph, CompiledMap):
+        graph = CompiledMap.compile(graph)
+    layers = _layer_columns(graph, layers)
+    geo = {
+        "version": "1.0.0",
+        "primary_column": "geometry",
+        "columns": {"geometry": {"encoding": "WKB", "geometry_types": ["Polygon"]}},   # 缺省crs为OGC:CRS84
+    }
+    schema = pa.schema([pa.field("h3_index", pa.string())] +
+                       [pa.field(name, pa.from_numpy_dtype(np.asarray(graph.layers[name]).dtype)) for name in layers] +
+                       [pa.field("geometry", pa.binary())],
+                       metadata={"geo": json.dumps(geo)})
+    with pq.ParquetWriter(parquet_path, schema) as writer:
+        start = 0
+        for buffer, offsets in _encode(_wkb_chunk, _chunks(graph, layers, chunk_size, False), processes):
+            end = start + len(offsets) - 1
+            geometry = pa.Array.from_buffers(pa.binary(), end - start,
+                                             [None, pa.py_buffer(offsets.astype(np.int32)), pa.py_buffer(buffer)])
+            columns = [pa.array(graph.h3_indexes[start:end], type=pa.string())]
+            columns += [pa.array(np.asarray(graph.layers[name][start:end])) for name in layers]
+            writer.write_table(pa.Table.from_arrays(columns + [geometry], schema=schema))
+            start = end
+
+def dissolve_cells(graph, attribute, bins=None, skip=()):
+    """
+    按属性分类合并cell
+    cell按较粗分辨率的父cell分块(与RegionIndex的分组相同)，每块内同类cell用h3_set_to_multi_polygon合并，
+    内存与耗时只与块大小有关；相邻块的多边形在块边界处不合并
+    :param graph: CompiledMap对象
+    :param attribute: 分类所用的属性层，如"show_attribute"、"road_type"、"landcover"，数值层需同时给出bins
+    :param bins: 数值层的分级边界(升序)，类别为np.digitize的结果，即落在 [bins[i-1], bins[i]) 的类别为i；值为NaN的cell跳过
+    :param skip: 跳过的类别，如show_attribute的-1(无属性)
+    :return: 生成器，产出 (类别, cell数, 多边形列表)，多边形为GeoJSON坐标 [[[lon, lat], ...], 洞...]
+    """
+    from region import RegionIndex
+
+    if attribute not in graph.layers:
+        raise ValueError(f"未知的属性层: {attribute}")
+    values = np.asarray(graph.layers[attribute])
+    if bins is not None:
+        classes = np.digitize(values, bins)
+        classes[np.isnan(values)] = -1
+        skip = set(skip) | {-1}
+    else:
+        if values.dtype.kind == "f":
+            raise ValueError(f"数值层{attribute}需要给出分级边界bins")
+        classes = values
+    region = RegionIndex.for_graph(graph)
+    ends = np.r_[region.group_starts[1:], len(region.group_nodes)]
+    for start, end in zip(region.group_starts.tolist(), ends.tolist()):
+        members = region.group_nodes[start:end]
+        member_classes = classes[members]
+        for value in np.unique(member_classes).tolist():
+            if value in skip:
+                continue
+            h3_indexes = {graph.h3_indexes[i] for i in members[member_classes == value].tolist()}
+            # h3_set_to_multi_polygon要求同一分辨率，自适应地图先展开到最细分辨率
+            resolutions = {h3.h3_get_resolution(index) for index in h3_indexes}
+            if len(resolutions) > 1:
+                h3_indexes = h3.uncompact(h3_indexes, max(resolutions))
+            yield value, len(h3_indexes), h3.h3_set_to_multi_polygon(h3_indexes, geo_json=True)
+
+def _merge_dissolved(dissolved):
+    """
+    将各块的同类多边形沿块边界合并，每类得到一个多部件多边形；相邻块共享完全相同的h3边界，可用覆盖合并
+    """
+    import shapely
+    from shapely.geometry.polygon import orient
+
+    groups = {}
+    for value, count, polygons in dissolved:
+        group = groups.setdefault(value, [0, []])
+        group[0] += count
+        group[1].extend(shapely.Polygon(polygon[0], polygon[1:]) for polygon in polygons)
+    for value in sorted(groups):
+        count, polygons = groups[value]
+        merged = shapely.coverage_union_all(polygons)
+        # 与h3_set_to_multi_polygon一致：外环逆时针、洞顺时针
+        parts = [orient(part, 1.0) for part in (merged.geoms if hasattr(merged, "geoms") else [merged])]
+        yield value, count, [[list(part.exterior.coords)] + [list(ring.coords) for ring in part.interiors]
+                             for part in parts]
+
+def write_dissolved(graph, path, attribute, bins=None, skip=(), merge=True):
+    """
+    将按属性分类合并后的多边形写入FlatGeobuf(.fgb)或Shapefile(.shp)，每个(类别, 块)一条记录，merge时每个类别一条记录
+    文件大小与渲染耗时取决于类别边界的复杂度，而不是cell数
+    :param graph: CompiledMap对象，传入地图对象时先编译
+    :param path: 输出文件路径，按扩展名选择格式
+    :param attribute: 分类所用的属性层
+    :param bins: 数值层的分级边界
+    :param skip: 跳过的类别
+    :param merge: 是否沿块边界合并同类多边形，需要shapely
+    :return: 写出的记录数
+    """
+    if not isinstance(graph, CompiledMap):
+        graph = CompiledMap.compile(graph)
+    dissolved = dissolve_cells(graph, attribute, bins, skip)
+    if merge:
+        dissolved = _merge_dissolved(dissolved)
+
+    def bounds(value):
+        if bins is None:
+            return None, None
+        low = float(bins[value - 1]) if value > 0 else None
+        high = float(bins[value]) if value < len(bins) else None
+        return low, high
+
+    count = 0
+    if path.lower().endswith(".shp"):
+        import shapefile as shp
+        from map2shp import write_prj_file
+
+        with shp.Writer(path, shapeType=shp.POLYGON) as writer:
+            writer.field('class', 'N', decimal=0)
+            writer.field('low', 'F', decimal=4)
+            writer.field('high', 'F', decimal=4)
+            writer.field('cells', 'N', decimal=0)
+            for value, cells, polygons in dissolved:
+                # GeoJSON外环逆时针，SHP外环顺时针，逐环反转
+                writer.poly([list(reversed(loop)) for polygon in polygons for loop in polygon])
+                writer.record(value, *bounds(value), cells)
+                count += 1
+        write_prj_file(path)
+        return count
+
+    with open(path, 'wb') as f:
+        f.write(_fgb_header(attribute, FGB_MULTIPOLYGON,
+                            [("class", FGB_INT), ("low", FGB_DOUBLE), ("high", FGB_DOUBLE), ("cells", FGB_INT)], 0))
+        for value, cells, polygons in dissolved:
+            parts = []
+            for polygon in polygons:
+                rings = [np.asarray(ring, dtype=np.float64) for ring in polygon]
+                parts.append([(0, "vec_u32", np.cumsum([len(ring) for ring in rings])),
+                              (1, "vec_f64", np.concatenate(rings).ravel()),
+                              (6, "u8", FGB_POLYGON)])
+            properties = struct.pack("<Hi", 0, value) + struct.pack("<Hi", 3, cells)
+            for column, bound in zip((1, 2), bounds(value)):
+                if bound is not None:
+                    properties += struct.pack("<Hd", column, bound)
+            feature = _FlatBuffer().finish([
+                (0, "table", [(6, "u8", FGB_MULTIPOLYGON), (7, "vec_table", parts)]),
+                (1, "vec_u8", np.frombuffer(properties, dtype=np.uint8)),
+            ])
+            feature += bytes((4 - len(feature)) % 8)    # 长度前缀4字节 + 要素，保持下一个要素8字节对齐
+            f.write(struct.pack("<I", len(feature)) + feature)
+            count += 1
+    return count
+
+if __name__ == "__main__":
+    import pickle
+    with open('output/汤山/汤山map.bin', 'rb') as f:
+        map = pickle.load(f)
+    graph = CompiledMap.compile(map)
+    write_cells_to_flatgeobuf(graph, 'output/汤山/汤山cells.fgb', processes=4)
+    write_cells_to_geoparquet(graph, 'output/汤山/汤山cells.parquet',
+                              layers=["elevation", "slope", "show_attribute", "landcover", "relief"])
+    write_dissolved(graph, 'output/汤山/汤山地表覆盖.fgb', "show_attribute", skip=(-1,))
+    write_dissolved(graph, 'output/汤山/汤山地形起伏度.shp', "relief", bins=[5, 10, 20, 40])
@@ -0,0 +1,138 @@
+import gc
+import os
+import threading
+from compiled_map import CompiledMap
+
+class MapHandle:
+    """
+    可热更新的地图句柄(双缓冲)
+    后台线程加载新版本，加载完成后原子地替换当前版本；新查询通过get()取得新版本，
+    已经取得旧版本的在途查询继续使用旧版本直到结束，旧版本不再被引用后内存即被释放
+    """
+    def __init__(self, loader, source):
+        """
+        :param loader: 加载函数 loader(source) -> 地图对象(Map、CompiledMap等)
+        :param source: 地图来源，通常为文件路径
+        """
+        self.loader = loader
+        self.source = source
+        self.listeners = []         # 替换时回调 callback(旧版本, 新版本)
+        self.generation = 0         # 每次替换加一
+        self.loading = None         # 正在进行的后台加载线程
+        self.pending = False        # 是否有尚未开始的加载请求(加载期间再次请求时由同一线程接着加载)
+        self.error = None           # 最近一次加载失败的异常，加载成功后清除
+        self.lock = threading.Lock()
+        self.mtime = self.source_mtime(source)
+        self.current = loader(source)
+
+    def get(self):
+        """
+        取得当前版本，查询应在开始时取一次并在整个查询中使用同一个对象
+        """
+        return self.current
+
+    def snapshot(self):
+        """
+        在锁内同时取得版本号与当前版本，二者一定对应同一次替换，可一起作为缓存或请求合并的键
+        :return: (版本号, 地图对象)
+        """
+        with self.lock:
+            return self.generation, self.current
+
+    def on_swap(self, callback):
+        """
+        注册替换回调，用于清除以地图版本为键的缓存等
+        :param callback: callback(旧版本, 新版本)
+        :return: None
+        """
+        self.listeners.append(callback)
+
+    def swap(self, new):
+        """
+        替换当前版本
+        :param new: 新版本地图对象
+        :return: None
+        """
+        with self.lock:
+            old = self.current
+            self.current = new
+            self.generation += 1
+            for callback in self.listeners:
+                callback(old, new)
+        del old
+        gc.collect()    # 地图对象内部可能有循环引用，主动回收以尽快释放旧版本
+
+    def reload(self, source=None, wait=False):
+        """
+        在后台线程加载新版本并替换，加载期间查询继续使用当前版本
+        加载期间再次调用时，当前加载完成后按最新的来源再加载一次，不会丢失来源的变化
+        :param source: 新的地图来源，None表示重新加载原来源
+        :param wait: 是否等待加载完成，加载失败时抛出加载函数的异常
+        :return: 加载线程
+        """
+        with self.lock:
+            if source is not None:
+                self.source = source
+            self.pending = True
+            if self.loading is None:
+                self.loading = threading.Thread(target=self._load, daemon=True)
+                self.loading.start()
+            thread = self.loading
+        if wait:
+            thread.join()
+            if self.error is not None:
+                raise self.error
+        return thread
+
+    def _load(self):
+        """
+        加载线程：依次处理加载请求，直到没有新的请求
+        """
+        while True:
+            with self.lock:
+                if not self.pending:
+                    self.loading = None
+                    return
+                self.pending = False
+                source = self.source
+            try:
+                mtime = self.source_mtime(source)
+                new = self.loader(source)
+            except Exception as e:
+                # 加载失败时保留当前版本，异常记录在error中，reload(wait=True)时抛出
+                print(f"地图加载失败: {source}: {e!r}")
+                self.error = e
+                continue
+            self.error = None
+            self.mtime = mtime
+            self.swap(new)
+
+    def reload_if_changed(self, wait=False):
+        """
+        地图文件的修改时间变化时重新加载
+        :return: 加载线程，未变化时返回None
+        """
+        mtime = self.source_mtime(self.source)
+        if mtime is None or mtime == self.mtime:
+            return None
+        return self.reload(wait=wait)
+
+    def source_mtime(self, source):
+        """
+        地图来源的修改时间，来源不是文件或目录时返回None
+        """
+        if isinstance(source, (str, bytes, os.PathLike)) and os.path.exists(source):
+            if os.path.isdir(source):
+                return max(os.path.getmtime(os.path.join(source, name)) for name in os.listdir(source))
+            return os.path.getmtime(source)
+        return None
+
+if __name__ == '__main__':
+    import time
+    from field_cache import FieldCache
+    maps = MapHandle(CompiledMap.load, 'output/汤山/汤山compiled')
+    cache = FieldCache()
+    maps.on_swap(lambda old, new: cache.invalidate(new))
+    while True:
+        maps.reload_if_changed()
+        time.sleep(60)
@@ -0,0 +1,106 @@
+import hashlib
+
+class MapOverlay:
+    """
+    地图覆盖层
+    在基础地图之上保存稀疏的逐cell覆盖项(通行性、代价倍率)，搜索时以O(1)查表，不修改也不复制基础地图，
+    同一张地图可以同时叠加多个覆盖层做"假如这座桥封闭"之类的推演，丢弃或替换覆盖层没有任何代价
+    代价倍率不小于1时A*的启发值仍可采纳，小于1(如临时便道)时结果可能不是最优
+    """
+    def __init__(self):
+        self.passable = {}      # h3索引 -> False强制不可通行，True强制可通行(忽略拒绝策略)
+        self.cost_scale = {}    # h3索引 -> 进入该cell的代价倍率
+        self.version = 0        # 覆盖项每次变化版本号加一
+        self._fingerprint = (None, None)    # (版本号, 摘要)
+
+    def __len__(self):
+        return len(self.passable) + len(self.cost_scale)
+
+    def block(self, h3_indexes):
+        """
+        封闭cell
+        :param h3_indexes: h3索引列表
+        :return: self
+        """
+        for h3_index in h3_indexes:
+            self.passable[h3_index] = False
+        self.version += 1
+        return self
+
+    def open(self, h3_indexes):
+        """
+        强制开放cell，基础地图上被拒绝的cell也可进入(如临时架设的便桥)
+        :param h3_indexes: h3索引列表
+        :return: self
+        """
+        for h3_index in h3_indexes:
+            self.passable[h3_index] = True
+        self.version += 1
+        return self
+
+    def scale(self, h3_indexes, factor):
+        """
+        设置进入cell的代价倍率
+        :param h3_indexes: h3索引列表
+        :param factor: 代价倍率
+        :return: self
+        """
+        for h3_index in h3_indexes:
+            if factor == 1.0:
+                self.cost_scale.pop(h3_index, None)
+            else:
+                self.cost_scale[h3_index] = factor
+        self.version += 1
+        return self
+
+    def reset(self, h3_indexes=None):
+        """
+        撤销覆盖项
+        :param h3_indexes: h3索引列表，None表示全部撤销
+        :return: self
+        """
+        if h3_indexes is None:
+            self.passable.clear()
+            self.cost_scale.clear()
+            self.version += 1
+            return self
+        for h3_index in h3_indexes:
+            self.passable.pop(h3_index, None)
+            self.cost_scale.pop(h3_index, None)
+        self.version += 1
+        return self
+
+    def is_monotone(self):
+        """
+        覆盖项是否只会增加代价(封闭或倍率不小于1)，此时按基础地图计算的代价下界(如地标表)仍然成立；
+        强制开放或倍率小于1会使实际代价低于基础地图，地标下界可能高估
+        :return: bool
+        """
+        return all(passable is False for passable in self.passable.values()) and \
+            all(factor >= 1.0 for factor in self.cost_scale.values())
+
+    def fingerprint(self):
+        """
+        覆盖项内容的摘要，内容相同的覆盖层摘要相同，跨进程稳定，可作为缓存键
+        :return: 十六进制字符串
+        """
+        if self._fingerprint[0] != self.version:
+            content = repr((sorted(self.passable.items()), sorted(self.cost_scale.items())))
+            self._fingerprint = (self.version, hashlib.sha1(content.encode()).hexdigest())
+        return self._fingerprint[1]
+
+    def node_scale(self, graph):
+        """
+        转换为CompiledMap节点编号上的代价倍率，封闭的cell倍率为inf
+        CompiledMap的邻接表中不含基础地图上不可通行的边，强制开放项在此不生效
+        :param graph: CompiledMap对象
+        :return: {节点编号: 代价倍率}
+        """
+        scale = {}
+        for h3_index, factor in self.cost_scale.items():
+            if h3_index in graph.node_ids:
+                scale[graph.node_ids[h3_index]] = factor
+        for h3_index, passable in self.passable.items():
+            if passable is False and h3_index in graph.node_ids:
+                scale[graph.node_ids[h3_index]] = float("inf")
+        return scale
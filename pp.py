@@ -1,88 +1,261 @@
+import os
+import heapq
 import pickle
 import h3
 from data_structures import *
 from pp_enum import *
-from quantity_roadnet import *
 from pp_strategy import *
+from locator import CellLocator
 
 
-def pp(map, start, end, road_adjacency_list=None):
+def cell_heuristic(map, anchor_cell, reverse=False, use_landmarks=True):
+    """
+    生成启发函数：格心距离，地图带有按当前版本计算的地标表时取其与地标下界(三角不等式)的较大值
+    :param map: 地图对象
+    :param anchor_cell: 正向时为终点，反向时为起点
+    :param reverse: False估计cell到终点的代价，True估计起点到cell的代价
+    :param use_landmarks: 是否使用地标表，边代价与计算地标时不同(如路网点增强)时应关闭
+    :return: 函数 h(cell) -> 代价下界
+    """
+    landmarks = getattr(map, "landmarks", None) if use_landmarks else None
+    if landmarks is not None and not landmarks.matches_map(map):
+        landmarks = None    # 地图修改过或地标表来自其他地图，下界不再可靠
+    bound = None
+    if landmarks is not None and anchor_cell.h3_index in landmarks.node_ids:
+        anchor = landmarks.node_ids[anchor_cell.h3_index]
+        bound = landmarks.source_bound(anchor) if reverse else landmarks.target_bound(anchor)
+
+    def heuristic(cell):
+        h = h3.point_dist(cell.center, anchor_cell.center)
+        if bound is not None and cell.h3_index in landmarks.node_ids:
+            h = max(h, bound(landmarks.node_ids[cell.h3_index]))
+        return h
+    return heuristic
+
+def pp(map, start, end, road_adjacency_list=None, bidirectional=False, overlay=None, epsilon=1 / 0.95, corridor=None):
     """
     路径规划
     :param map: 地图对象
     :param start: 起点坐标
     :param end: 终点坐标
-    :return: path: 路径对象
+    :param road_adjacency_list: 路网邻接表
+    :param bidirectional: 是否使用双向A*
+    :param overlay: 地图覆盖层(MapOverlay对象)，临时覆盖部分cell的通行性与代价倍率
+    :param epsilon: 启发值权重 f = g + epsilon * h，路径代价不超过最优代价的epsilon倍(不含路网点增强)，1为最优
+    :param corridor: 搜索走廊(Corridor对象)，只扩展走廊内的cell
+    :return: path: 路径对象，从终点到起点；终点不可达时抛出ValueError
     """
 
     """初始化"""
-    # 从0-15分辨率的索引，在map的字典中找出起始点和终点的索引
-    start_cell = None
-    end_cell = None
-    for i in range(0, 16):
-        start_index = h3.geo_to_h3(start[0], start[1], i)
-        end_index = h3.geo_to_h3(end[0], end[1], i)
-        if start_index in map.cells:
-            start_cell = map.cells[start_index]
-        if end_index in map.cells:
-            end_cell = map.cells[end_index]
-        if start_cell and end_cell:
-            break
-    if start_cell is None or end_cell is None:
+    # 将起终点吸附到最近的可通行cell
+    locator = CellLocator.for_map(map)
+    start_index = locator.snap(start[0], start[1], overlay=overlay)
+    end_index = locator.snap(end[0], end[1], overlay=overlay)
+    if start_index is None or end_index is None:
         raise ValueError("起点或终点不在地图范围内")
+    start_cell = map.cells[start_index]
+    end_cell = map.cells[end_index]
+    check_corridor(corridor, start_cell, end_cell)
+    if start_cell == end_cell:
+        path = Map()
+        path.add_cell(start_cell)
+        return path
+
+    if bidirectional:
+        if road_adjacency_list is not None:
+            raise ValueError("双向搜索不支持路网点增强")
+        return pp_bidirectional(map, start_cell, end_cell, overlay, corridor)
+
+    # 路网点增强与开放、降低代价的覆盖项使边代价低于计算地标时的代价，地标下界不可采纳
+    use_landmarks = road_adjacency_list is None and (overlay is None or overlay.is_monotone())
+    heuristic = cell_heuristic(map, end_cell, use_landmarks=use_landmarks)
 
     """使用A*算法进行路径规划"""
     # 初始化变量
     open_set = set()  # 待评估的节点集合
     closed_set = set()  # 已评估的节点集合
+    state = SearchState(epsilon)  # 搜索状态(g、h、f、父节点)，不写入cell，多个查询可共享同一张地图
     path = Map()  # 最终路径
-    start_cell.g = 0  # 起点的g值
+    state.g[start_cell] = 0  # 起点的g值
+    state.father[start_cell] = None
     for neighbor in start_cell.neighbors:
-        if neighbor in map.cells:
-            map.cells[neighbor].father = start_cell  # 设置父节点
-            map.cells[neighbor].g = start_cell.g + h3.point_dist(start_cell.center, map.cells[neighbor].center)
-            map.cells[neighbor].h = h3.point_dist(map.cells[neighbor].center, end_cell.center)
-            map.cells[neighbor].f = map.cells[neighbor].g + map.cells[neighbor].h
-            open_set.add(map.cells[neighbor])
+        if neighbor in map.cells and (corridor is None or corridor.contains(neighbor)):
+            neighbor_cell = map.cells[neighbor]
+            g_increment = CostStrategy.edge_cost(start_cell, neighbor_cell, map, overlay)
+            if g_increment is None:
+                continue
+            state.father[neighbor_cell] = start_cell  # 设置父节点
+            state.g[neighbor_cell] = state.g[start_cell] + g_increment
+            state.h[neighbor_cell] = heuristic(neighbor_cell)
+            state.f[neighbor_cell] = state.g[neighbor_cell] + state.epsilon * state.h[neighbor_cell]
+            open_set.add(neighbor_cell)
     closed_set.add(start_cell)
     current_cell = None # 当前节点
     # 开始A*算法
     while open_set:
         # 找到f值最小的节点
-        current_cell = min(open_set, key=lambda cell: cell.f)
+        current_cell = min(open_set, key=state.f.get)
         # 刷新显示
-        print(f"\r距离终点: {current_cell.h:.6f}", end='', flush=True)
+        print(f"\r距离终点: {state.h[current_cell]:.6f}", end='', flush=True)
         if current_cell == end_cell:
             break  # 找到终点，退出循环
         open_set.remove(current_cell)
         closed_set.add(current_cell)
         # 路网点增强
         if(road_adjacency_list is not None):
-            RoadpointStrategy.roadpoint_enhance(current_cell, road_adjacency_list, open_set, end_cell)
+            RoadpointStrategy.roadpoint_enhance(current_cell, road_adjacency_list, open_set, end_cell, state)
         for neighbor in current_cell.neighbors:
             if neighbor in map.cells and map.cells[neighbor] not in closed_set:
-                # 拒绝策略
-                if RejectStrategy.reject_cell(current_cell, map.cells[neighbor], map):
+                if corridor is not None and not corridor.contains(neighbor):
+                    continue
+                neighbor_cell = map.cells[neighbor]
+                # 拒绝策略与奖励策略
+                g_increment = CostStrategy.edge_cost(current_cell, neighbor_cell, map, overlay)
+                if g_increment is None:
                     continue
-                # 计算g值的增量
-                g_increment = h3.point_dist(current_cell.center, map.cells[neighbor].center)
-                # 奖励策略
-                RewardStrategy.reward_cell_by_road(map.cells[neighbor], g_increment)
                 # g值更新
-                g = current_cell.g + g_increment
-                if map.cells[neighbor] not in open_set or g < map.cells[neighbor].g:
-                    map.cells[neighbor].g = g
-                    map.cells[neighbor].h = h3.point_dist(map.cells[neighbor].center, end_cell.center)
-                    map.cells[neighbor].f = 0.95 * map.cells[neighbor].g + map.cells[neighbor].h
-                    map.cells[neighbor].father = current_cell  # 设置父节点
-                    open_set.add(map.cells[neighbor])
+                g = state.g[current_cell] + g_increment
+                if neighbor_cell not in open_set or g < state.g[neighbor_cell]:
+                    state.g[neighbor_cell] = g
+                    state.h[neighbor_cell] = heuristic(neighbor_cell)
+                    state.f[neighbor_cell] = state.g[neighbor_cell] + state.epsilon * state.h[neighbor_cell]
+                    state.father[neighbor_cell] = current_cell  # 设置父节点
+                    open_set.add(neighbor_cell)
+
+    print(f"\n扩展节点数: {len(closed_set)}, 次优界: {epsilon:.3f}")
+    if current_cell != end_cell:
+        raise ValueError("不可达")  # 与双向搜索一致，不返回搜索停下处的半截路径
 
     # 生成路径
     while current_cell:
         path.add_cell(current_cell)
-        current_cell = current_cell.father
+        current_cell = state.father.get(current_cell)
+    return path
+
+def check_corridor(corridor, start_cell, end_cell):
+    """
+    检查起终点是否在搜索走廊内，不在走廊内时搜索无法到达终点
+    :param corridor: 搜索走廊(Corridor对象)，None表示不限制
+    :param start_cell: 起点Cell对象
+    :param end_cell: 终点Cell对象
+    :return: None
+    """
+    if corridor is None:
+        return
+    if not corridor.contains(start_cell.h3_index):
+        raise ValueError("起点不在搜索走廊内")
+    if not corridor.contains(end_cell.h3_index):
+        raise ValueError("终点不在搜索走廊内")
+
+def pp_bidirectional(map, start_cell, end_cell, overlay=None, corridor=None):
+    """
+    双向A*路径规划
+    采用平均势函数 p(v) = (h_end(v) - h_start(v)) / 2，正向键值 g + p，反向键值 g - p，二者对应同一张约化代价图，
+    当两侧堆顶键值之和不小于当前最优代价时停止，返回的代价与单向无权A*相同
+    反向搜索沿入边扩展，使用 cell->当前节点 的有向代价
+    :param map: 地图对象
+    :param start_cell: 起点Cell对象
+    :param end_cell: 终点Cell对象
+    :param overlay: 地图覆盖层(MapOverlay对象)
+    :param corridor: 搜索走廊(Corridor对象)
+    :return: path: 路径对象，从终点到起点；终点不可达时抛出ValueError
+    """
+    check_corridor(corridor, start_cell, end_cell)
+    use_landmarks = overlay is None or overlay.is_monotone()
+    to_end = cell_heuristic(map, end_cell, use_landmarks=use_landmarks)
+    from_start = cell_heuristic(map, start_cell, reverse=True, use_landmarks=use_landmarks)
+
+    def potential(cell):
+        return (to_end(cell) - from_start(cell)) / 2
+
+    g = ({start_cell.h3_index: 0.0}, {end_cell.h3_index: 0.0})
+    father = ({start_cell.h3_index: None}, {end_cell.h3_index: None})
+    heaps = ([(potential(start_cell), start_cell.h3_index)], [(-potential(end_cell), end_cell.h3_index)])
+    closed = (set(), set())
+    best = 0.0 if start_cell == end_cell else float("inf")
+    meet = start_cell.h3_index if start_cell == end_cell else None
+    while heaps[0] and heaps[1]:
+        # 停止条件
+        if heaps[0][0][0] + heaps[1][0][0] >= best:
+            break
+        # 交替扩展较小的一侧
+        side = 0 if len(heaps[0]) <= len(heaps[1]) else 1
+        _, index = heapq.heappop(heaps[side])
+        if index in closed[side]:
+            continue
+        closed[side].add(index)
+        current_cell = map.cells[index]
+        for neighbor in current_cell.neighbors:
+            if neighbor not in map.cells:
+                continue
+            if corridor is not None and not corridor.contains(neighbor):
+                continue
+            neighbor_cell = map.cells[neighbor]
+            if side == 0:
+                g_increment = CostStrategy.edge_cost(current_cell, neighbor_cell, map, overlay)
+            else:
+                g_increment = CostStrategy.edge_cost(neighbor_cell, current_cell, map, overlay)
+            if g_increment is None:
+                continue
+            g_value = g[side][index] + g_increment
+            if g_value < g[side].get(neighbor, float("inf")):
+                g[side][neighbor] = g_value
+                father[side][neighbor] = index
+                closed[side].discard(neighbor)
+                key = g_value + potential(neighbor_cell) if side == 0 else g_value - potential(neighbor_cell)
+                heapq.heappush(heaps[side], (key, neighbor))
+                if neighbor in g[1 - side] and g_value + g[1 - side][neighbor] < best:
+                    best = g_value + g[1 - side][neighbor]
+                    meet = neighbor
+
+    print(f"扩展节点数: {len(closed[0]) + len(closed[1])}")
+    if meet is None:
+        raise ValueError("不可达")
+    path = Map()
+    # 与pp()一致，路径从终点到起点
+    index = meet
+    forward = []
+    while index is not None:
+        forward.append(index)
+        index = father[0][index]
+    index = father[1][meet]
+    backward = []
+    while index is not None:
+        backward.append(index)
+        index = father[1][index]
+    for index in reversed(backward):
+        path.add_cell(map.cells[index])
+    for index in forward:
+        path.add_cell(map.cells[index])
     return path
 
+def load_map(map_path):
+    """
+    读取地图，同目录下存在地标表、属性索引时一并加载
+    :param map_path: 地图文件路径
+    :return: 地图对象
+    """
+    from landmarks import Landmarks
+    from layer_index import LayerIndex
+
+    with open(map_path, 'rb') as f:
+        map = pickle.load(f)
+    landmarks_path = Landmarks.sidecar_path(map_path)
+    if os.path.exists(landmarks_path):
+        landmarks = Landmarks.load(landmarks_path)
+        if landmarks.matches_map(map):
+            map.landmarks = landmarks
+        else:
+            print(f"地标表与地图版本不一致，已忽略: {landmarks_path}")
+    index_path = LayerIndex.sidecar_path(map_path)
+    if os.path.exists(index_path):
+        index = LayerIndex.load(index_path)
+        if index.matches_map(map):
+            map.index = index
+        else:
+            print(f"属性索引与地图版本不一致，已忽略: {index_path}")
+    return map
+
 def write_path_shp(path_points, shp_path):
     """
     将路径点写入SHP文件,并生成对应的PRJ文件以定义WGS84坐标系
@@ -120,8 +293,7 @@ def write_path_shp(path_points, shp_path):
             AUTHORITY["EPSG","4326"]]""")
 
 if __name__ == "__main__":
-    with open('output/汤山/汤山map.bin', 'rb') as f:
-        map = pickle.load(f)
+    map = load_map('output/汤山/汤山map.bin')
     start = (31.989187,118.990892)
     end = (31.996765,118.982489)
     path = pp(map, start, end)
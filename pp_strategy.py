@@ -83,14 +83,51 @@ class RewardStrategy:
         if neighbor_cell.road_type == RoadType.NORMALWAY.value:
             g_increment *= 0.1
             
+class CostStrategy:
+    def edge_cost(current_cell, neighbor_cell, map, overlay=None):
+        """
+        计算从当前cell走到邻居的代价
+        :param current_cell: 当前节点
+        :param neighbor_cell: 邻居
+        :param map: 地图对象
+        :param overlay: 地图覆盖层(MapOverlay对象)，其中的通行性覆盖优先于拒绝策略
+        :return: 代价，不可通行时返回None
+        """
+        passable = overlay.passable.get(neighbor_cell.h3_index) if overlay is not None else None
+        if passable is False:
+            return None
+        # 拒绝策略
+        if passable is None and RejectStrategy.reject_cell(current_cell, neighbor_cell, map):
+            return None
+        # 计算g值的增量
+        g_increment = h3.point_dist(current_cell.center, neighbor_cell.center)
+        # 奖励策略
+        RewardStrategy.reward_cell_by_road(neighbor_cell, g_increment)
+        if overlay is not None:
+            g_increment *= overlay.cost_scale.get(neighbor_cell.h3_index, 1.0)
+        return g_increment
+
+class SearchState:
+    """
+    单次搜索的状态，键为Cell对象
+    状态不写入Cell，多个查询可以同时在同一张地图上进行
+    """
+    def __init__(self, epsilon=1.0):
+        self.epsilon = epsilon  # 启发值权重 f = g + epsilon * h
+        self.g = {}
+        self.h = {}
+        self.f = {}
+        self.father = {}
+
 class RoadpointStrategy:
-    def roadpoint_enhance(current_cell, road_adjacency_list, open_set, end_cell):
+    def roadpoint_enhance(current_cell, road_adjacency_list, open_set, end_cell, state):
         """
         路网点增强
         :param current_cell: 当前Cell对象
         :param road_map: 路网邻接表
         :param open_set: 待评估的节点集合
         :param end_cell: 终点Cell对象
+        :param state: 搜索状态(SearchState对象)
         :return: None
         """
         # 如果当前cell是路口，则增强其邻接cell的g值
@@ -103,10 +140,10 @@ class RoadpointStrategy:
                     neighbor_cell = Cell(neighbor_index)
                     g_increment = h3.point_dist(current_cell.center, neighbor_cell.center)
                     g_increment *= 0.2  # 奖励策略
-                    neighbor_cell.g = current_cell.g + g_increment
-                    neighbor_cell.h = h3.point_dist(neighbor_cell.center, end_cell.center)
-                    neighbor_cell.f = neighbor_cell.g + neighbor_cell.h
-                    neighbor_cell.father = current_cell  # 设置父节点
+                    state.g[neighbor_cell] = state.g[current_cell] + g_increment
+                    state.h[neighbor_cell] = h3.point_dist(neighbor_cell.center, end_cell.center)
+                    state.f[neighbor_cell] = state.g[neighbor_cell] + state.epsilon * state.h[neighbor_cell]
+                    state.father[neighbor_cell] = current_cell  # 设置父节点
                     neighbor_cell.road_type = RoadType.HIGHWAY.value  # 少量这个会有bug
                     open_set.add(neighbor_cell) # TODO：目前还没法剔除open_set中的冗余节点，同一个经纬位置上可能会有路网点和普通点重合。
 
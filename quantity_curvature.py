@@ -264,6 +264,7 @@ class QuantityCurvature:
         else:
             # TODO
             print(f"警告: {StringConstant.CURVATURE.value} 已经存在于地图属性中")
+        map.touch()
             
         return map
 
@@ -83,6 +83,7 @@ class QuantityCV:
             else:
                 # TODO
                 print(f"警告: {StringConstant.CV.value} 已经存在于地图属性中")
+            map.touch()
 
             return map
 
@@ -224,6 +224,7 @@ class QuantityExposure:
         else:
             # TODO
             print(f"警告: {StringConstant.EXPOSURE.value} 已经存在于地图属性中")
+        map.touch()
             
         return map
 
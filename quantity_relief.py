@@ -80,6 +80,7 @@ class QuantityRelief:
             else:
                 # TODO
                 print(f"警告: {StringConstant.RELIEF.value} 已经存在于地图属性中")
+            map.touch()
 
             return map
 
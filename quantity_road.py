@@ -1,6 +1,4 @@
 import pickle
-import geopandas as gpd
-from shapely.geometry import LineString, MultiLineString
 import h3
 from pp_enum import *
 import tqdm
@@ -14,6 +12,9 @@ class QuantityRoad:
         :param shapefile_path: SHP文件路径
         :return: 三维坐标数组 [[[lat1,lon1],[lat2,lon2]],...]
         """
+        import geopandas as gpd
+        from shapely.geometry import MultiLineString
+
         # 读取矢量文件
         gdf = gpd.read_file(shapefile_path)
         
@@ -61,6 +62,7 @@ class QuantityRoad:
             if h3_index in map.cells:
                 cell = map.cells[h3_index]
                 cell.road_type = RoadType.NORMALWAY.value  # TODO：默认先设置为可穿越的道路
+        map.touch()
 
 # 使用示例
 if __name__ == "__main__":
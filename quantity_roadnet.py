@@ -1,10 +1,10 @@
-import geopandas as gpd
 import h3
 from data_structures import *
 from tqdm import tqdm
 
 def generate_road_adjacency_list(shp_file_path, h3_resolution):
     """读取矢量路网,筛选出notpassbale的道路,最后生成矢量路网邻接表"""
+    import geopandas as gpd
     # 读取shp文件
     gdf = gpd.read_file(shp_file_path)
     # 整个矢量路网的h3索引数组
@@ -64,9 +64,11 @@ def quantity_by_road_adjacency_list(road_adjacency_list, map):
                 if line_index not in map.cells:
                     continue
                 map.cells[line_index].road_type = RoadType.HIGHWAY.value
+    map.touch()
 
 def quantity_junctions(junction_shp, map):
     """量化连接点"""
+    import geopandas as gpd
     # 打开junction_shp
     gdf = gpd.read_file(junction_shp)
     # 遍历gdf
@@ -81,6 +83,7 @@ def quantity_junctions(junction_shp, map):
         # 如果h3索引在map中，则设置为连接点
         if h3_index in map.cells:
             map.cells[h3_index].road_type = RoadType.ENTRYWAY.value
+    map.touch()
 
 if __name__ == "__main__":
     road_shp_path = 'data/mock1/road_shp2/mock_road.shp'
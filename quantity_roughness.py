@@ -83,6 +83,7 @@ class QuantityRoughness:
             else:
                 # TODO
                 print(f"警告: {StringConstant.ROUGHNESS.value} 已经存在于地图属性中")
+            map.touch()
             
             return map
 
@@ -1,9 +1,7 @@
-import geopandas as gpd
 import h3
 from data_structures import *
 from attribute_structures import *
 from tqdm import tqdm
-from shapely.geometry import Polygon,MultiPolygon
 
 class QuantityShp:
     def quantity_shp(map, shp_file, resolution):
@@ -12,6 +10,9 @@ class QuantityShp:
         :param map: 地图对象
         :param shp_file: 输出的shp文件路径
         """
+        import geopandas as gpd
+        from shapely.geometry import Polygon,MultiPolygon
+
         # 遍历shp文件中的每个几何对象，获取fclass字段和geometry字段
         gdf = gpd.read_file(shp_file)
         for index, row in tqdm(gdf.iterrows(), total=len(gdf), desc="量化"+shp_file):
@@ -64,6 +65,7 @@ class QuantityShp:
                     cell.show_attribute = AttributeIndex.ROAD.value
                 else:
                     print(f"未知的fclass: {fclass}")
+        map.touch()
 
 if __name__ == "__main__":
     # 示例用法
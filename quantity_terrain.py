@@ -45,6 +45,7 @@ class QuantityTerrain:
             for terrain in masked_data:
                 if terrain != nodata_value:
                     cell.terrain[int(terrain)] = cell.terrain.get(terrain, 0) + 1
+        map.touch()
             
         return map
 
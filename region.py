@@ -0,0 +1,261 @@
+import math
+import weakref
+import h3
+import numpy as np
+from cost_profile import EARTH_RADIUS_KM
+
+H3_RES_OFFSET = 52      # h3整数索引中分辨率字段的位置
+
+def point_dist(lat1, lon1, lat2, lon2):
+    """
+    向量化的球面距离(km)，计算方式与h3.point_dist相同
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    sin_lat = np.sin((lat2 - lat1) / 2.0)
+    sin_lon = np.sin((lon2 - lon1) / 2.0)
+    a = sin_lat * sin_lat + np.cos(lat1) * np.cos(lat2) * sin_lon * sin_lon
+    return 2.0 * np.arctan2(np.sqrt(a), np.sqrt(1.0 - a)) * EARTH_RADIUS_KM
+
+def h3_parents(h3_ints, resolution):
+    """
+    向量化求父cell：把分辨率字段改为目标分辨率，其后各级的3位数字置为7
+    :param h3_ints: uint64 h3索引数组，分辨率都不低于目标分辨率
+    :param resolution: 父cell分辨率
+    :return: uint64数组
+    """
+    resolution_mask = np.uint64(0xF << H3_RES_OFFSET)
+    digits_mask = np.uint64((1 << (3 * (15 - resolution))) - 1)
+    return (h3_ints & ~resolution_mask) | np.uint64(resolution << H3_RES_OFFSET) | digits_mask
+
+def polygon_parts(geojson):
+    """
+    GeoJSON Polygon/MultiPolygon拆分为单个多边形的坐标
+    :return: [[外环, 洞...], ...]，坐标为 (lon, lat)
+    """
+    if geojson["type"] == "Polygon":
+        return [geojson["coordinates"]]
+    if geojson["type"] == "MultiPolygon":
+        return list(geojson["coordinates"])
+    raise ValueError(f"不支持的几何类型: {geojson['type']}")
+
+def polygon_rings(geojson):
+    """
+    GeoJSON Polygon/MultiPolygon的全部环(含洞)，坐标为 (lon, lat)
+    :return: [N×2数组, ...]
+    """
+    return [np.asarray(ring, dtype=np.float64)[:, :2] for polygon in polygon_parts(geojson) for ring in polygon]
+
+def points_in_rings(rings, lat, lon):
+    """
+    射线法判断点是否在多边形内(奇偶规则，洞与多部件自然成立)
+    :param rings: polygon_rings的结果
+    :param lat: 纬度数组
+    :param lon: 经度数组
+    :return: 布尔数组
+    """
+    inside = np.zeros(len(lat), dtype=bool)
+    for ring in rings:
+        x1, y1 = ring[:, 0], ring[:, 1]
+        x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+        for ax, ay, bx, by in zip(x1.tolist(), y1.tolist(), x2.tolist(), y2.tolist()):
+            if ay == by:
+                continue
+            crosses = (ay > lat) != (by > lat)
+            x = ax + (lat - ay) * (bx - ax) / (by - ay)
+            inside ^= crosses & (lon < x)
+    return inside
+
+class RegionIndex:
+    """
+    区域查询索引
+    节点编号与地图cell的插入顺序一致，与CompiledMap、LayerIndex的节点编号相同；
+    cell按较粗分辨率的父cell分组，多边形查询时完全落在多边形内的组整体接受，只对边界上的组逐点判断，
+    大范围查询不会展开成大量h3字符串；判断规则与h3.polyfill相同，以格心是否在多边形内为准
+    分组与矩形、多边形查询只用整数索引，h3索引字符串表与反查字典在半径查询等首次需要时才生成
+    """
+    _cache = weakref.WeakKeyDictionary()   # 地图对象 -> (cell数, RegionIndex)
+
+    def __init__(self, h3_indexes, centers):
+        """
+        :param h3_indexes: 节点编号 -> h3索引，字符串序列或uint64数组(如CompiledMap.h3_ints())
+        :param centers: N×2 格心坐标 (lat, lon)
+        """
+        if isinstance(h3_indexes, np.ndarray) and h3_indexes.dtype == np.uint64:
+            self.h3_ints = h3_indexes
+        else:
+            self.h3_indexes = list(h3_indexes)
+            self.h3_ints = np.array([h3.string_to_h3(index) for index in self.h3_indexes], dtype=np.uint64)
+        self.centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+        resolutions = (self.h3_ints >> np.uint64(H3_RES_OFFSET)) & np.uint64(0xF)
+        self.resolutions = sorted(set(resolutions.tolist()), reverse=True)
+        # 按纬度排序，矩形查询二分定位纬度范围
+        self.lat_order = np.argsort(self.centers[:, 0], kind="stable").astype(np.int32)
+        self.sorted_lat = self.centers[self.lat_order, 0]
+        # 按粗分辨率父cell分组，组内节点在group_nodes中连续存放
+        self.coarse_resolution = max(0, min(self.resolutions, default=0) - 3)
+        parents = h3_parents(self.h3_ints, self.coarse_resolution)
+        self.group_nodes = np.argsort(parents, kind="stable").astype(np.int32)
+        sorted_parents = parents[self.group_nodes]
+        self.group_starts = np.flatnonzero(np.r_[True, sorted_parents[1:] != sorted_parents[:-1]]) if len(parents) else \
+            np.zeros(0, dtype=np.int64)
+        grouped = self.centers[self.group_nodes]
+        if len(grouped):
+            self.group_min = np.minimum.reduceat(grouped, self.group_starts, axis=0)
+            self.group_max = np.maximum.reduceat(grouped, self.group_starts, axis=0)
+        else:
+            self.group_min = self.group_max = np.zeros((0, 2))
+
+    def __getattr__(self, name):
+        if name == "h3_indexes":
+            self.h3_indexes = [h3.h3_to_string(index) for index in self.h3_ints.tolist()]
+            return self.h3_indexes
+        if name == "node_ids":
+            self.node_ids = {index: i for i, index in enumerate(self.h3_indexes)}
+            return self.node_ids
+        raise AttributeError(name)
+
+    def __len__(self):
+        return len(self.h3_ints)
+
+    def for_map(map):
+        """
+        获取地图对应的区域索引，cell数不变时复用已构建的索引
+        :param map: 地图对象
+        :return: RegionIndex对象
+        """
+        cached = RegionIndex._cache.get(map)
+        if cached is None or cached[0] != len(map.cells):
+            centers = np.array([cell.center for cell in map.cells.values()], dtype=np.float64)
+            cached = (len(map.cells), RegionIndex(map.cells.keys(), centers))
+            RegionIndex._cache[map] = cached
+        return cached[1]
+
+    def for_graph(graph):
+        """
+        由CompiledMap构建区域索引，以内存映射方式打开的地图直接使用其整数索引数组，不生成h3索引字符串表
+        :param graph: CompiledMap对象
+        :return: RegionIndex对象
+        """
+        return RegionIndex(graph.h3_ints(), graph.centers)
+
+    def bbox(self, south, west, north, east):
+        """
+        格心在矩形范围内的cell
+        :return: 升序的节点编号数组
+        """
+        start = np.searchsorted(self.sorted_lat, south, side="left")
+        end = np.searchsorted(self.sorted_lat, north, side="right")
+        ids = self.lat_order[start:end]
+        lon = self.centers[ids, 1]
+        return np.sort(ids[(lon >= west) & (lon <= east)])
+
+    def radius(self, lat, lon, radius_km):
+        """
+        格心在圆内的cell：各分辨率下取覆盖圆的k环，再按格心距离过滤；k环比地图还大时直接扫描矩形范围
+        :param lat: 圆心纬度
+        :param lon: 圆心经度
+        :param radius_km: 半径(km)
+        :return: 升序的节点编号数组
+        """
+        candidates = []
+        for resolution in self.resolutions:
+            # 每多一环，到圆心的距离至少增加1.5倍边长(六边形内切方向)，边长取圆心处的实际边长并留余量
+            origin = h3.geo_to_h3(lat, lon, resolution)
+            edge = min(h3.exact_edge_length(e, unit='km') for e in h3.get_h3_unidirectional_edges_from_hexagon(origin))
+            k = math.ceil(radius_km / (1.5 * edge * 0.9)) + 1
+            if 3 * k * k + 3 * k + 1 > len(self.h3_ints):
+                candidates = None
+                break
+            for h3_index in h3.k_ring(origin, k):
+                i = self.node_ids.get(h3_index)
+                if i is not None:
+                    candidates.append(i)
+        if candidates is None:
+            dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+            dlon = dlat / max(math.cos(math.radians(min(abs(lat) + dlat, 89.9))), 1e-6)
+            ids = self.bbox(lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+        else:
+            ids = np.unique(np.array(candidates, dtype=np.int32))
+        distance = point_dist(lat, lon, self.centers[ids, 0], self.centers[ids, 1])
+        return ids[distance <= radius_km]
+
+    def polygon(self, geojson):
+        """
+        格心在多边形内的cell
+        :param geojson: GeoJSON Polygon/MultiPolygon，坐标为 (lon, lat)，可含洞
+        :return: 升序的节点编号数组
+        """
+        rings = polygon_rings(geojson)
+        vertices = np.concatenate(rings)
+        lon_min, lat_min = vertices.min(axis=0)
+        lon_max, lat_max = vertices.max(axis=0)
+        # 与多边形外包矩形相交的组
+        groups = np.flatnonzero((self.group_max[:, 0] >= lat_min) & (self.group_min[:, 0] <= lat_max) &
+                                (self.group_max[:, 1] >= lon_min) & (self.group_min[:, 1] <= lon_max))
+        if len(groups) == 0:
+            return np.zeros(0, dtype=np.int32)
+        # 组的外包矩形四角都在多边形内且没有多边形的边穿过矩形时，矩形完全在多边形内
+        # (只看顶点不够：两个部件之间的窄缝可能穿过矩形而缝的顶点都在矩形外)
+        g_min, g_max = self.group_min[groups], self.group_max[groups]
+        corners = ((g_min[:, 0], g_min[:, 1]), (g_min[:, 0], g_max[:, 1]),
+                   (g_max[:, 0], g_min[:, 1]), (g_max[:, 0], g_max[:, 1]))
+        full = np.ones(len(groups), dtype=bool)
+        for corner_lat, corner_lon in corners:
+            full &= points_in_rings(rings, corner_lat, corner_lon)
+        for ring in rings:
+            x1, y1 = ring[:, 0], ring[:, 1]
+            x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+            for ax, ay, bx, by in zip(x1.tolist(), y1.tolist(), x2.tolist(), y2.tolist()):
+                candidates = np.flatnonzero(full & (g_min[:, 0] <= max(ay, by)) & (g_max[:, 0] >= min(ay, by)) &
+                                            (g_min[:, 1] <= max(ax, bx)) & (g_max[:, 1] >= min(ax, bx)))
+                if len(candidates) == 0:
+                    continue
+                # 外包矩形与边的外包矩形重叠时，四角不全在边所在直线的同一侧即相交
+                sides = [np.sign((bx - ax) * (corner_lat[candidates] - ay) - (by - ay) * (corner_lon[candidates] - ax))
+                         for corner_lat, corner_lon in corners]
+                same_side = (np.all([side > 0 for side in sides], axis=0) |
+                             np.all([side < 0 for side in sides], axis=0))
+                full[candidates[~same_side]] = False
+        ends = np.r_[self.group_starts[1:], len(self.group_nodes)]
+
+        def members(selected):
+            if len(selected) == 0:
+                return np.zeros(0, dtype=np.int32)
+            return np.concatenate([self.group_nodes[self.group_starts[g]:ends[g]] for g in selected.tolist()])
+
+        inside = members(groups[full])
+        boundary = members(groups[~full])
+        boundary = boundary[points_in_rings(rings, self.centers[boundary, 0], self.centers[boundary, 1])]
+        return np.sort(np.concatenate([inside, boundary]))
+
+    def cells(self, ids):
+        """
+        节点编号转为h3索引，可传给MapOverlay.block、Corridor等
+        :param ids: 节点编号数组
+        :return: h3索引列表
+        """
+        return [h3.h3_to_string(index) for index in self.h3_ints[np.asarray(ids, dtype=np.int64)].tolist()]
+
+    def compact(self, ids):
+        """
+        节点编号转为压缩后的h3索引集合，完整覆盖父cell的子cell合并为父cell，可直接构造Corridor
+        :param ids: 节点编号数组
+        :return: h3索引集合
+        """
+        cells = self.cells(ids)
+        compacted = set()
+        for resolution in self.resolutions:
+            compacted.update(h3.compact([index for index in cells if h3.h3_get_resolution(index) == resolution]))
+        return compacted
+
+if __name__ == '__main__':
+    import time
+    from pp import load_map
+    map = load_map('output/汤山/汤山map.bin')
+    geojson = {"type": "Polygon", "coordinates": [[[118.97, 31.98], [119.00, 31.98], [119.00, 32.00],
+                                                   [118.97, 32.00], [118.97, 31.98]]]}
+    start = time.perf_counter()
+    ids = map.cells_in_polygon(geojson)
+    print(f"多边形内: {len(ids)}个cell, 用时 {(time.perf_counter() - start) * 1000:.2f}ms")
+    print(f"半径1km内: {len(map.cells_within(31.989187, 118.990892, 1.0))}个cell")
+    print(f"矩形内: {len(map.cells_in_bbox(31.98, 118.97, 31.99, 118.98))}个cell")
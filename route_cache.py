@@ -0,0 +1,140 @@
+import os
+import time
+import pickle
+from collections import OrderedDict
+from data_structures import *
+from locator import CellLocator
+from pp import pp, load_map, write_path_shp
+
+class RouteCache:
+    """
+    路径结果缓存
+    键为 (地图版本, pp()的其余参数, 覆盖层摘要, 吸附后的起点cell, 吸附后的终点cell)，
+    地图经量化函数、add_cell、CompiledMap.update_cells修改或覆盖层变化后版本号改变，旧结果自动失效；
+    按LRU淘汰，并限制条目数与存活时间，可选持久化到磁盘
+    """
+    def __init__(self, map, max_entries=1024, ttl=None, path=None):
+        """
+        :param map: 地图对象
+        :param max_entries: 最大条目数
+        :param ttl: 条目存活时间(秒)，None表示不过期
+        :param path: 持久化文件路径，存在时读取其中与当前地图版本一致的条目
+        """
+        self.map = map
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.routes = OrderedDict()     # 键 -> (写入时间, h3索引列表)，末尾为最近使用
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self.routes)
+
+    def key(self, start_index, end_index, options, overlay):
+        return (self.map.version, options, overlay.fingerprint() if overlay is not None else None,
+                start_index, end_index)
+
+    def pp(self, start, end, overlay=None, **options):
+        """
+        带缓存的路径规划，参数与pp()相同，pp()的其余参数(epsilon、bidirectional等)一并计入缓存键
+        :param start: 起点坐标
+        :param end: 终点坐标
+        :param overlay: 地图覆盖层(MapOverlay对象)
+        :return: path: 路径对象
+        """
+        locator = CellLocator.for_map(self.map)
+        start_index = locator.snap(start[0], start[1], overlay=overlay)
+        end_index = locator.snap(end[0], end[1], overlay=overlay)
+        if start_index is None or end_index is None:
+            raise ValueError("起点或终点不在地图范围内")
+        if "road_adjacency_list" in options or "corridor" in options:
+            # 路网邻接表与走廊无法作为缓存键，直接规划
+            return pp(self.map, start, end, overlay=overlay, **options)
+        key = self.key(start_index, end_index, tuple(sorted(options.items())), overlay)
+        entry = self.routes.get(key)
+        if entry is not None and (self.ttl is None or time.time() - entry[0] <= self.ttl):
+            self.hits += 1
+            self.routes.move_to_end(key)
+            path = Map()
+            for h3_index in entry[1]:
+                path.add_cell(self.map.cells[h3_index])
+            return path
+        self.misses += 1
+        # 以吸附后的格心规划，保证与缓存键一致
+        path = pp(self.map, self.map.cells[start_index].center, self.map.cells[end_index].center,
+                  overlay=overlay, **options)
+        self.routes[key] = (time.time(), list(path.cells.keys()))
+        self.routes.move_to_end(key)
+        while len(self.routes) > self.max_entries:
+            self.routes.popitem(last=False)
+        return path
+
+    def rebind(self, map):
+        """
+        切换到新加载的地图(如MapHandle热更新后)，清空全部条目
+        :param map: 地图对象
+        :return: None
+        """
+        self.map = map
+        self.routes.clear()
+
+    def purge(self):
+        """
+        删除过期条目与旧地图版本的条目
+        :return: 删除的条目数
+        """
+        now = time.time()
+        stale = [key for key, (created, _) in self.routes.items()
+                 if key[0] != self.map.version or (self.ttl is not None and now - created > self.ttl)]
+        for key in stale:
+            del self.routes[key]
+        return len(stale)
+
+    def stats(self):
+        """
+        命中统计
+        :return: dict
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.routes),
+        }
+
+    def save(self, path=None):
+        """
+        保存到磁盘
+        :param path: 文件路径，None表示使用构造时的路径
+        :return: None
+        """
+        self.purge()
+        with open(path or self.path, 'wb') as f:
+            pickle.dump(self.routes, f)
+
+    def load(self, path=None):
+        """
+        从磁盘读取，只保留与当前地图版本一致且未过期的条目
+        :param path: 文件路径，None表示使用构造时的路径
+        :return: None
+        """
+        with open(path or self.path, 'rb') as f:
+            self.routes = pickle.load(f)
+        self.purge()
+        while len(self.routes) > self.max_entries:
+            self.routes.popitem(last=False)
+
+if __name__ == '__main__':
+    map = load_map('output/汤山/汤山map.bin')
+    cache = RouteCache(map, ttl=3600, path='output/汤山/汤山routes.bin')
+    start = (31.989187, 118.990892)
+    end = (31.996765, 118.982489)
+    for _ in range(3):
+        path = cache.pp(start, end)
+    print(cache.stats())
+    cache.save()
+    write_path_shp([cell.center for cell in path.cells.values()], 'output/汤山/规划路径.shp')
@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import pickle
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from compiled_map import CompiledMap
+from graph_search import GraphSearch
+from locator import CellLocator
+from map_handle import MapHandle
+
+WARMUP_TIMEOUT = 120    # 等待全部工作进程完成预热的时限(秒)
+
+_graph = None       # 工作进程中以内存映射方式打开的CompiledMap
+_barrier = None     # 预热栅栏，保证每个工作进程都执行一次预热任务
+
+def _init_worker(directory, barrier):
+    global _graph, _barrier
+    _graph = CompiledMap.load(directory, mmap=True)
+    # 首个请求之前准备好邻接表并读入共享数组的全部页面
+    _graph.adjacency()
+    for array in (_graph.neighbors, _graph.edge_cost, _graph.centers):
+        array.sum()
+    _barrier = barrier
+
+def _ready():
+    """
+    预热任务：在栅栏处等待全部工作进程，每个进程恰好执行一个，返回进程号
+    """
+    _barrier.wait(timeout=WARMUP_TIMEOUT)
+    return os.getpid()
+
+def _route(source, target, epsilon, time_budget):
+    """
+    工作进程：规划一条路径
+    有时间预算时使用ARA*，返回预算内得到的最好路径
+    :return: (代价, 节点编号列表, 次优界)，预算内无解或不可达时返回 None
+    """
+    if time_budget is None:
+        stats = {}
+        cost, path = GraphSearch.astar(_graph, source, target, epsilon=epsilon, stats=stats)
+        return (cost, path, stats["bound"]) if path else None
+    best = None
+    for best in GraphSearch.ara(_graph, source, target, epsilon=max(epsilon, 3.0), time_budget=time_budget):
+        pass
+    return best
+
+class ServingMap:
+    """
+    服务中的一个地图版本：用于坐标吸附的地图、内存映射的CompiledMap与挂接在其上的进程池
+    """
+    def __init__(self, map_path, compiled_dir, processes=None):
+        """
+        :param map_path: 地图文件路径，用于坐标吸附
+        :param compiled_dir: CompiledMap.save保存的目录，不存在或比地图文件旧时由地图编译生成
+        :param processes: 搜索进程数，None表示CPU核数
+        """
+        with open(map_path, 'rb') as f:
+            self.map = pickle.load(f)
+        meta_path = os.path.join(compiled_dir, "meta.bin")
+        if not os.path.exists(meta_path) or os.path.getmtime(meta_path) < os.path.getmtime(map_path):
+            CompiledMap.compile(self.map).save(compiled_dir)
+        self.graph = CompiledMap.load(compiled_dir, mmap=True)
+        self.locator = CellLocator.for_map(self.map)
+        # 用spawn启动工作进程：fork会继承已打开的客户端连接，导致连接关闭后客户端收不到EOF
+        processes = processes or os.cpu_count()
+        context = multiprocessing.get_context("spawn")
+        self.executor = ProcessPoolExecutor(processes, mp_context=context,
+                                            initializer=_init_worker, initargs=(compiled_dir, context.Barrier(processes)))
+        # 预热：每个预热任务在栅栏处等待，只有全部进程都启动并完成初始化后才会一起返回，首个请求不再承担启动开销
+        for future in [self.executor.submit(_ready) for _ in range(processes)]:
+            future.result()
+
+    def close(self, wait=True):
+        """
+        关闭进程池
+        :param wait: False时已提交的搜索继续完成后进程再退出，用于热更新时让在途请求跑完
+        """
+        self.executor.shutdown(wait=wait, cancel_futures=wait)
+
+class RouteServer:
+    """
+    常驻的路径规划HTTP/JSON服务
+    启动时加载一次地图，搜索交给进程池；相同的在途请求合并为一次搜索，支持逐请求的截止时间，
+    请求超时后，若没有其他请求在等待同一结果则取消尚未开始的搜索
+    POST /route {"start": [lat, lon], "end": [lat, lon], "epsilon": 1.0, "deadline": 秒}
+    返回GeoJSON Feature(LineString)，properties中包含代价、次优界与h3索引序列
+    POST /reload 在后台重新加载启动时指定的地图文件并热替换；不接受请求中的路径，客户端不能让服务读取或写入任意文件
+    """
+    def __init__(self, map_path, compiled_dir, processes=None):
+        """
+        :param map_path: 地图文件路径，用于坐标吸附
+        :param compiled_dir: CompiledMap.save保存的目录，不存在时由地图编译生成
+        :param processes: 搜索进程数，None表示CPU核数
+        """
+        self.maps = MapHandle(lambda source: ServingMap(*source, processes), (map_path, compiled_dir))
+        # 旧版本的进程池在在途搜索完成后退出
+        self.maps.on_swap(lambda old, new: old.close(wait=False))
+        self.inflight = {}      # 请求键 -> [asyncio.Future, 等待者数]
+        self.coalesced = 0      # 合并的请求数
+
+    def close(self):
+        self.maps.get().close()
+
+    async def route(self, request):
+        """
+        处理一次路径规划请求
+        :param request: 请求字典
+        :return: (HTTP状态码, 响应字典)
+        """
+        try:
+            start = [float(v) for v in request["start"]]
+            end = [float(v) for v in request["end"]]
+            epsilon = float(request.get("epsilon", 1.0))
+            deadline = request.get("deadline")
+            deadline = None if deadline is None else float(deadline)
+        except (KeyError, TypeError, ValueError):
+            return 400, {"error": "请求格式错误"}
+        # 整个请求使用同一个地图版本，热更新不影响在途请求
+        generation, serving = self.maps.snapshot()
+        while True:
+            start_index = serving.locator.snap(start[0], start[1])
+            end_index = serving.locator.snap(end[0], end[1])
+            if start_index is None or end_index is None:
+                return 404, {"error": "起点或终点不在地图范围内"}
+            source = serving.graph.node_ids[start_index]
+            target = serving.graph.node_ids[end_index]
+
+            # 相同键的在途请求共用一次搜索
+            key = (generation, source, target, epsilon, deadline)
+            entry = self.inflight.get(key)
+            if entry is not None:
+                self.coalesced += 1
+                break
+            try:
+                future = asyncio.get_running_loop().run_in_executor(
+                    serving.executor, _route, source, target, epsilon, deadline)
+            except RuntimeError:
+                # 取得快照后加载线程完成了替换并关闭了旧进程池，改用新版本重新提交
+                latest, serving = self.maps.snapshot()
+                if latest == generation:
+                    return 503, {"error": "搜索进程池已关闭"}
+                generation = latest
+                continue
+            entry = self.inflight[key] = [future, 0]
+            future.add_done_callback(lambda _: self.inflight.pop(key, None))
+            break
+        entry[1] += 1
+        try:
+            # 进程内ARA*按预算自行结束，外层多留一点余量用于进程间通信
+            timeout = None if deadline is None else deadline + 0.5
+            result = await asyncio.wait_for(asyncio.shield(entry[0]), timeout)
+        except asyncio.TimeoutError:
+            return 504, {"error": "超出截止时间"}
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not entry[0].done():
+                entry[0].cancel()   # 无人等待，取消尚未开始的搜索
+        if result is None:
+            return 404, {"error": "不可达"}
+        cost, path, bound = result
+        return 200, {
+            "type": "Feature",
+            "geometry": {
+                "type": "LineString",
+                "coordinates": [[float(lon), float(lat)] for lat, lon in serving.graph.path_points(path)],
+            },
+            "properties": {
+                "cost": cost,
+                "bound": bound,
+                "cells": [serving.graph.h3_indexes[i] for i in path],
+            },
+        }
+
+    async def handle(self, reader, writer):
+        """
+        处理一个HTTP连接，支持keep-alive
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                started = time.perf_counter()
+                if method == "POST" and path == "/route":
+                    try:
+                        status, response = await self.route(json.loads(body or b"{}"))
+                    except json.JSONDecodeError:
+                        status, response = 400, {"error": "请求格式错误"}
+                elif method == "POST" and path == "/reload":
+                    self.maps.reload()
+                    status, response = 202, {"generation": self.maps.generation}
+                elif method == "GET" and path == "/health":
+                    status, response = 200, {"nodes": len(self.maps.get().graph), "generation": self.maps.generation,
+                                             "inflight": len(self.inflight), "coalesced": self.coalesced}
+                else:
+                    status, response = 404, {"error": "未知接口"}
+                payload = json.dumps(response, ensure_ascii=False).encode("utf-8")
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status < 300 else 'Error'}\r\n"
+                    f"Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"X-Elapsed-Ms: {(time.perf_counter() - started) * 1000:.1f}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8080):
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"路径规划服务已启动: http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+if __name__ == '__main__':
+    server = RouteServer('output/汤山/汤山map.bin', 'output/汤山/汤山compiled')
+    try:
+        asyncio.run(server.serve())
+    finally:
+        server.close()
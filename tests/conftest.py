@@ -0,0 +1,46 @@
+import os
+import sys
+import random
+import h3
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_structures import *
+from attribute_structures import *
+from pp_enum import *
+
+LAT0, LON0 = 31.99, 118.98
+
+def build_map(resolution=11, size=0.02, seed=0, water=None):
+    """
+    合成测试地图：高程随纬度升高，中央为圆形水体，靠东侧有一条南北向道路
+    :param water: 函数 (lat, lon) -> 是否为水体，None表示中央圆形水体
+    """
+    random.seed(seed)
+    geojson = {"type": "Polygon", "coordinates": [[[LON0, LAT0], [LON0, LAT0 + size], [LON0 + size, LAT0 + size],
+                                                   [LON0 + size, LAT0], [LON0, LAT0]]]}
+    if water is None:
+        def water(lat, lon):
+            return (lat - LAT0 - size / 2) ** 2 + (lon - LON0 - size / 2) ** 2 < (size / 5) ** 2
+    map = Map()
+    for h3_index in h3.polyfill_geojson(geojson, resolution):
+        cell = Cell(h3_index)
+        lat, lon = cell.center
+        cell.elevation = 10 + 2000 * (lat - LAT0)
+        cell.slope = 1.0
+        map.add_cell(cell)
+    for cell in map.cells.values():
+        cell.attribute.append(Relief(0.5))
+        lat, lon = cell.center
+        if water(lat, lon):
+            cell.attribute.append(Water(1))
+            cell.show_attribute = AttributeIndex.WATER.value
+        elif abs(lon - LON0 - size * 0.8) < size * 0.01:
+            cell.road_type = RoadType.NORMALWAY.value
+    map.attributes[StringConstant.RELIEF.value] = 0
+    return map
+
+@pytest.fixture
+def make_map():
+    return build_map
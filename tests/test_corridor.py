@@ -0,0 +1,18 @@
+import h3
+import pytest
+from corridor import Corridor
+
+WEST = [[118.990, 31.990], [118.995, 31.990], [118.995, 32.000], [118.990, 32.000], [118.990, 31.990]]
+EAST = [[118.997, 31.990], [119.002, 31.990], [119.002, 32.000], [118.997, 32.000], [118.997, 31.990]]
+
+def test_from_multipolygon_covers_both_parts():
+    corridor = Corridor.from_polygon({"type": "MultiPolygon", "coordinates": [[WEST], [EAST]]}, 10)
+    west = Corridor.from_polygon({"type": "Polygon", "coordinates": [WEST]}, 10)
+    east = Corridor.from_polygon({"type": "Polygon", "coordinates": [EAST]}, 10)
+    assert corridor.cells == {10: west.cells[10] | east.cells[10]}
+    assert corridor.contains(h3.geo_to_h3(31.995, 118.9925, 12))
+    assert corridor.contains(h3.geo_to_h3(31.995, 118.9995, 12))
+
+def test_from_polygon_rejects_other_geometry():
+    with pytest.raises(ValueError):
+        Corridor.from_polygon({"type": "LineString", "coordinates": WEST}, 10)
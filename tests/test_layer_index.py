@@ -0,0 +1,28 @@
+import pickle
+import numpy as np
+from compiled_map import CompiledMap
+from layer_index import LayerIndex
+from pp import load_map
+
+def save_map(map, path):
+    with open(path, 'wb') as f:
+        pickle.dump(map, f)
+
+def test_save_and_load_round_trip(make_map, tmp_path):
+    map = make_map()
+    index = LayerIndex.build(CompiledMap.compile(map))
+    index.save(tmp_path / "index.npz")
+    loaded = LayerIndex.load(tmp_path / "index.npz")
+    assert loaded.h3_indexes == index.h3_indexes and loaded.map_version == map.version
+    assert np.array_equal(loaded.landcover("water"), index.landcover("water"))
+    assert np.array_equal(loaded.range_ids("elevation", low=20), index.range_ids("elevation", low=20))
+
+def test_load_map_ignores_stale_sidecar(make_map, tmp_path):
+    map_path = str(tmp_path / "map.bin")
+    map = make_map()
+    save_map(map, map_path)
+    LayerIndex.build(CompiledMap.compile(map)).save(LayerIndex.sidecar_path(map_path))
+    assert load_map(map_path).index is not None
+    map.touch()     # 地图重新生成或修改后索引文件没有随之更新
+    save_map(map, map_path)
+    assert load_map(map_path).index is None
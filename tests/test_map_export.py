@@ -0,0 +1,173 @@
+import struct
+import numpy as np
+import pytest
+from compiled_map import CompiledMap
+from map_export import (FGB_MAGIC, FGB_MULTIPOLYGON, FGB_POLYGON, FGB_STRING, FGB_COLUMN_TYPES, _FlatBuffer,
+                        cell_boundaries, write_cells_to_flatgeobuf, write_cells_to_geoparquet, write_dissolved)
+
+# FlatGeobuf列类型 -> 属性值的struct格式，字符串、JSON与二进制为长度前缀的字节串
+PROPERTY_FORMATS = {0: "<b", 1: "<B", 2: "<?", 3: "<h", 4: "<H", 5: "<i", 6: "<I", 7: "<q", 8: "<Q", 9: "<f", 10: "<d"}
+
+class FlatTable:
+    """
+    读取FlatBuffers表，与map_export._FlatBuffer对应
+    """
+    def __init__(self, buf, pos):
+        self.buf = buf
+        self.pos = pos
+        vtable = pos - struct.unpack_from("<i", buf, pos)[0]
+        vtable_size = struct.unpack_from("<H", buf, vtable)[0]
+        self.offsets = struct.unpack_from(f"<{(vtable_size - 4) // 2}H", buf, vtable + 4)
+
+    def root(buf):
+        return FlatTable(buf, struct.unpack_from("<I", buf, 0)[0])
+
+    def _field(self, slot):
+        offset = self.offsets[slot] if slot < len(self.offsets) else 0
+        return self.pos + offset if offset else None
+
+    def scalar(self, slot, kind, default=0):
+        pos = self._field(slot)
+        return default if pos is None else struct.unpack_from(_FlatBuffer.SCALARS[kind], self.buf, pos)[0]
+
+    def _target(self, slot):
+        pos = self._field(slot)
+        return None if pos is None else pos + struct.unpack_from("<I", self.buf, pos)[0]
+
+    def string(self, slot):
+        pos = self._target(slot)
+        if pos is None:
+            return None
+        length = struct.unpack_from("<I", self.buf, pos)[0]
+        return bytes(self.buf[pos + 4:pos + 4 + length]).decode("utf-8")
+
+    def vector(self, slot, dtype):
+        pos = self._target(slot)
+        if pos is None:
+            return None
+        return np.frombuffer(self.buf, dtype=dtype, count=struct.unpack_from("<I", self.buf, pos)[0], offset=pos + 4)
+
+    def table(self, slot):
+        pos = self._target(slot)
+        return None if pos is None else FlatTable(self.buf, pos)
+
+    def tables(self, slot):
+        pos = self._target(slot)
+        if pos is None:
+            return []
+        count = struct.unpack_from("<I", self.buf, pos)[0]
+        slots = [pos + 4 + 4 * i for i in range(count)]
+        return [FlatTable(self.buf, slot_pos + struct.unpack_from("<I", self.buf, slot_pos)[0]) for slot_pos in slots]
+
+def decode_geometry(geometry, geometry_type):
+    """
+    Geometry表 -> GeoJSON坐标：Polygon为环列表，MultiPolygon为多边形列表
+    """
+    if geometry_type == FGB_MULTIPOLYGON:
+        return [decode_geometry(part, FGB_POLYGON) for part in geometry.tables(7)]
+    if geometry_type != FGB_POLYGON:
+        raise ValueError(f"不支持的几何类型: {geometry_type}")
+    xy = geometry.vector(1, "<f8").reshape(-1, 2)
+    ends = geometry.vector(0, "<u4")
+    ends = [len(xy)] if ends is None else ends.tolist()
+    return [xy[start:end].tolist() for start, end in zip([0] + ends[:-1], ends)]
+
+def decode_properties(data, columns):
+    properties = {}
+    pos = 0
+    while pos < len(data):
+        column = struct.unpack_from("<H", data, pos)[0]
+        name, column_type = columns[column]
+        pos += 2
+        if column_type in PROPERTY_FORMATS:
+            value_format = PROPERTY_FORMATS[column_type]
+            properties[name] = struct.unpack_from(value_format, data, pos)[0]
+            pos += struct.calcsize(value_format)
+        else:
+            length = struct.unpack_from("<I", data, pos)[0]
+            value = bytes(data[pos + 4:pos + 4 + length])
+            properties[name] = value.decode("utf-8") if column_type == FGB_STRING else value
+            pos += 4 + length
+    return properties
+
+def read_flatgeobuf(fgb_path):
+    """
+    读取map_export写出的FlatGeobuf文件(不含空间索引)
+    :param fgb_path: .fgb文件路径
+    :return: (头部字典, 要素列表)
+             头部字典含 name、geometry_type、columns([(列名, 列类型), ...])、features_count、crs(EPSG代码)；
+             要素为 (GeoJSON坐标, 属性字典)
+    """
+    with open(fgb_path, 'rb') as f:
+        buf = f.read()
+    if buf[:3] != FGB_MAGIC[:3] or buf[4:7] != FGB_MAGIC[4:7]:
+        raise ValueError(f"不是FlatGeobuf文件: {fgb_path}")
+    header_size = struct.unpack_from("<I", buf, 8)[0]
+    table = FlatTable.root(memoryview(buf)[12:12 + header_size])
+    crs = table.table(10)
+    header = {
+        "name": table.string(0),
+        "geometry_type": table.scalar(2, "u8"),
+        "columns": [(column.string(0), column.scalar(1, "u8")) for column in table.tables(7)],
+        "features_count": table.scalar(8, "u64"),
+        "crs": None if crs is None else crs.scalar(1, "i32"),
+    }
+    if table.scalar(9, "u16", default=16) and header["features_count"]:
+        raise ValueError(f"不支持带空间索引的文件: {fgb_path}")
+    features = []
+    pos = 12 + header_size
+    while pos < len(buf):
+        size = struct.unpack_from("<I", buf, pos)[0]
+        feature = FlatTable.root(memoryview(buf)[pos + 4:pos + 4 + size])
+        geometry = feature.table(0)
+        geometry_type = geometry.scalar(6, "u8", default=header["geometry_type"])
+        data = feature.vector(1, np.uint8)
+        properties = {} if data is None else decode_properties(data, header["columns"])
+        features.append((decode_geometry(geometry, geometry_type), properties))
+        pos += 4 + size
+    return header, features
+
+def same_value(actual, expected):
+    return actual == expected or (expected != expected and actual != actual)
+
+@pytest.mark.parametrize("layers", [None, ["slope", "show_attribute"]])
+def test_flatgeobuf_round_trip(make_map, tmp_path, layers):
+    graph = CompiledMap.compile(make_map())
+    path = tmp_path / "cells.fgb"
+    write_cells_to_flatgeobuf(graph, path, layers=layers, chunk_size=1000)
+    header, features = read_flatgeobuf(path)
+    names = list(graph.layers) if layers is None else layers
+    assert header["name"] == "cells" and header["geometry_type"] == FGB_POLYGON and header["crs"] == 4326
+    assert header["columns"] == [("h3_index", FGB_STRING)] + \
+        [(name, FGB_COLUMN_TYPES[np.asarray(graph.layers[name]).dtype]) for name in names]
+    assert header["features_count"] == len(features) == len(graph)
+    coords, offsets = cell_boundaries(graph.h3_indexes)
+    for i, (rings, properties) in enumerate(features):
+        assert properties["h3_index"] == graph.h3_indexes[i]
+        assert len(rings) == 1 and np.array_equal(rings[0], coords[offsets[i]:offsets[i + 1]])
+        for name in names:
+            assert same_value(properties[name], np.asarray(graph.layers[name])[i].item()), (i, name)
+
+def test_dissolved_flatgeobuf(make_map, tmp_path):
+    graph = CompiledMap.compile(make_map())
+    path = str(tmp_path / "relief.fgb")
+    count = write_dissolved(graph, path, "elevation", bins=[15, 20, 25], merge=False)
+    header, features = read_flatgeobuf(path)
+    assert header["geometry_type"] == FGB_MULTIPOLYGON and len(features) == count
+    assert sum(properties["cells"] for _, properties in features) == len(graph)
+    for polygons, properties in features:
+        low, high = properties.get("low", -np.inf), properties.get("high", np.inf)
+        assert low < high and all(len(ring) >= 4 for polygon in polygons for ring in polygon)
+
+def test_geoparquet(make_map, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    graph = CompiledMap.compile(make_map())
+    path = tmp_path / "cells.parquet"
+    write_cells_to_geoparquet(graph, path, layers=["elevation", "landcover"], chunk_size=1000)
+    table = pq.read_table(path)
+    assert table.column("h3_index").to_pylist() == list(graph.h3_indexes)
+    assert np.array_equal(table.column("landcover").to_numpy(), np.asarray(graph.layers["landcover"]))
+    coords, offsets = cell_boundaries(graph.h3_indexes[:1])
+    wkb = table.column("geometry")[0].as_py()
+    assert struct.unpack_from("<BIII", wkb) == (1, 3, 1, len(coords))
+    assert np.array_equal(np.frombuffer(wkb, dtype="<f8", offset=13).reshape(-1, 2), coords)
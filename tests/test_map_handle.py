@@ -0,0 +1,37 @@
+import threading
+import pytest
+from map_handle import MapHandle
+
+def test_source_change_during_load_is_not_lost():
+    started, release = threading.Event(), threading.Event()
+    loaded = []
+
+    def loader(source):
+        loaded.append(source)
+        if source == "a":
+            started.set()
+            release.wait(5)
+        return source
+
+    maps = MapHandle(loader, "init")
+    thread = maps.reload("a")
+    assert started.wait(5)
+    maps.reload("b")
+    release.set()
+    thread.join(5)
+    assert loaded == ["init", "a", "b"]
+    assert maps.get() == "b" and maps.generation == 2
+
+def test_failed_load_is_reported():
+    def loader(source):
+        if source == "bad":
+            raise OSError("missing")
+        return source
+
+    maps = MapHandle(loader, "good")
+    with pytest.raises(OSError):
+        maps.reload("bad", wait=True)
+    assert isinstance(maps.error, OSError)
+    assert maps.get() == "good" and maps.generation == 0
+    maps.reload("good", wait=True)
+    assert maps.error is None and maps.generation == 1
@@ -0,0 +1,44 @@
+import random
+import pytest
+from conftest import LAT0, LON0
+from compiled_map import CompiledMap
+from landmarks import Landmarks
+from overlay import MapOverlay
+from pp import pp
+from pp_strategy import CostStrategy
+from pp_enum import AttributeIndex
+
+SIZE = 0.02
+
+def path_cost(map, path, overlay):
+    cells = list(path.cells.values())[::-1]     # pp()的路径从终点到起点
+    return sum(CostStrategy.edge_cost(a, b, map, overlay) for a, b in zip(cells, cells[1:]))
+
+@pytest.fixture
+def map_with_landmarks(make_map):
+    map = make_map(size=SIZE)
+    map.landmarks = Landmarks.build(CompiledMap.compile(map), k=8)
+    return map
+
+def test_is_monotone():
+    overlay = MapOverlay()
+    assert overlay.is_monotone()
+    assert overlay.block(["8b30910f4023fff"]).scale(["8b30910f4024fff"], 2.0).is_monotone()
+    assert not MapOverlay().open(["8b30910f4023fff"]).is_monotone()
+    assert not MapOverlay().scale(["8b30910f4023fff"], 0.5).is_monotone()
+
+@pytest.mark.parametrize("bidirectional", [False, True])
+def test_opened_overlay_ignores_landmarks(map_with_landmarks, bidirectional):
+    map = map_with_landmarks
+    water = [index for index, cell in map.cells.items() if cell.show_attribute == AttributeIndex.WATER.value]
+    overlay = MapOverlay().open(water)
+    landmarks = map.landmarks
+    rng = random.Random(1)
+    for _ in range(10):
+        start = (LAT0 + rng.uniform(0, SIZE), LON0 + rng.uniform(0, SIZE))
+        end = (LAT0 + rng.uniform(0, SIZE), LON0 + rng.uniform(0, SIZE))
+        map.landmarks = landmarks
+        with_landmarks = pp(map, start, end, bidirectional=bidirectional, overlay=overlay, epsilon=1.0)
+        map.landmarks = None
+        without = pp(map, start, end, bidirectional=bidirectional, overlay=overlay, epsilon=1.0)
+        assert path_cost(map, with_landmarks, overlay) == pytest.approx(path_cost(map, without, overlay))
@@ -0,0 +1,30 @@
+import pytest
+from conftest import LAT0, LON0
+from pp import pp
+
+SIZE = 0.02
+CENTER = (LAT0 + SIZE / 2, LON0 + SIZE / 2)
+
+def moat(lat, lon):
+    # 中央一圈环形水体，环内的陆地与外界不连通
+    d2 = (lat - CENTER[0]) ** 2 + (lon - CENTER[1]) ** 2
+    return (SIZE / 8) ** 2 < d2 < (SIZE / 4) ** 2
+
+@pytest.mark.parametrize("bidirectional", [False, True])
+def test_unreachable_target_raises(make_map, bidirectional):
+    map = make_map(size=SIZE, water=moat)
+    with pytest.raises(ValueError, match="不可达"):
+        pp(map, (LAT0 + 0.001, LON0 + 0.001), CENTER, bidirectional=bidirectional)
+
+@pytest.mark.parametrize("bidirectional", [False, True])
+def test_same_start_and_end(make_map, bidirectional):
+    map = make_map(size=SIZE)
+    path = pp(map, (LAT0 + 0.001, LON0 + 0.001), (LAT0 + 0.001, LON0 + 0.001), bidirectional=bidirectional)
+    assert len(path.cells) == 1
+
+def test_bidirectional_matches_unidirectional(make_map):
+    map = make_map(size=SIZE)
+    start, end = (LAT0 + 0.001, LON0 + 0.001), (LAT0 + SIZE - 0.001, LON0 + SIZE - 0.001)
+    forward = list(pp(map, start, end, epsilon=1.0).cells)
+    both = list(pp(map, start, end, bidirectional=True).cells)
+    assert forward[0] == both[0] and forward[-1] == both[-1]
@@ -0,0 +1,25 @@
+from conftest import LAT0, LON0
+from route_cache import RouteCache
+
+START, END = (LAT0 + 0.001, LON0 + 0.001), (LAT0 + 0.019, LON0 + 0.019)
+
+def test_repeated_query_hits(make_map):
+    cache = RouteCache(make_map())
+    first = cache.pp(START, END)
+    second = cache.pp(START, END)
+    assert list(first.cells) == list(second.cells)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_options_are_part_of_key(make_map):
+    cache = RouteCache(make_map())
+    cache.pp(START, END, epsilon=1.0)
+    cache.pp(START, END, epsilon=1.5)
+    assert (cache.hits, cache.misses, len(cache)) == (0, 2, 2)
+
+def test_map_change_invalidates(make_map):
+    map = make_map()
+    cache = RouteCache(map)
+    cache.pp(START, END)
+    map.touch()
+    cache.pp(START, END)
+    assert cache.misses == 2
@@ -0,0 +1,182 @@
+import math
+import h3
+import numpy as np
+import pytest
+from compiled_map import CompiledMap
+from map_export import cell_boundaries
+from region import h3_parents
+from tile_server import TileSource, encode_tile, project
+
+LAT, LON = 31.998, 118.99
+
+def _read_varint(data, pos):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            return value, pos
+
+def _fields(data):
+    """
+    逐个读取protobuf字段
+    :return: 生成器，产出 (字段号, 值)，varint字段为整数，长度分隔字段为bytes，定长字段为原始字节
+    """
+    pos = 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        wire_type = key & 7
+        if wire_type == 0:
+            value, pos = _read_varint(data, pos)
+        elif wire_type == 2:
+            length, pos = _read_varint(data, pos)
+            value, pos = data[pos:pos + length], pos + length
+        elif wire_type in (1, 5):
+            size = 8 if wire_type == 1 else 4
+            value, pos = data[pos:pos + size], pos + size
+        else:
+            raise ValueError(f"不支持的protobuf字段类型: {wire_type}")
+        yield key >> 3, value
+
+def _packed(data):
+    values, pos = [], 0
+    while pos < len(data):
+        value, pos = _read_varint(data, pos)
+        values.append(value)
+    return values
+
+def _unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+def _decode_geometry(commands):
+    """
+    几何命令 -> 环列表，坐标为瓦片坐标，不含闭合点
+    """
+    rings, ring = [], []
+    x = y = 0
+    i = 0
+    while i < len(commands):
+        command, count = commands[i] & 7, commands[i] >> 3
+        i += 1
+        if command == 7:
+            rings.append(ring)
+            ring = []
+            continue
+        if command not in (1, 2):
+            raise ValueError(f"未知的几何命令: {command}")
+        for _ in range(count):
+            x += _unzigzag(commands[i])
+            y += _unzigzag(commands[i + 1])
+            i += 2
+            ring.append((x, y))
+    return rings
+
+def decode_tile(data):
+    """
+    解码Mapbox Vector Tile
+    :param data: MVT bytes
+    :return: 图层名 -> {"extent": 坐标范围, "features": [{"id", "type", "properties", "geometry"}, ...]}，
+             geometry为环列表
+    """
+    layers = {}
+    for number, layer_data in _fields(data):
+        if number != 3:
+            continue
+        name, extent, keys, values, features = None, 4096, [], [], []
+        for field, value in _fields(layer_data):
+            if field == 1:
+                name = bytes(value).decode("utf-8")
+            elif field == 2:
+                features.append(value)
+            elif field == 3:
+                keys.append(bytes(value).decode("utf-8"))
+            elif field == 4:
+                for kind, raw in _fields(value):
+                    if kind == 1:
+                        values.append(bytes(raw).decode("utf-8"))
+                    elif kind in (2, 3):
+                        values.append(float(np.frombuffer(raw, dtype="<f4" if kind == 2 else "<f8")[0]))
+                    elif kind == 6:
+                        values.append(_unzigzag(raw))
+                    elif kind == 4:
+                        values.append(raw - (1 << 64) if raw >= 1 << 63 else raw)
+                    else:
+                        values.append(bool(raw) if kind == 7 else raw)
+            elif field == 5:
+                extent = value
+        decoded = []
+        for feature_data in features:
+            feature = {"id": None, "type": 0, "properties": {}, "geometry": []}
+            for field, value in _fields(feature_data):
+                if field == 1:
+                    feature["id"] = value
+                elif field == 2:
+                    tags = _packed(value)
+                    feature["properties"] = {keys[k]: values[v] for k, v in zip(tags[::2], tags[1::2])}
+                elif field == 3:
+                    feature["type"] = value
+                elif field == 4:
+                    feature["geometry"] = _decode_geometry(_packed(value))
+            decoded.append(feature)
+        layers[name] = {"extent": extent, "features": decoded}
+    return layers
+
+def tile_xy(z, lat=LAT, lon=LON):
+    n = 2 ** z
+    return z, int((lon + 180.0) / 360.0 * n), int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+
+@pytest.fixture
+def source(make_map):
+    return TileSource(CompiledMap.compile(make_map()), ["elevation", "slope", "show_attribute", "road_type", "landcover"])
+
+def test_h3_parents_matches_h3(make_map):
+    indexes = list(make_map().cells)
+    h3_ints = np.array([h3.string_to_h3(index) for index in indexes], dtype=np.uint64)
+    for resolution in (0, 5, 8, 10, 11):
+        expected = [h3.h3_to_parent(index, resolution) for index in indexes]
+        assert [h3.h3_to_string(index) for index in h3_parents(h3_ints, resolution).tolist()] == expected
+
+@pytest.mark.parametrize("z", [9, 12, 14, 16, 18])
+def test_tile_round_trip(source, z):
+    tile = tile_xy(z)
+    ids, resolution, display, properties = source.tile_cells(*tile)
+    for i, parent in zip(ids.tolist(), source.display_cells(resolution)[ids].tolist()):
+        index = source.graph.h3_indexes[i]
+        expected = index if h3.h3_get_resolution(index) <= resolution else h3.h3_to_parent(index, resolution)
+        assert h3.h3_to_string(parent) == expected
+    cells = [h3.h3_to_string(int(index)) for index in display]
+    layer = decode_tile(source.tile(*tile))["cells"]
+    assert layer["extent"] == 4096 and 0 < len(layer["features"]) <= len(cells)
+    row = {int(index): k for k, index in enumerate(display.tolist())}
+    coords, offsets = cell_boundaries(cells)
+    points = project(coords, *tile)
+    for feature in layer["features"]:
+        k = row[feature["id"]]
+        assert feature["type"] == 3 and len(feature["geometry"]) == 1
+        ring = feature["geometry"][0]
+        # 外环在y轴向下的瓦片坐标中面积为正，顶点都是cell边界投影后的点(重合点已去掉)
+        area = sum(ax * by - bx * ay for (ax, ay), (bx, by) in zip(ring, ring[1:] + ring[:1]))
+        assert len(ring) >= 3 and area > 0
+        assert set(ring) <= {tuple(point) for point in points[offsets[k]:offsets[k + 1]].tolist()}
+        for name, column in properties.items():
+            value = column[k].item()
+            if value != value:
+                assert name not in feature["properties"]    # NaN(无值)不写入标签
+            else:
+                assert feature["properties"][name] == value
+
+def test_encode_tile_values():
+    cells = [h3.geo_to_h3(LAT, LON, 9)]
+    properties = {"name": np.array(["a"]), "count": np.array([-3]), "value": np.array([1.5]), "none": np.array([np.nan])}
+    feature = decode_tile(encode_tile("layer", cells, properties, *tile_xy(14)))["layer"]["features"][0]
+    assert feature["id"] == h3.string_to_h3(cells[0])
+    assert feature["properties"] == {"name": "a", "count": -3, "value": 1.5}
+
+def test_mmap_graph_keeps_integer_indexes(make_map, tmp_path):
+    CompiledMap.compile(make_map()).save(str(tmp_path))
+    graph = CompiledMap.load(str(tmp_path), mmap=True)
+    source = TileSource(graph, ["elevation"])
+    assert source.tile(*tile_xy(14))
+    assert "h3_indexes" not in graph.__dict__ and "h3_indexes" not in source.region.__dict__
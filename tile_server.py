@@ -0,0 +1,494 @@
+import os
+import re
+import json
+import math
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+import h3
+import numpy as np
+from compiled_map import CompiledMap
+from map_export import cell_boundaries
+from region import RegionIndex, H3_RES_OFFSET, h3_parents
+
+EXTENT = 4096           # 瓦片内坐标范围
+MIN_CELL_PIXELS = 4     # 显示cell的边长至少占多少像素，更小时聚合到父cell
+
+def _varints(values):
+    """
+    向量化的protobuf varint编码
+    :param values: 非负整数数组
+    :return: (uint8缓冲区, 每个值的字节数)
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    shifts = np.arange(10, dtype=np.uint64) * np.uint64(7)
+    groups = (values[:, None] >> shifts) & np.uint64(0x7F)
+    sizes = np.maximum(1, 10 - np.argmax(((values[:, None] >> shifts) != 0)[:, ::-1], axis=1)).astype(np.int64)
+    sizes[values == 0] = 1
+    used = np.arange(10) < sizes[:, None]
+    more = np.arange(10) < sizes[:, None] - 1
+    encoded = (groups | (more.astype(np.uint64) << np.uint64(7))).astype(np.uint8)
+    return encoded[used], sizes
+
+def _varint(value):
+    if value < 0x80:
+        return bytes((value,))
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def _field(number, payload):
+    """长度分隔字段"""
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+def _zigzag(values):
+    values = np.asarray(values, dtype=np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+def tile_bounds(z, x, y):
+    """
+    Web墨卡托瓦片的经纬度范围
+    :return: (south, west, north, east)
+    """
+    n = 2 ** z
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return south, west, north, east
+
+def project(coords, z, x, y):
+    """
+    经纬度 (lon, lat) 投影为瓦片坐标，y轴向下
+    :return: M×2 int64数组
+    """
+    n = 2 ** z
+    lon, lat = coords[:, 0], np.radians(coords[:, 1])
+    px = ((lon + 180.0) / 360.0 * n - x) * EXTENT
+    py = ((1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0 * n - y) * EXTENT
+    return np.stack([np.rint(px), np.rint(py)], axis=1).astype(np.int64)
+
+def _split(buffer, sizes, rows, count):
+    """
+    按行切分varint缓冲区
+    :param sizes: 每个值的字节数
+    :param rows: 每个值所属的行
+    :param count: 行数
+    :return: bytes列表
+    """
+    data = buffer.tobytes()
+    ends = np.cumsum(np.bincount(rows, weights=sizes, minlength=count).astype(np.int64)).tolist()
+    return [data[start:end] for start, end in zip([0] + ends[:-1], ends)]
+
+def _ring_commands(ring):
+    """
+    单个环的几何命令：MoveTo、LineTo(n-1)、ClosePath，坐标为相对上一点的zigzag增量
+    :param ring: n×2 瓦片坐标(不含闭合点)，相邻点不重复
+    """
+    deltas = np.diff(np.vstack([[0, 0], ring]), axis=0)
+    return np.concatenate([[1 | 1 << 3], _zigzag(deltas[:1]).ravel(),
+                           [2 | (len(ring) - 1) << 3], _zigzag(deltas[1:]).ravel(), [7 | 1 << 3]]).astype(np.uint64)
+
+def encode_tile(name, cells, properties, z, x, y):
+    """
+    编码为Mapbox Vector Tile
+    几何命令与属性标签整块向量化编码，逐要素只做字节拼接
+    :param name: 图层名
+    :param cells: h3索引列表
+    :param properties: 属性名 -> 与cells等长的数组，浮点NaN表示无值
+    :return: bytes，没有要素时为空
+    """
+    coords, offsets = cell_boundaries(cells)
+    points = project(coords, z, x, y)
+    counts = np.diff(offsets) - 1   # 去掉闭合点
+    n_cells = len(cells)
+
+    # 几何：同点数且投影后相邻点不重合的环一次编码，其余(缩小到像素级的cell)逐个处理
+    geometries = [None] * n_cells
+    for n in np.unique(counts).tolist():
+        positions = np.flatnonzero(counts == n)
+        rings = points[offsets[positions][:, None] + np.arange(n)]
+        # MVT外环在y轴向下的瓦片坐标中按测量员公式面积为正(顺时针)，面积为负的环反转
+        area = (rings[:, :, 0] * np.roll(rings[:, :, 1], -1, axis=1) -
+                np.roll(rings[:, :, 0], -1, axis=1) * rings[:, :, 1]).sum(axis=1)
+        rings[area < 0] = rings[area < 0, ::-1]
+        degenerate = (np.all(rings == np.roll(rings, 1, axis=1), axis=2)).any(axis=1)
+        regular = positions[~degenerate]
+        if len(regular):
+            ring = rings[~degenerate]
+            deltas = np.diff(np.concatenate([np.zeros((len(regular), 1, 2), np.int64), ring], axis=1), axis=1)
+            commands = np.concatenate([
+                np.full((len(regular), 1), 1 | 1 << 3, np.uint64),
+                _zigzag(deltas[:, 0]),
+                np.full((len(regular), 1), 2 | (n - 1) << 3, np.uint64),
+                _zigzag(deltas[:, 1:]).reshape(len(regular), -1),
+                np.full((len(regular), 1), 7 | 1 << 3, np.uint64)], axis=1)
+            buffer, sizes = _varints(commands.ravel())
+            rows = np.repeat(np.arange(len(regular)), commands.shape[1])
+            for i, encoded in zip(regular.tolist(), _split(buffer, sizes, rows, len(regular))):
+                geometries[i] = encoded
+        for i, ring in zip(positions[degenerate].tolist(), rings[degenerate]):
+            ring = ring[np.r_[True, np.any(ring[1:] != ring[:-1], axis=1)]]
+            if len(ring) > 1 and (ring[-1] == ring[0]).all():
+                ring = ring[:-1]
+            if len(ring) >= 3:
+                geometries[i] = _varints(_ring_commands(ring))[0].tobytes()
+
+    # 属性：每个属性层的值表用np.unique去重，标签为 (键序号, 值序号) 对
+    keys = list(properties)
+    values = []
+    tag_columns, tag_masks = [], []
+    for k, key in enumerate(keys):
+        column = np.asarray(properties[key])
+        valid = ~np.isnan(column) if column.dtype.kind == "f" else np.ones(n_cells, dtype=bool)
+        unique, inverse = np.unique(column[valid], return_inverse=True)
+        ids = np.zeros(n_cells, dtype=np.int64)
+        ids[valid] = inverse + len(values)
+        values.extend(unique.tolist())
+        tag_columns += [np.full(n_cells, k), ids]
+        tag_masks += [valid, valid]
+    if keys:
+        tags = np.stack(tag_columns, axis=1)
+        mask = np.stack(tag_masks, axis=1)
+        buffer, sizes = _varints(tags[mask])
+        tag_bytes = _split(buffer, sizes, np.nonzero(mask)[0], n_cells)
+    else:
+        tag_bytes = [b""] * n_cells
+
+    buffer, sizes = _varints(np.array([int(h3_index, 16) for h3_index in cells], dtype=np.uint64))
+    ids = _split(buffer, sizes, np.arange(n_cells), n_cells)
+    features = []
+    for i in range(n_cells):
+        if geometries[i] is None:
+            continue
+        features.append(b"\x08" + ids[i] + _field(2, tag_bytes[i]) + b"\x18\x03" + _field(4, geometries[i]))
+    if not features:
+        return b""
+    layer = _varint(15 << 3) + _varint(2) + _field(1, name.encode("utf-8"))
+    layer += b"".join(_field(2, feature) for feature in features)
+    layer += b"".join(_field(3, key.encode("utf-8")) for key in keys)
+    for value in values:
+        if isinstance(value, str):
+            encoded = _field(1, value.encode("utf-8"))
+        elif isinstance(value, float):
+            encoded = b"\x19" + np.float64(value).tobytes()
+        else:
+            encoded = b"\x30" + _varint(int(_zigzag([value])[0]))
+        layer += _field(4, encoded)
+    layer += _varint(5 << 3) + _varint(EXTENT)
+    return _field(3, layer)
+
+class TileCache:
+    """
+    瓦片磁盘缓存
+    按访问顺序LRU淘汰，总大小不超过预算；访问时更新文件修改时间，重启后按修改时间恢复访问顺序
+    """
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        """
+        :param directory: 缓存目录
+        :param max_bytes: 磁盘预算(字节)
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()    # 相对路径 -> 字节数，末尾为最近使用
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        found = []
+        for root, _, names in os.walk(directory):
+            for name in names:
+                if name.endswith(".mvt"):
+                    stat = os.stat(os.path.join(root, name))
+                    found.append((stat.st_mtime, os.path.relpath(os.path.join(root, name), directory), stat.st_size))
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.nbytes += size
+
+    def get(self, key):
+        """
+        :param key: 相对路径
+        :return: 瓦片内容，未命中时返回None
+        """
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        path = os.path.join(self.directory, key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.nbytes -= self.entries.pop(key)
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """
+        写入缓存，超出预算时删除最久未使用的瓦片
+        """
+        path = os.path.join(self.directory, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", 'wb') as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+        self.nbytes += len(data) - self.entries.pop(key, 0)
+        self.entries[key] = len(data)
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            evicted, size = self.entries.popitem(last=False)
+            self.nbytes -= size
+            try:
+                os.remove(os.path.join(self.directory, evicted))
+            except FileNotFoundError:
+                pass
+
+class TileSource:
+    """
+    由CompiledMap按需生成瓦片
+    按缩放级别选择显示分辨率，比显示分辨率细的cell聚合到父cell：
+    浮点层取均值，地表覆盖层按位或，其余整数层取众数
+    """
+    def __init__(self, graph, layers=None):
+        """
+        :param graph: CompiledMap对象
+        :param layers: 写入瓦片的属性层，None表示全部
+        """
+        self.graph = graph
+        self.layers = list(graph.layers) if layers is None else list(layers)
+        self.region = RegionIndex.for_graph(graph)
+        self.h3_ints = self.region.h3_ints     # 内存映射打开的地图直接使用共享的整数索引数组
+        self.resolutions = (self.h3_ints >> np.uint64(H3_RES_OFFSET)) & np.uint64(0xF)
+        self.finest = max(self.region.resolutions, default=0)
+        self.center_lat = float(np.mean(graph.centers[:, 0])) if len(graph) else 0.0
+        self._parents = {}      # 显示分辨率 -> 每个节点对应的显示cell
+
+    def display_resolution(self, z):
+        """
+        缩放级别对应的显示分辨率：cell边长不小于MIN_CELL_PIXELS个像素的最细分辨率
+        """
+        meters_per_pixel = 156543.03392 * math.cos(math.radians(self.center_lat)) / 2 ** z
+        for resolution in range(self.finest, -1, -1):
+            if h3.edge_length(resolution, unit='m') >= MIN_CELL_PIXELS * meters_per_pixel:
+                return resolution
+        return 0
+
+    def display_cells(self, resolution):
+        if resolution not in self._parents:
+            coarser = self.resolutions > np.uint64(resolution)
+            parents = self.h3_ints.copy()
+            parents[coarser] = h3_parents(self.h3_ints[coarser], resolution)
+            self._parents[resolution] = parents
+        return self._parents[resolution]
+
+    def aggregate(self, name, values, inverse, groups):
+        values = np.asarray(values)
+        if values.dtype.kind == "f":
+            valid = ~np.isnan(values)
+            sums = np.bincount(inverse, weights=np.where(valid, values, 0.0), minlength=groups)
+            counts = np.bincount(inverse, weights=valid, minlength=groups)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+        values = values.astype(np.int64)
+        if name == "landcover":
+            result = np.zeros(groups, dtype=np.int64)
+            np.bitwise_or.at(result, inverse, values)
+            return result
+        low = values.min()
+        span = int(values.max() - low) + 1
+        if span > 1024:
+            result = np.full(groups, low, dtype=np.int64)
+            np.maximum.at(result, inverse, values)
+            return result
+        counts = np.bincount(inverse * span + (values - low), minlength=groups * span).reshape(groups, span)
+        return counts.argmax(axis=1) + low
+
+    def tile_cells(self, z, x, y):
+        """
+        瓦片内的显示cell及其聚合后的属性
+        :return: (节点编号数组, 显示分辨率, 显示cell的uint64 h3索引数组, 属性名 -> 数组)，瓦片内没有cell时为None
+        """
+        resolution = self.display_resolution(z)
+        south, west, north, east = tile_bounds(z, x, y)
+        # 外扩一个显示cell的半径，使跨越瓦片边界的cell在两侧瓦片中都完整出现
+        margin = math.degrees(h3.edge_length(resolution, unit='km') * 2 / 6371.007180918475)
+        lon_margin = margin / max(math.cos(math.radians(max(abs(south), abs(north)))), 1e-6)
+        ids = self.region.bbox(south - margin, west - lon_margin, north + margin, east + lon_margin)
+        if len(ids) == 0:
+            return None
+        display, inverse = np.unique(self.display_cells(resolution)[ids], return_inverse=True)
+        properties = {}
+        for name in self.layers:
+            aggregated = self.aggregate(name, np.asarray(self.graph.layers[name])[ids], inverse, len(display))
+            properties[name] = aggregated
+        properties["cells"] = np.bincount(inverse, minlength=len(display))
+        return ids, resolution, display, properties
+
+    def tile(self, z, x, y):
+        """
+        生成一块瓦片
+        :return: MVT bytes，瓦片内没有cell时为空
+        """
+        content = self.tile_cells(z, x, y)
+        if content is None:
+            return b""
+        _, _, display, properties = content
+        cells = [h3.h3_to_string(int(index)) for index in display]
+        return encode_tile("cells", cells, properties, z, x, y)
+
+VIEWER = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>地图瓦片</title>
+<link href="%(maplibre)s/maplibre-gl.css" rel="stylesheet">
+<script src="%(maplibre)s/maplibre-gl.js"></script>
+<style>body{margin:0}#map{position:absolute;top:0;bottom:0;width:100%%}</style></head>
+<body><div id="map"></div><script>
+const map = new maplibregl.Map({container: "map", center: [%(lon)f, %(lat)f], zoom: 12, style: {version: 8,
+  sources: {cells: {type: "vector", tiles: [location.origin + "/tiles/{z}/{x}/{y}.mvt"], maxzoom: 18}},
+  layers: [{id: "cells", type: "fill", source: "cells", "source-layer": "cells",
+            paint: {"fill-color": ["interpolate", ["linear"], ["to-number", ["get", "%(color)s"], 0],
+                                   %(low)f, "#2c7bb6", %(high)f, "#d7191c"], "fill-opacity": 0.6}}]}});
+map.on("click", "cells", e => new maplibregl.Popup().setLngLat(e.lngLat)
+  .setHTML("<pre>" + JSON.stringify(e.features[0].properties, null, 1) + "</pre>").addTo(map));
+</script></body></html>"""
+MAPLIBRE_CDN = "https://unpkg.com/maplibre-gl@4/dist"
+STATIC_FILES = {"maplibre-gl.js": "application/javascript", "maplibre-gl.css": "text/css"}
+
+class TileServer:
+    """
+    本地矢量瓦片服务，用于浏览量化后的地图
+    GET /tiles/{z}/{x}/{y}.mvt 返回Mapbox Vector Tile，图层名为cells；GET / 返回简易浏览页面
+    浏览页面所用的maplibre-gl.js/.css放在static_dir中时由 GET /static/ 提供，否则从unpkg.com加载，需要能访问外网
+    瓦片按需生成并缓存到磁盘，地图文件变化后缓存目录随之改变
+    """
+    def __init__(self, compiled_dir, cache_dir, layers=None, max_bytes=512 * 1024 * 1024, color="elevation",
+                 static_dir=None):
+        """
+        :param compiled_dir: CompiledMap.save保存的目录
+        :param cache_dir: 瓦片缓存目录
+        :param layers: 写入瓦片的属性层，None表示全部
+        :param max_bytes: 磁盘缓存预算(字节)
+        :param color: 浏览页面着色所用的属性层
+        :param static_dir: 存放maplibre-gl.js与maplibre-gl.css的目录，None或文件不全时从unpkg.com加载
+        """
+        graph = CompiledMap.load(compiled_dir, mmap=True)
+        self.source = TileSource(graph, layers)
+        meta_mtime = os.stat(os.path.join(compiled_dir, "meta.bin")).st_mtime_ns
+        namespace = hashlib.sha1(repr((os.path.abspath(compiled_dir), meta_mtime, self.source.layers)).encode())
+        self.namespace = namespace.hexdigest()[:16]
+        self.cache = TileCache(cache_dir, max_bytes)
+        self.inflight = {}      # 瓦片键 -> asyncio.Future
+        self.color = color
+        self.static_dir = static_dir
+        if static_dir is not None and not all(os.path.exists(os.path.join(static_dir, name)) for name in STATIC_FILES):
+            print(f"{static_dir}中没有maplibre-gl.js/.css，浏览页面从unpkg.com加载")
+            self.static_dir = None
+
+    def viewer(self):
+        values = np.asarray(self.source.graph.layers[self.color], dtype=np.float64)
+        finite = values[np.isfinite(values)]
+        center = self.source.graph.centers.mean(axis=0)
+        return VIEWER % {"lat": center[0], "lon": center[1], "color": self.color,
+                         "maplibre": MAPLIBRE_CDN if self.static_dir is None else "/static",
+                         "low": float(finite.min()) if len(finite) else 0.0,
+                         "high": float(finite.max()) if len(finite) and finite.max() > finite.min() else 1.0}
+
+    async def tile(self, z, x, y):
+        """
+        获取瓦片，缓存未命中时在线程池中生成，相同瓦片的并发请求共用一次生成
+        """
+        key = f"{self.namespace}/{z}/{x}/{y}.mvt"
+        data = self.cache.get(key)
+        if data is not None:
+            return data
+        future = self.inflight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(None, self.source.tile, z, x, y)
+            self.inflight[key] = future
+            try:
+                data = await future
+                self.cache.put(key, data)
+            finally:
+                self.inflight.pop(key, None)
+            return data
+        return await future
+
+    async def handle(self, reader, writer):
+        """
+        处理一个HTTP连接，支持keep-alive
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                await reader.readexactly(int(headers.get("content-length", 0)))
+                started = time.perf_counter()
+                match = re.fullmatch(r"/tiles/(\d+)/(\d+)/(\d+)\.mvt", path.split("?")[0])
+                content_type = "application/json; charset=utf-8"
+                if method == "GET" and match:
+                    z, x, y = (int(v) for v in match.groups())
+                    if x >= 2 ** z or y >= 2 ** z:
+                        status, payload = 404, json.dumps({"error": "瓦片编号超出范围"}, ensure_ascii=False).encode()
+                    else:
+                        status, payload = 200, await self.tile(z, x, y)
+                        content_type = "application/vnd.mapbox-vector-tile"
+                elif method == "GET" and path == "/":
+                    status, payload = 200, self.viewer().encode("utf-8")
+                    content_type = "text/html; charset=utf-8"
+                elif method == "GET" and self.static_dir is not None and path.startswith("/static/") \
+                        and path[len("/static/"):] in STATIC_FILES:
+                    name = path[len("/static/"):]
+                    with open(os.path.join(self.static_dir, name), 'rb') as f:
+                        status, payload = 200, f.read()
+                    content_type = STATIC_FILES[name]
+                elif method == "GET" and path == "/health":
+                    status, payload = 200, json.dumps({
+                        "nodes": len(self.source.graph), "cached_tiles": len(self.cache.entries),
+                        "cache_bytes": self.cache.nbytes, "hits": self.cache.hits, "misses": self.cache.misses,
+                    }).encode()
+                else:
+                    status, payload = 404, json.dumps({"error": "未知接口"}, ensure_ascii=False).encode()
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status < 300 else 'Error'}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Access-Control-Allow-Origin: *\r\n"
+                    f"X-Elapsed-Ms: {(time.perf_counter() - started) * 1000:.1f}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8081):
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"瓦片服务已启动: http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+if __name__ == '__main__':
+    server = TileServer('output/汤山/汤山compiled', 'output/汤山/tiles',
+                        layers=["elevation", "slope", "show_attribute", "road_type", "landcover", "relief"],
+                        static_dir='output/static')
+    asyncio.run(server.serve())